@@ -0,0 +1,271 @@
+import io
+import contextlib
+import random
+import time
+
+import numpy as np
+
+import clean_trajectory_generator as ctg
+
+
+# BATCHED VERSION OF compute_trajectory -----------------------------------------------------------
+#
+# The functions in this file run the same algorithm as compute_trajectory in clean_trajectory_generator.py
+# on many cone sets at once. Every cone set is an item of the batch, and each iteration of the main loop
+# advances all the items that still have cones left with NumPy operations, so the Python overhead is paid
+# once per iteration instead of once per iteration and per item.
+#
+# Cone sets of different sizes are stored padded into arrays of shape (batch, max_cones, 2) together with
+# a boolean mask of shape (batch, max_cones) that is True for the real cones.
+
+# Maximum difference allowed between a batched trajectory point and the one given by compute_trajectory
+MATCH_TOLERANCE = 1e-9
+
+
+def pad_cone_sets(cone_sets):
+    """Stacks cone sets of different sizes into a padded array.
+
+    Args:
+        cone_sets (list): A list of cone sets, each one a list of points [x, y] or an array of shape (n, 2).
+
+    Returns:
+        tuple: The padded array of shape (batch, max_cones, 2) and the mask of shape (batch, max_cones).
+    """
+    max_cones = max(len(cones) for cones in cone_sets)
+    points = np.zeros((len(cone_sets), max_cones, 2))
+    mask = np.zeros((len(cone_sets), max_cones), dtype=bool)
+    for b, cones in enumerate(cone_sets):
+        if len(cones):
+            points[b, :len(cones)] = cones
+            mask[b, :len(cones)] = True
+    return points, mask
+
+
+def unpad_trajectories(mid_points, lengths):
+    """Splits the output of compute_trajectory_batch into one array of shape (n, 2) per item."""
+    return [mid_points[b, :lengths[b]] for b in range(len(lengths))]
+
+
+def _compact(points, mask):
+    """Moves the masked cones of each item to the front, keeping their order, and returns them with their counts."""
+    points = np.asarray(points, dtype=float)
+    if mask is None:
+        return points.copy(), np.full(points.shape[0], points.shape[1])
+    mask = np.asarray(mask, dtype=bool)
+    order = np.argsort(~mask, axis=1, kind='stable')
+    return np.take_along_axis(points, order[:, :, None], axis=1), mask.sum(axis=1)
+
+
+def _norm(p1, p2):
+    """Same expression as euclidean_norm, applied over the last axis."""
+    return ((p2[..., 0] - p1[..., 0]) ** 2 + (p2[..., 1] - p1[..., 1]) ** 2) ** 0.5
+
+
+def order_point_lists_batch(points, counts, line_slope=None, line_point=None, semiplane=None):
+    """Batched version of order_point_list_semiplane. It gives the same ordering for every item.
+
+    Args:
+        points (numpy.ndarray): Cones of shape (batch, max_cones, 2), with the counts[b] real cones of each item at the front.
+        counts (numpy.ndarray): Number of cones of each item.
+        line_slope (numpy.ndarray, optional): Slope of the dividing line of each item. float('inf') for vertical lines.
+        line_point (numpy.ndarray, optional): A point of the dividing line of each item, shape (batch, 2).
+        semiplane (int, optional): +1 to select points above the line (or to the right if the line is vertical), -1 for points below (or to the left).
+
+    Returns:
+        numpy.ndarray: The ordered cones, same shape as points.
+    """
+    batch, max_cones, _ = points.shape
+    rows = np.arange(batch)
+    valid = np.arange(max_cones)[None, :] < counts[:, None]
+
+    order = np.zeros((batch, max_cones), dtype=int)
+    n_ordered = np.minimum(counts, 1)
+    last = points[:, 0].copy()
+    remaining = valid.copy()
+    remaining[:, 0] = False
+
+    def take_closest(candidates, active):
+        dist = np.where(candidates, _norm(last[:, None, :], points), np.inf)
+        return np.argmin(dist, axis=1), active & candidates.any(axis=1)
+
+    if semiplane is not None:
+        # First choose the points inside the semiplane, checking each one once in proximity order
+        vertical = line_slope == float('inf')
+        with np.errstate(invalid='ignore'):
+            line_y = line_slope[:, None] * (points[:, :, 0] - line_point[:, 0, None]) + line_point[:, 1, None]
+        inside = np.where(vertical[:, None],
+                          line_point[:, 0, None] * semiplane < points[:, :, 0] * semiplane,
+                          line_y * semiplane < points[:, :, 1] * semiplane)
+        unchecked = remaining.copy()
+        for _ in range(max_cones - 1):
+            # The vertical line case stops looking once the second point has been found
+            i, active = take_closest(unchecked, ~vertical | (n_ordered < 2))
+            if not active.any():
+                break
+            accept = active & inside[rows, i]
+            order[rows[accept], n_ordered[accept]] = i[accept]
+            n_ordered += accept
+            last[accept] = points[rows[accept], i[accept]]
+            remaining[rows[accept], i[accept]] = False
+            unchecked[rows[active], i[active]] = False
+
+    # Then chain the remaining points by proximity
+    for _ in range(max_cones - 1):
+        i, active = take_closest(remaining, np.ones(batch, dtype=bool))
+        if not active.any():
+            break
+        order[rows[active], n_ordered[active]] = i[active]
+        n_ordered += active
+        last[active] = points[rows[active], i[active]]
+        remaining[rows[active], i[active]] = False
+
+    return np.take_along_axis(points, order[:, :, None], axis=1)
+
+
+def compute_trajectory_batch(right_points, left_points, right_mask=None, left_mask=None, semiplane=None, ordered=False):
+    """Computes the trajectory of many cone sets at once with the algorithm of compute_trajectory.
+
+    The midpoint, the perpendicular projection, the 1.5m separation from the last cone, the 180º rotation,
+    the reordering of the last 3 points and the averaging of points closer than 2m are applied to every
+    item with the same rules as compute_trajectory, so each trajectory matches the scalar one within
+    MATCH_TOLERANCE. The only difference is that the perpendicular projection is computed with vectors
+    instead of slopes.
+
+    Args:
+        right_points (numpy.ndarray or list): Right cones of shape (batch, max_right, 2), or a list of cone sets of different sizes.
+        left_points (numpy.ndarray or list): Left cones of shape (batch, max_left, 2), or a list of cone sets of different sizes.
+        right_mask (numpy.ndarray, optional): Boolean mask of shape (batch, max_right) marking the real right cones. Defaults to all of them.
+        left_mask (numpy.ndarray, optional): Boolean mask of shape (batch, max_left) marking the real left cones. Defaults to all of them.
+        semiplane (int, optional): Same as in compute_trajectory, applied to every item. Defaults to None.
+        ordered (bool, optional): If True the cones are assumed to be already ordered and the ordering step is skipped. Defaults to False.
+
+    Returns:
+        tuple: The trajectories, padded into an array of shape (batch, max_points, 2), and the number of points of each one.
+    """
+    if isinstance(right_points, list):
+        right_points, right_mask = pad_cone_sets(right_points)
+    if isinstance(left_points, list):
+        left_points, left_mask = pad_cone_sets(left_points)
+    rpoints, nr = _compact(right_points, right_mask)
+    lpoints, nl = _compact(left_points, left_mask)
+    if (nr < 1).any() or (nl < 1).any():
+        raise ValueError("Every item of the batch needs at least one right cone and one left cone")
+
+    batch = rpoints.shape[0]
+    rows = np.arange(batch)
+
+    # Order the right and left cones based on proximity and the line defined by their first points
+    if not ordered:
+        p1 = rpoints[:, 0]
+        p2 = lpoints[:, 0]
+        dx = p2[:, 0] - p1[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(np.abs(p1[:, 0] - p2[:, 0]) < 1e-14, float('inf'), (p2[:, 1] - p1[:, 1]) / dx)
+        rpoints = order_point_lists_batch(rpoints, nr, slope, p1, semiplane)
+        lpoints = order_point_lists_batch(lpoints, nl, slope, p1, semiplane)
+
+    # Every iteration adds at most one point
+    mid_points = np.zeros((batch, int((nr + nl).max()) - 1, 2))
+    mid_points[:, 0] = (rpoints[:, 0] + lpoints[:, 0]) / 2
+    n_mid = np.ones(batch, dtype=int)
+
+    last_ri = np.zeros(batch, dtype=int)
+    last_li = np.zeros(batch, dtype=int)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            right_left = last_ri < nr - 1
+            left_left = last_li < nl - 1
+            active = right_left | left_left
+            if not active.any():
+                break
+
+            # Choose the side to advance. Indexes are clipped so that finished items read valid memory
+            next_ri = np.minimum(last_ri + 1, nr - 1)
+            next_li = np.minimum(last_li + 1, nl - 1)
+            r_cur, r_next = rpoints[rows, last_ri], rpoints[rows, next_ri]
+            l_cur, l_next = lpoints[rows, last_li], lpoints[rows, next_li]
+            both = right_left & left_left
+            distr = np.where(both, _norm(r_cur, r_next) + _norm(l_cur, r_next), np.where(right_left, 0.0, np.inf))
+            distl = np.where(both, _norm(l_cur, l_next) + _norm(r_cur, l_next), np.where(right_left, np.inf, 0.0))
+            right = distr <= distl
+
+            last_ri = np.where(active & right, next_ri, last_ri)
+            last_li = np.where(active & ~right, next_li, last_li)
+            r_cur = rpoints[rows, last_ri]
+            l_cur = lpoints[rows, last_li]
+            last_cone = np.where(right[:, None], r_cur, l_cur)
+            other_last_cone = np.where(right[:, None], l_cur, r_cur)
+            anchor = np.where(right[:, None], rpoints[rows, np.maximum(last_ri - 1, 0)], lpoints[rows, np.maximum(last_li - 1, 0)])
+
+            # Intersection of the line through the last trajectory point parallel to the last segment
+            # and the perpendicular line through the last cone
+            prev = mid_points[rows, n_mid - 1]
+            direction = last_cone - anchor
+            direction = direction / np.linalg.norm(direction, axis=1, keepdims=True)
+            projection = ((last_cone - prev) * direction).sum(axis=1, keepdims=True)
+            new_point = prev + projection * direction
+
+            # Set the distance to the last cone exactly 1.5
+            vector = new_point - last_cone
+            vector = 1.5 * vector / _norm(np.zeros_like(vector), vector)[:, None]
+            new_point = last_cone + vector
+
+            # Rotate 180 respect to the last cone if the new point is on the wrong side of the track
+            v1 = last_cone - other_last_cone
+            v2 = new_point - other_last_cone
+            cross = v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0]
+            zero = np.zeros_like(v1)
+            aligned = np.abs(cross) / _norm(v1, zero) * _norm(v2, zero) <= 0.2
+            clockwise = cross < 0
+            rotate = ~aligned & np.where(right, clockwise, ~clockwise)
+            new_point = np.where(rotate[:, None], last_cone + -(new_point - last_cone), new_point)
+
+            n = n_mid[active]
+            act = rows[active]
+            mid_points[act, n] = new_point[active]
+            n = n + 1
+
+            # Order last 3 trajectory points: the first one stays, the closest of the other two goes second
+            has3 = n >= 3
+            a3, i3 = act[has3], n[has3]
+            first, second, third = mid_points[a3, i3 - 3], mid_points[a3, i3 - 2], mid_points[a3, i3 - 1]
+            swap = _norm(first, third) < _norm(first, second)
+            mid_points[a3[swap], i3[swap] - 2] = third[swap]
+            mid_points[a3[swap], i3[swap] - 1] = second[swap]
+
+            # In case 2 trajectory points are too close, remove them and take only the average point
+            last, before = mid_points[act, n - 1], mid_points[act, n - 2]
+            close = _norm(last, before) < 2
+            mid_points[act[close], n[close] - 2] = np.stack(((last[close, 0] + before[close, 0]) / 2,
+                                                             (last[close, 1] + before[close, 1]) / 2), axis=1)
+            n_mid[active] = n - close
+
+    return mid_points, n_mid
+
+
+if __name__ == "__main__":
+    # Compare the batched version with compute_trajectory on perturbed copies of a map
+    og_right_points, og_left_points = ctg.deserialize_points("map.dat")
+    random.seed(0)
+    batch_size = 200
+    right_sets, left_sets = [], []
+    for _ in range(batch_size):
+        right, left = ctg.remove_some_cones(og_right_points, og_left_points, skip_size=2)
+        right_sets.append([[x + random.gauss(0, 0.05), y + random.gauss(0, 0.05)] for x, y in right])
+        left_sets.append([[x + random.gauss(0, 0.05), y + random.gauss(0, 0.05)] for x, y in left])
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scalar = [ctg.compute_trajectory(r, l, semiplane=-1) for r, l in zip(right_sets, left_sets)]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mid_points, lengths = compute_trajectory_batch(right_sets, left_sets, semiplane=-1)
+    batch_time = time.perf_counter() - start
+
+    matches = 0
+    for expected, got in zip(scalar, unpad_trajectories(mid_points, lengths)):
+        if len(expected) == len(got) and np.allclose(expected, got, rtol=0, atol=MATCH_TOLERANCE):
+            matches += 1
+    print(f"{matches}/{batch_size} trajectories match within {MATCH_TOLERANCE}")
+    print(f"compute_trajectory: {scalar_time:.3f}s, compute_trajectory_batch: {batch_time:.3f}s")
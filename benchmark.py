@@ -0,0 +1,161 @@
+import argparse
+import contextlib
+import csv
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+import clean_trajectory_generator as ctg
+from point_gen import get_circular_track, serialize_points
+
+
+# SCALING BENCHMARK OF THE TRAJECTORY PIPELINE ------------------------------------------------------
+#
+# Builds circular tracks of increasing length with point_gen.py, times every stage of the pipeline on
+# each of them and fits the scaling exponent b of time ~ n^b for every stage. An exponent close to 1 means
+# linear scaling, while an exponent close to 2 means the stage is quadratic.
+#
+# The ordering and compute_trajectory are timed on the cones left by remove_some_cones, in track order, and
+# again after disorder_points shuffles them, which is the input the ordering is meant for.
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+CONE_SPACING = 5.0  # Distance between consecutive cones of the same side, in meters
+STAGES = ('deserialize_points', 'remove_some_cones', 'order_both_lists_of_cones', 'order_both_lists_of_cones_shuffled',
+          'compute_trajectory', 'compute_trajectory_shuffled')
+
+
+def build_track(num_cones):
+    """Returns the right and left cones of a circular track with num_cones cones per side, CONE_SPACING apart."""
+    radius = max(num_cones * CONE_SPACING / (2 * math.pi), 5.0)
+    track = get_circular_track(radius, num_cones)
+    return track['circular_r'], track['circular_l']
+
+
+def time_call(function, min_time=0.2, max_repeats=5):
+    """Calls function until min_time seconds or max_repeats calls have passed and returns the best time of a single call."""
+    best = float('inf')
+    total = 0.0
+    repeats = 0
+    while repeats < max_repeats and (repeats == 0 or total < min_time):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        repeats += 1
+    return best
+
+
+def benchmark_size(num_cones, directory, semiplane=-1, skip_size=2, seed=0):
+    """Times every stage of the pipeline on a track with num_cones cones per side.
+
+    Returns:
+        dict: The time in seconds of each stage, keyed by the stage name.
+    """
+    og_right_points, og_left_points = build_track(num_cones)
+    file_path = os.path.join(directory, f"track_{num_cones}.dat")
+    serialize_points(file_path, og_right_points, og_left_points)
+
+    random.seed(seed)
+    right_points, left_points = ctg.remove_some_cones(og_right_points, og_left_points, skip_size=skip_size)
+    # Neither the ordering nor compute_trajectory modify their input, so every call orders the shuffled cones
+    shuffled_right_points, shuffled_left_points = ctg.disorder_points(right_points, left_points)
+
+    # The ordering prints a warning whenever a line is vertical or a semiplane fails, which would be timed too
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return {
+            'deserialize_points': time_call(lambda: ctg.deserialize_points(file_path)),
+            'remove_some_cones': time_call(lambda: ctg.remove_some_cones(og_right_points, og_left_points, skip_size=skip_size)),
+            'order_both_lists_of_cones': time_call(lambda: ctg.order_both_lists_of_cones(right_points, left_points, semiplane)),
+            'order_both_lists_of_cones_shuffled': time_call(
+                lambda: ctg.order_both_lists_of_cones(shuffled_right_points, shuffled_left_points, semiplane)),
+            'compute_trajectory': time_call(lambda: ctg.compute_trajectory(right_points, left_points, semiplane)),
+            'compute_trajectory_shuffled': time_call(
+                lambda: ctg.compute_trajectory(shuffled_right_points, shuffled_left_points, semiplane)),
+        }
+
+
+def fit_scaling_exponent(sizes, times, min_size=100):
+    """Fits time = a * n^b with least squares in log-log scale and returns b.
+
+    Sizes below min_size are dominated by constant overheads, so they are left out of the fit as long as
+    at least 2 sizes remain. Returns None if there are less than 2 sizes to fit.
+    """
+    points = [(n, t) for n, t in zip(sizes, times) if t > 0]
+    large = [(n, t) for n, t in points if n >= min_size]
+    if len(large) >= 2:
+        points = large
+    if len(points) < 2:
+        return None
+
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(t) for _, t in points]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    sxx = sum((x - x_mean) ** 2 for x in xs)
+    if sxx == 0:
+        return None
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sxx
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, semiplane=-1, skip_size=2, seed=0, verbose=True):
+    """Runs the benchmark for every size.
+
+    Returns:
+        dict: 'results', a list with one dictionary per size and stage (size, stage, seconds), and 'exponents',
+        the fitted scaling exponent of each stage.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for num_cones in sizes:
+            times = benchmark_size(num_cones, directory, semiplane, skip_size, seed)
+            for stage in STAGES:
+                results.append({'size': num_cones, 'stage': stage, 'seconds': times[stage]})
+            if verbose:
+                print(f"{num_cones:>8} cones: " + ", ".join(f"{stage} {times[stage]:.4g}s" for stage in STAGES))
+
+    exponents = {}
+    for stage in STAGES:
+        stage_results = [r for r in results if r['stage'] == stage]
+        exponents[stage] = fit_scaling_exponent([r['size'] for r in stage_results], [r['seconds'] for r in stage_results])
+    return {'results': results, 'exponents': exponents}
+
+
+def write_json(path, benchmark):
+    with open(path, 'w') as f:
+        json.dump(benchmark, f, indent=2)
+
+
+def write_csv(path, benchmark):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['size', 'stage', 'seconds'])
+        writer.writeheader()
+        writer.writerows(benchmark['results'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures how each stage of the trajectory pipeline scales with the number of cones.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Number of cones per side of each track")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--skip-size', type=int, default=2, help="skip_size given to remove_some_cones")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the results and the fitted exponents to this JSON file")
+    parser.add_argument('--csv', help="Write the results to this CSV file")
+    args = parser.parse_args()
+
+    benchmark = run_benchmark(args.sizes, args.semiplane, args.skip_size, args.seed)
+    print("Scaling exponents (time ~ n^b):")
+    for stage, exponent in benchmark['exponents'].items():
+        if exponent is None:
+            print(f"  {stage}: not enough sizes")
+        else:
+            warning = "  <- superlinear" if exponent > 1.5 else ""
+            print(f"  {stage}: {exponent:.2f}{warning}")
+
+    if args.json:
+        write_json(args.json, benchmark)
+    if args.csv:
+        write_csv(args.csv, benchmark)
@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+import clean_trajectory_generator as ctg
+from benchmark import build_track, time_call
+from point_gen import get_procedural_track, random_segments
+from trajectory_algorithms import ALGORITHMS, get_algorithm
+from trajectory_metrics import compute_metrics
+
+
+# HEAD TO HEAD BENCHMARK OF THE TRAJECTORY ALGORITHMS ------------------------------------------------
+#
+# Runs every algorithm of trajectory_algorithms.py on the same corpus of generated tracks and compares them on
+# runtime, peak memory and the quality metrics of trajectory_metrics.py:
+#
+#     python benchmark_algorithms.py --variants 5 --json algorithms.json
+#
+# The corpus has circular tracks (benchmark.build_track) and procedural tracks (point_gen.random_segments),
+# and every track is planned several times with a different random subset of its cones (remove_some_cones),
+# optionally disordered. The original cones of the track are the reference for the quality metrics.
+
+DEFAULT_CIRCLE_SIZES = (20, 60)
+DEFAULT_PROCEDURAL_SEEDS = (0, 1, 2)
+PROCEDURAL_SEGMENTS = 6
+CASE_FIELDS = ('algorithm', 'track', 'variant', 'error', 'seconds', 'peak_bytes', 'points', 'path_length',
+               'min_cone_clearance', 'rms_deviation', 'finite_rms_deviation', 'nonfinite_points', 'max_deviation',
+               'outside_points', 'outside_fraction')
+
+
+def build_corpus(circle_sizes=DEFAULT_CIRCLE_SIZES, procedural_seeds=DEFAULT_PROCEDURAL_SEEDS):
+    """Returns the tracks of the corpus as a list of (name, og_right_points, og_left_points)."""
+    corpus = []
+    for num_cones in circle_sizes:
+        og_right_points, og_left_points = build_track(num_cones)
+        corpus.append((f"circle_{num_cones}", og_right_points, og_left_points))
+    for seed in procedural_seeds:
+        og_right_points, og_left_points = get_procedural_track(random_segments(PROCEDURAL_SEGMENTS, seed), seed)
+        corpus.append((f"procedural_{seed}", og_right_points.tolist(), og_left_points.tolist()))
+    return corpus
+
+
+def build_cases(corpus, variants=3, skip_size=1, disorder=False, seed=0):
+    """Returns the cone sets to plan: variants subsets of the cones of every track of the corpus.
+
+    Returns:
+        list: Dictionaries with the track name, the variant number, the original cones and the cones to plan.
+    """
+    rng_state = random.getstate()
+    random.seed(seed)
+    try:
+        cases = []
+        for name, og_right_points, og_left_points in corpus:
+            for variant in range(variants):
+                right_points, left_points = ctg.remove_some_cones(og_right_points, og_left_points, skip_size=skip_size)
+                if disorder:
+                    right_points, left_points = ctg.disorder_points(right_points, left_points)
+                cases.append({'track': name, 'variant': variant, 'og_right_points': og_right_points,
+                              'og_left_points': og_left_points, 'right_points': right_points, 'left_points': left_points})
+        return cases
+    finally:
+        random.setstate(rng_state)
+
+
+def measure(algorithm, case, semiplane=-1, repeats=3):
+    """Plans a case with an algorithm and measures it.
+
+    The time is the best of repeats calls. The peak memory is measured with tracemalloc in a separate call,
+    since tracing the allocations slows the algorithm down.
+
+    Returns:
+        dict: The fields of CASE_FIELDS. If the algorithm raised an error, only error is filled in.
+    """
+    result = dict.fromkeys(CASE_FIELDS)
+    result.update(algorithm=algorithm.name, track=case['track'], variant=case['variant'])
+    right_points, left_points = case['right_points'], case['left_points']
+    plan = lambda: algorithm.plan(right_points, left_points, semiplane, quiet=False)
+    try:
+        tracemalloc.start()
+        mid_points = plan()
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    finally:
+        tracemalloc.stop()
+    result['seconds'] = time_call(plan, min_time=0, max_repeats=repeats)
+
+    metrics = compute_metrics(mid_points, case['og_right_points'], case['og_left_points'])
+    for key in ('points', 'path_length', 'min_cone_clearance', 'rms_deviation', 'finite_rms_deviation', 'nonfinite_points',
+                'max_deviation', 'outside_points', 'outside_fraction'):
+        result[key] = metrics[key]
+    return result
+
+
+def run_benchmark(algorithms, cases, semiplane=-1, repeats=3):
+    """Measures every algorithm on every case. The prints of the algorithms are discarded.
+
+    Returns:
+        list: The result of every algorithm and case (see measure).
+    """
+    results = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for algorithm in algorithms:
+            for case in cases:
+                results.append(measure(algorithm, case, semiplane, repeats))
+    return results
+
+
+def summarize(results):
+    """Aggregates the results of each algorithm.
+
+    Returns:
+        dict: For every algorithm, the number of cases, errors and cases with points outside of the track, the
+        median and mean time in ms, the mean and max peak memory in KiB and the quality metrics of the cases
+        without errors. NaN trajectory points would make the RMS deviation infinite, so the median RMS deviation
+        over the cases is computed over the finite points of each trajectory, and the NaN points of all the
+        cases are counted in nonfinite_points.
+    """
+    summary = {}
+    for name in dict.fromkeys(r['algorithm'] for r in results):
+        rows = [r for r in results if r['algorithm'] == name]
+        ok = [r for r in rows if r['error'] is None]
+        mean = lambda key: statistics.fmean(r[key] for r in ok) if ok else float('nan')
+        # Trajectories that are all NaN have no finite RMS deviation
+        finite_rms = [r['finite_rms_deviation'] for r in ok if r['finite_rms_deviation'] == r['finite_rms_deviation']]
+        summary[name] = {
+            'cases': len(rows),
+            'errors': len(rows) - len(ok),
+            'off_track_cases': sum(1 for r in ok if r['outside_points']),
+            'median_ms': statistics.median(r['seconds'] for r in ok) * 1e3 if ok else float('nan'),
+            'mean_ms': mean('seconds') * 1e3,
+            'mean_peak_kib': mean('peak_bytes') / 1024,
+            'max_peak_kib': max(r['peak_bytes'] for r in ok) / 1024 if ok else float('nan'),
+            'median_rms_deviation': statistics.median(finite_rms) if finite_rms else float('nan'),
+            'nonfinite_points': sum(r['nonfinite_points'] for r in ok),
+            'mean_outside_fraction': mean('outside_fraction'),
+            'min_cone_clearance': min(r['min_cone_clearance'] for r in ok) if ok else float('nan'),
+        }
+    return summary
+
+
+def print_summary(summary):
+    columns = ('cases', 'errors', 'off_track_cases', 'median_ms', 'mean_peak_kib', 'median_rms_deviation',
+               'nonfinite_points', 'mean_outside_fraction', 'min_cone_clearance')
+    width = max(len(name) for name in summary) + 2
+    print("algorithm".ljust(width) + "".join(f"{column:>22}" for column in columns))
+    for name, row in summary.items():
+        cells = (f"{row[c]:>22}" if isinstance(row[c], int) else f"{row[c]:>22.4g}" for c in columns)
+        print(name.ljust(width) + "".join(cells))
+
+
+def write_csv(path, results):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CASE_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the trajectory algorithms on runtime, memory and quality over a generated corpus.")
+    parser.add_argument('--algorithms', nargs='+', default=list(ALGORITHMS), help="Algorithms to compare. Defaults to all of them")
+    parser.add_argument('--circle-sizes', type=int, nargs='+', default=list(DEFAULT_CIRCLE_SIZES), help="Cones per side of the circular tracks")
+    parser.add_argument('--procedural-seeds', type=int, nargs='+', default=list(DEFAULT_PROCEDURAL_SEEDS), help="Seeds of the procedural tracks")
+    parser.add_argument('--variants', type=int, default=3, help="Random subsets of the cones planned for every track")
+    parser.add_argument('--skip-size', type=int, default=1, help="skip_size given to remove_some_cones")
+    parser.add_argument('--disorder', action='store_true', help="Disorder the cones of every subset (the 'draft' algorithm expects them ordered)")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--repeats', type=int, default=3, help="Timed calls per case, the best one is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the summary and the result of every case to this JSON file")
+    parser.add_argument('--csv', help="Write the result of every case to this CSV file")
+    args = parser.parse_args()
+
+    try:
+        algorithms = [get_algorithm(name) for name in args.algorithms]
+    except ValueError as e:
+        raise SystemExit(str(e))
+    cases = build_cases(build_corpus(args.circle_sizes, args.procedural_seeds), args.variants, args.skip_size, args.disorder, args.seed)
+
+    start = time.perf_counter()
+    results = run_benchmark(algorithms, cases, args.semiplane, args.repeats)
+    summary = summarize(results)
+    print(f"{len(algorithms)} algorithms on {len(cases)} cases in {time.perf_counter() - start:.1f}s")
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'cases': results}, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, results)
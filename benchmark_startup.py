@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# STARTUP TIME GUARD --------------------------------------------------------------------------------
+#
+# The planning and generation modules are imported by short lived processes (the plan_maps.py workers, every
+# CLI call, the service), so their import time is paid again and again. They used to import matplotlib.pyplot
+# at the top, which took around half a second, far more than planning a map. The plotting now lives in
+# visualization.py and numpy is only imported by the functions that use it.
+#
+# This script imports each headless module in a fresh interpreter, keeps the best time of several runs and
+# fails (exit status 1) if a module takes longer than its budget or pulls in a heavy module, so a new top level
+# import of matplotlib or numpy is caught:
+#
+#     python benchmark_startup.py --repeats 5
+
+DEFAULT_BUDGET_MS = 100.0  # Generous for a slow CI machine, the modules import in a few tens of ms at most
+HEAVY_MODULES = ('matplotlib', 'numpy')
+HEADLESS_MODULES = ('clean_trajectory_generator', 'draft_trajectory_generator', 'point_gen', 'map_format',
+                    'spatial_index', 'streaming_planner', 'lap_planner', 'trajectory_cache', 'tracing',
+                    'trajectory_algorithms', 'frame_recorder', 'horizon_planner', 'plan_maps',
+                    'planning_service')
+
+# Run in the child interpreter: the import time and the heavy modules that were imported, as JSON
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeats=3):
+    """Imports a module in fresh interpreters and returns the best import time and the heavy modules it imported.
+
+    Returns:
+        tuple: The best import time in seconds and the list of HEAVY_MODULES found in sys.modules after the import.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = float('inf')
+    heavy = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', _CHILD.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=directory, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        best = min(best, result['seconds'])
+        heavy = result['heavy']
+    return best, heavy
+
+
+def check_startup(modules=HEADLESS_MODULES, budget_ms=DEFAULT_BUDGET_MS, repeats=3):
+    """Measures the import of every module and checks it against the budget.
+
+    Returns:
+        list: Dictionaries with the module, its import time in ms, the heavy modules it imported and if it passed.
+    """
+    results = []
+    for module in modules:
+        seconds, heavy = measure_import(module, repeats)
+        results.append({'module': module, 'ms': seconds * 1e3, 'heavy': heavy,
+                        'ok': seconds * 1e3 <= budget_ms and not heavy})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that the headless modules import quickly and without matplotlib nor numpy.")
+    parser.add_argument('modules', nargs='*', default=list(HEADLESS_MODULES), help="Modules to check. Defaults to all the headless ones")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help="Maximum import time of each module")
+    parser.add_argument('--repeats', type=int, default=3, help="Fresh interpreters per module, the best time is kept")
+    args = parser.parse_args()
+
+    results = check_startup(args.modules, args.budget_ms, args.repeats)
+    width = max(len(r['module']) for r in results) + 2
+    for r in results:
+        heavy = f"  imports {', '.join(r['heavy'])}" if r['heavy'] else ""
+        print(f"{r['module'].ljust(width)}{r['ms']:8.1f} ms  {'ok' if r['ok'] else 'FAIL'}{heavy}")
+    failed = [r['module'] for r in results if not r['ok']]
+    if failed:
+        print(f"{len(failed)} modules over the {args.budget_ms:g} ms budget or importing {' / '.join(HEAVY_MODULES)}: {', '.join(failed)}")
+        raise SystemExit(1)
@@ -1,6 +1,12 @@
+import argparse
+import contextlib
 import os
-import matplotlib.pyplot as plt
 import random
+from time import perf_counter
+
+import tracing
+from spatial_index import ConeHashGrid
+from map_format import RIGHT_SECTION, is_binary_map, iter_point_chunks, load_binary_map
 
 # UTILITY FUNCTIONS FOR THE TRAJECTORY COMPUTATION -----------------------------------------------
 def compute_slope(p1, p2):
@@ -137,11 +143,12 @@ def find_intersection(slope1, point1, slope2, point2):
     x1, y1 = point1
     x2, y2 = point2
 
-    # Handle cases with infinite or -0.0 slopes
-    if slope1 == float('inf') or slope1 == -0.0:
+    # Handle cases with infinite slopes (vertical lines). Horizontal lines (0.0 or -0.0 slopes) are handled by the
+    # general case, they must not be treated as vertical because 0.0 == -0.0
+    if slope1 == float('inf'):
         x = x1
         y = slope2 * (x - x2) + y2
-    elif slope2 == float('inf') or slope2 == -0.0:
+    elif slope2 == float('inf'):
         x = x2
         y = slope1 * (x - x1) + y1
     # Check if the slopes are the same (parallel lines)
@@ -157,11 +164,32 @@ def find_intersection(slope1, point1, slope2, point2):
     return [x, y]
 
 
-def order_point_list(list):
+# Lists with fewer points than this are ordered with a linear scan instead of a spatial index
+LINEAR_SCAN_POINTS = 16
+
+
+def _chain_closest_points(ordered_list, points, index):
+    """Appends to ordered_list the points still alive in the index, always taking the closest one to the last ordered point.
+
+    Args:
+        ordered_list: The list of already ordered points. It is modified in place.
+        points: The list of points the index was built from.
+        index: A spatial index over points (ConeHashGrid or ConeKDTree). The chained points are removed from it.
+    """
+    while len(index):
+        i = index.nearest(ordered_list[-1])
+        ordered_list.append(points[i])
+        index.remove(i)
+
+
+def order_point_list(list, index_type = ConeHashGrid):
     """Orders a list of points based on proximity to the last ordered point. It takes the first point in the list as a starting point.
 
+    The closest remaining point is found with a spatial index, so ordering n points costs about O(n) instead of O(n²).
+
     Args:
         list: A list of points.
+        index_type: The spatial index class from spatial_index.py used to find the closest points. Defaults to ConeHashGrid.
 
     Returns:
         A new list with the points ordered based on proximity.
@@ -169,23 +197,32 @@ def order_point_list(list):
     # Assume the first point is still the first point
     ordered_list = [list[0]] #Assume the first point is ordered correctly
     remaining_points = list[1:]
-    while remaining_points:
-        closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
-        ordered_list.append(closest_point)
-        remaining_points.remove(closest_point)
+    if len(remaining_points) < LINEAR_SCAN_POINTS:
+        # Building an index costs more than a few linear scans, like the reordering of the last 3 trajectory points
+        remaining_points = [point for point in remaining_points]
+        while remaining_points:
+            closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
+            ordered_list.append(closest_point)
+            remaining_points.remove(closest_point)
+        return ordered_list
+    _chain_closest_points(ordered_list, remaining_points, index_type(remaining_points))
 
     return ordered_list
 
 
-def order_point_list_semiplane(list, line_func = None, semiplane = None):
+def order_point_list_semiplane(list, line_func = None, semiplane = None, stats = None, index_type = ConeHashGrid):
     """Orders a list of points based on proximity to the last ordered point,
     considering a dividing line and a desired semiplane to choose the second point in the list.
 
+    The closest remaining point is found with a spatial index, so ordering n points costs about O(n) instead of O(n²).
+
     Args:
         list: A list of points.
         line_func: A function that defines the dividing line. Can be a callable
                    or a constant for vertical lines.
         semiplane: +1 to select points above the line, -1 for points below.
+        stats: Optional PlannerStats (see instrumentation.py) that counts the failures to order in the given direction.
+        index_type: Same as in order_point_list.
 
     Returns:
         A new list with the points ordered based on proximity and semiplane.
@@ -194,49 +231,40 @@ def order_point_list_semiplane(list, line_func = None, semiplane = None):
     ordered_list = [list[0]] #Assume the first point is ordered correctly
     remaining_points = list[1:]
     if semiplane is None:
-        while remaining_points:
-            closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
-            ordered_list.append(closest_point)
-            remaining_points.remove(closest_point)
+        _chain_closest_points(ordered_list, remaining_points, index_type(remaining_points))
+        return ordered_list
 
-    elif callable(line_func):
-        remaining_points_copy = remaining_points.copy()
-        while remaining_points_copy:
-            closest_point = min(remaining_points_copy, key=lambda point: euclidean_norm(ordered_list[-1], point))
-            if line_func(closest_point[0]) * semiplane < closest_point[1] * semiplane:
-                ordered_list.append(closest_point) 
-                remaining_points.remove(closest_point)
-            remaining_points_copy.remove(closest_point)
-        
-        if len(ordered_list)<2:
-            print("Failed to order the points in the given direction. Try changing the chosen semiplane")
-        
-        while remaining_points:
-            closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
-            ordered_list.append(closest_point)
-            remaining_points.remove(closest_point)
-    
+    # A point outside of the semiplane is skipped whenever it is the closest one, so the points inside of it are
+    # chained on their own first and the points outside of it are chained at the end.
+    if callable(line_func):
+        inside = [line_func(p[0]) * semiplane < p[1] * semiplane for p in remaining_points]
     else:
         # Case of vertical line
-        remaining_points_copy = remaining_points.copy()
-        while remaining_points_copy and len(ordered_list)<2:
-            closest_point = min(remaining_points_copy, key=lambda point: euclidean_norm(ordered_list[-1], point))
-            if line_func * semiplane < closest_point[0] * semiplane:
-                ordered_list.append(closest_point) 
-                remaining_points.remove(closest_point)
-            remaining_points_copy.remove(closest_point)
-
-        if len(ordered_list)<2:
-            print("Failed to order the points in the given direction. Try changing the chosen semiplane")
-        
-        while remaining_points:
-            closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
-            ordered_list.append(closest_point)
-            remaining_points.remove(closest_point)
-    
+        inside = [line_func * semiplane < p[0] * semiplane for p in remaining_points]
+    inside_points = [p for p, is_inside in zip(remaining_points, inside) if is_inside]
+    if callable(line_func):
+        _chain_closest_points(ordered_list, inside_points, index_type(inside_points))
+        remaining_points = [p for p, is_inside in zip(remaining_points, inside) if not is_inside]
+    elif inside_points:
+        # Only the second point is chosen from the semiplane
+        i = index_type(inside_points).nearest(ordered_list[-1])
+        ordered_list.append(inside_points[i])
+        j = [k for k, is_inside in enumerate(inside) if is_inside][i]
+        remaining_points = remaining_points[:j] + remaining_points[j + 1:]
+    remaining = index_type(remaining_points)
+
+    if len(ordered_list)<2:
+        print("Failed to order the points in the given direction. Try changing the chosen semiplane")
+        if tracing.level <= tracing.WARNING:
+            tracing.emit(tracing.WARNING, 'semiplane_failure', semiplane=semiplane, first_point=ordered_list[0])
+        if stats is not None:
+            stats.count('semiplane_failures')
+
+    _chain_closest_points(ordered_list, remaining_points, remaining)
+
     return ordered_list
 
-def order_both_lists_of_cones(rpoints, lpoints, semiplane = None):
+def order_both_lists_of_cones(rpoints, lpoints, semiplane = None, stats = None, index_type = ConeHashGrid):
     """Orders two lists of points (presumably right and left cones) based on 
     proximity and a dividing line defined by the first points of each list.
 
@@ -244,6 +272,8 @@ def order_both_lists_of_cones(rpoints, lpoints, semiplane = None):
         rpoints: The list of points for the right cones.
         lpoints: The list of points for the left cones.
         semiplane: +1 to select points above the line (or to the right if the line is vertical), -1 for points below (or to the left).
+        stats: Optional PlannerStats (see instrumentation.py) that counts the failures to order in the given direction.
+        index_type: Same as in order_point_list.
 
     Returns:
         A list containing the two ordered lists of points.
@@ -255,13 +285,13 @@ def order_both_lists_of_cones(rpoints, lpoints, semiplane = None):
 
     line = get_line_function(slope, p1)
 
-    rpoints = order_point_list_semiplane(rpoints, line, semiplane)
-    lpoints = order_point_list_semiplane(lpoints, line, semiplane)
+    rpoints = order_point_list_semiplane(rpoints, line, semiplane, stats, index_type)
+    lpoints = order_point_list_semiplane(lpoints, line, semiplane, stats, index_type)
 
     return [rpoints, lpoints]
 
 
-def compute_trajectory(right_points, left_points, semiplane = None):
+def compute_trajectory(right_points, left_points, semiplane = None, observer = None, stats = None, index_type = ConeHashGrid):
     """Computes the trajectory of the car by iteratively finding the midpoint between the next right and left cones.
 
     This function calculates the car's trajectory based on the positions of right and left cones. It iteratively identifies the next right or left cones and computes the midpoint between them. This midpoint serves as the next point in the trajectory. The algorithm considers the distances between cones to determine which cone to select next, ensuring a smooth and accurate trajectory.
@@ -269,9 +299,14 @@ def compute_trajectory(right_points, left_points, semiplane = None):
     The function also handles cases where one side (right or left) has more cones than the other. In such scenarios, it continues to follow the remaining cones until all cones have been considered.
 
     Args:
-        right_points (list): A list of coordinates representing the right cones.
-        left_points (list): A list of coordinates representing the left cones.
+        right_points (list): A list of coordinates representing the right cones. A PointArray (see point_containers.py) also works.
+        left_points (list): A list of coordinates representing the left cones. A PointArray also works.
         semiplane (int, optional): An optional parameter indicating the desired side of the track (+1 for above or right, -1 for below or left). Defaults to None.
+        observer (callable, optional): Called at the end of every iteration with a dictionary describing the step (see visualization.StepPlotter for the keys).
+            Nothing is plotted or built for the observer when it is None, so the computation runs headless. Defaults to None.
+        stats (PlannerStats, optional): Records the time spent in each stage and counts the rotations, merges and semiplane ordering failures
+            of the call (see instrumentation.py). Defaults to None.
+        index_type (type, optional): The spatial index class from spatial_index.py used to order the cones. Defaults to ConeHashGrid.
 
     Returns:
         list: A list of coordinates representing the computed trajectory.
@@ -300,21 +335,50 @@ def compute_trajectory(right_points, left_points, semiplane = None):
             
             - There are 2 hyperparameters that depend on the expected separation of the cones and the size of the vehicle, which are the thresholds of stepts g and j
     """
+    if stats is not None:
+        stats.start_call()
+        t = perf_counter()
+
     # Assert the points are correctly ordered
-    rpoints, lpoints = order_both_lists_of_cones(right_points, left_points, semiplane)
+    rpoints, lpoints = order_both_lists_of_cones(right_points, left_points, semiplane, stats, index_type)
+
+    if stats is not None:
+        stats.lap('ordering', t)
 
     # Add first trajectory point
     start_point = compute_midpoint(rpoints[0], lpoints[0])
     mid_points = [start_point]
 
-    # Auxiliary variables
-    last_ri = 0
-    last_li = 0
     # Main loop
+    extend_trajectory(rpoints, lpoints, mid_points, observer=observer, stats=stats)
+
+    return mid_points
+
+
+def extend_trajectory(rpoints, lpoints, mid_points, last_ri = 0, last_li = 0, observer = None, drain = True, stats = None):
+    """Runs the main loop of compute_trajectory (step 3 of its algorithm) from the given cones, extending mid_points in place.
+
+    It allows continuing a trajectory that was computed with fewer cones, as long as the new cones were appended to the end of the ordered lists.
+
+    Args:
+        rpoints (list): The ordered right cones.
+        lpoints (list): The ordered left cones.
+        mid_points (list): The trajectory computed so far, with at least the starting point. It is modified in place.
+        last_ri (int, optional): Index of the last right cone already considered. Defaults to 0.
+        last_li (int, optional): Index of the last left cone already considered. Defaults to 0.
+        observer (callable, optional): Same as in compute_trajectory. Defaults to None.
+        drain (bool, optional): If False, it stops as soon as one side runs out of cones instead of following the cones of the other side. Defaults to True.
+        stats (PlannerStats, optional): Same as in compute_trajectory. Defaults to None.
+
+    Returns:
+        tuple: The indexes of the last right and left cones considered.
+    """
     while last_ri < len(rpoints) - 1 or last_li < len(lpoints) - 1:
         if last_ri < len(rpoints) - 1 and last_li < len(lpoints) - 1:
             distr = euclidean_norm(rpoints[last_ri], rpoints[last_ri+1]) + euclidean_norm(lpoints[last_li], rpoints[last_ri+1])
             distl = euclidean_norm(lpoints[last_li], lpoints[last_li+1]) + euclidean_norm(rpoints[last_ri], lpoints[last_li+1])
+        elif not drain:
+            break
         #Cases in which we run out of points in one side but still have points remaining in the other side:
         elif last_ri < len(rpoints) - 1:
             distr = 0  # Force right side movement
@@ -339,20 +403,31 @@ def compute_trajectory(right_points, left_points, semiplane = None):
             anchor_slope = lpoints[last_li-1]
             slope = compute_slope(anchor_slope, last_cone)
         
-        print(f"last ri:{last_ri}, last_li: {last_li}")
-    
+        if stats is not None:
+            stats.count('steps')
+            t = perf_counter()
+
         perp_slope = float('inf') if slope == 0 else -1 / slope
-        print(f"slope: {slope}, perp_slope: {perp_slope}")
+        # Traced instead of printed, the console I/O cost more than the step (see tracing.py)
+        if tracing.level <= tracing.DEBUG:
+            tracing.emit(tracing.DEBUG, 'step', last_ri=last_ri, last_li=last_li, slope=slope, perp_slope=perp_slope)
         new_point = find_intersection(slope, mid_points[-1], perp_slope, last_cone)
 
+        if stats is not None:
+            t = stats.lap('intersection', t)
+
         #Set the distance to the last cone exactly 1.5
         if euclidean_norm(new_point, last_cone) != 1.5:
             vector = compute_vector(last_cone, new_point)
             norm = euclidean_norm(vector, [0,0])
             vector = [1.5 * vector[0]/norm, 1.5 * vector[1]/norm]
             new_point = [last_cone[0] + vector[0], last_cone[1] + vector[1]]
-            
+
+        if stats is not None:
+            t = stats.lap('reprojection', t)
+
         # Rotate 180 respect to the last cone if the new point is to the left of the left cone or to the right of the right cone:
+        rotated = False
         cond = is_clockwise(compute_vector(other_last_cone, last_cone), compute_vector(other_last_cone, new_point))
         if cond is not None: 
             cond = cond if right else not cond #Distinguish between last cone being left cone or right cone
@@ -360,33 +435,61 @@ def compute_trajectory(right_points, left_points, semiplane = None):
                 vector = compute_vector(last_cone, new_point)
                 vector = rotate_180(vector)
                 new_point = [last_cone[0] + vector[0], last_cone[1] + vector[1]]
-                print('Rotated 180º')
+                rotated = True
+                if tracing.level <= tracing.INFO:
+                    tracing.emit(tracing.INFO, 'rotated_180', last_cone=last_cone, new_point=new_point)
 
         mid_points.append(new_point)
 
+        if stats is not None:
+            t = stats.lap('rotation', t)
+            stats.count('rotations', rotated)
+
         # Order last 3 trajectory points (not needed in most cases, just a safety check)
+        # It is order_point_list on the last 3 points, written out since it runs on every step: the second point is
+        # the closest of the other two to the first one
         if len(mid_points)>=3:
-            mid_points[-3:] = order_point_list(mid_points[-3:])
+            if euclidean_norm(mid_points[-3], mid_points[-1]) < euclidean_norm(mid_points[-3], mid_points[-2]):
+                mid_points[-2], mid_points[-1] = mid_points[-1], mid_points[-2]
+
+        if stats is not None:
+            t = stats.lap('reorder', t)
 
         # In case 2 trajectory points are too close, remove them and take only the average point
+        merged = False
         if euclidean_norm(mid_points[-1], mid_points[-2]) < 2 :
             mid_point = [(mid_points[-1][0] + mid_points[-2][0])/2, (mid_points[-1][1] + mid_points[-2][1])/2]
             mid_points[-2:] = [mid_point]
-            print(f"Removed 2 close points and replaced with midpoint")
-
-        #Plotting the step:
-        plt.clf()
-        plt.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', label='Left cones')
-        plt.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', label='Right cones')
-        plt.scatter([p[0] for p in mid_points], [p[1] for p in mid_points], c='g', label='Mid points')
-        plt.plot([anchor_slope[0], last_cone[0]], [anchor_slope[1], last_cone[1]], c='k', linestyle='--', label='Last segment')
-        plt.plot([last_cone[0], new_point[0]], [last_cone[1], new_point[1]], c='r', label='Perpendicular line')
-        plt.plot([mid_points[-2][0], new_point[0]], [mid_points[-2][1], new_point[1]], c='k')
-        plt.legend()
-        #plt.waitforbuttonpress()
-        plt.pause(0.5)
-    plt.show()
-    return mid_points
+            merged = True
+            if tracing.level <= tracing.INFO:
+                tracing.emit(tracing.INFO, 'merged', mid_point=mid_point)
+
+        if stats is not None:
+            stats.lap('merge', t)
+            stats.count('merges', merged)
+
+        if observer is not None:
+            observer({'rpoints': rpoints, 'lpoints': lpoints, 'mid_points': mid_points,
+                      'last_ri': last_ri, 'last_li': last_li, 'right': right,
+                      'anchor_slope': anchor_slope, 'last_cone': last_cone, 'new_point': new_point,
+                      'rotated': rotated, 'merged': merged})
+
+    return last_ri, last_li
+
+
+# PLOTTING ------------------------------------------------------------------------------------------
+#
+# StepPlotter and plot_trajectory_and_cones live in visualization.py, since importing matplotlib takes longer
+# than planning a map. They can still be used as attributes of this module (ctg.StepPlotter), and matplotlib is
+# only imported the first time one of them is accessed.
+_VISUALIZATION_NAMES = ('StepPlotter', 'plot_trajectory_and_cones')
+
+
+def __getattr__(name):
+    if name in _VISUALIZATION_NAMES:
+        import visualization
+        return getattr(visualization, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # UTILITY FUNCTIONS FOR THE MAIN FUNCTION
@@ -405,6 +508,9 @@ def deserialize_points(file_path="map.dat"):
     x2 y2
     ...
 
+    Binary maps (see map_format.py) are also accepted and converted to lists. Use deserialize_points_binary to read them without copies,
+    or map_format.iter_point_chunks to read very large maps in chunks.
+
     Args:
         file_path (str): The path to the file containing the points. Defaults to "map.dat".
 
@@ -414,59 +520,49 @@ def deserialize_points(file_path="map.dat"):
     right_points = []
     left_points = []
     try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-
-            current_list = None
-            for line in lines:
-                line = line.strip()
-                if line == "RIGHT_POINTS":
-                    current_list = right_points
-                elif line == "LEFT_POINTS":
-                    current_list = left_points
-                elif line and current_list is not None:
-                    # Split the line into coordinates and convert to float
-                    point = list(map(float, line.split()))
-                    current_list.append(point)
+        if is_binary_map(file_path):
+            right_points, left_points = load_binary_map(file_path)
+            return right_points.tolist(), left_points.tolist()
+
+        for section, chunk in iter_point_chunks(file_path):
+            if section == RIGHT_SECTION:
+                right_points.extend(chunk)
+            else:
+                left_points.extend(chunk)
 
     except Exception as e:
+        # Malformed lines are reported with their line number
         print(f"An error occurred while reading the file: {e}")
         return None, None  # Return None for both lists in case of an error
 
     return right_points, left_points
 
 
-def plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points):
-    """Plots the trajectory, detected cones, and undetected cones.
+def deserialize_points_binary(file_path="map.bin"):
+    """
+    Loads the points of a binary map (see map_format.py) through a memory map, without copying nor parsing them.
 
     Args:
-        mid_points (list): List of midpoints of the trajectory.
-        right_points (list): List of detected right cones.
-        left_points (list): List of detected left cones.
-        og_right_points (list): List of original right cones.
-        og_left_points (list): List of original left cones.
-    """
-    # Plot mid_points as a black line
-    x, y = zip(*[point for point in mid_points if point])  # Filter out empty points
-    plt.plot(x, y, 'k-', label='Trajectory')
+        file_path (str): The path to the binary map. Defaults to "map.bin".
 
-    # Plot midpoints as green scatter points
-    plt.scatter(x, y, c='g', label='Midpoints')
+    Returns:
+        tuple: A tuple containing two read only numpy arrays of shape (n, 2): right_points and left_points.
+    """
+    return load_binary_map(file_path)
 
-    # Plot right_points and left_points in red
-    all_detected = right_points + left_points
-    x, y = zip(*all_detected)
-    plt.scatter(x, y, c='r', label='Detected cones')
 
-    # Plot undetected cones in blue
-    undetected = [p for p in og_right_points + og_left_points if p not in all_detected]
-    if undetected:
-        x, y = zip(*undetected)
-        plt.scatter(x, y, c='b', label='Undetected cones')
+def serialize_trajectory(file_path, mid_points):
+    """
+    Writes the trajectory points to a text file, one "x y" pair per line after a TRAJECTORY_POINTS header.
 
-    plt.legend()
-    plt.axis('equal')
-    plt.show()
+    Args:
+        file_path (str): The path of the file to write.
+        mid_points (list): The trajectory given by compute_trajectory.
+    """
+    with open(file_path, 'w') as f:
+        f.write("TRAJECTORY_POINTS\n")
+        for point in mid_points:
+            f.write(f"{point[0]} {point[1]}\n")
 
 
 def remove_some_cones(og_right_points, og_left_points, skip_size=2):
@@ -474,15 +570,15 @@ def remove_some_cones(og_right_points, og_left_points, skip_size=2):
        It uses a maximum skip_size for how many adjacent points it can remove. If 0, no points are removed
 
     Args:
-        og_right_points (list): The original list of right cones.
-        og_left_points (list): The original list of left cones.
+        og_right_points (list): The original list of right cones. A PointArray (see point_containers.py) also works.
+        og_left_points (list): The original list of left cones. A PointArray also works.
         skip_size (int, optional): The maximum number of cones to skip. Defaults to 2.
 
     Returns:
-        tuple: A tuple containing two lists: the new list of right cones and the new list of left cones.
+        tuple: A tuple containing two lists (or two PointArray): the new list of right cones and the new list of left cones.
     """
-    right_points = [og_right_points[0]]  # Always keep the first right point
-    left_points = [og_left_points[0]]    # Always keep the first left point
+    right_indexes = [0]  # Always keep the first right point
+    left_indexes = [0]   # Always keep the first left point
     
     right_idx = 1
     left_idx = 1
@@ -493,7 +589,7 @@ def remove_some_cones(og_right_points, og_left_points, skip_size=2):
             skip = random.randint(0, skip_size)
             right_idx += skip
             if right_idx < len(og_right_points):
-                right_points.append(og_right_points[right_idx])
+                right_indexes.append(right_idx)
             right_idx += 1
         
         # Handle left points
@@ -501,10 +597,17 @@ def remove_some_cones(og_right_points, og_left_points, skip_size=2):
             skip = random.randint(0, skip_size)
             left_idx += skip
             if left_idx < len(og_left_points):
-                left_points.append(og_left_points[left_idx])
+                left_indexes.append(left_idx)
             left_idx += 1
     
-    return right_points, left_points
+    return _select_points(og_right_points, right_indexes), _select_points(og_left_points, left_indexes)
+
+
+def _select_points(points, indexes):
+    """Returns the points at the given indexes: a list for lists, or the same kind of container for a PointArray or an array."""
+    if isinstance(points, list):
+        return [points[i] for i in indexes]
+    return points[indexes]
 
 
 def disorder_points(list1, list2):
@@ -521,27 +624,64 @@ def disorder_points(list1, list2):
     list1_copy = list1.copy()
     list2_copy = list2.copy()
 
-    # Shuffle the lists from the second element onwards
-    random.shuffle(list1_copy[1:])
-    random.shuffle(list2_copy[1:])
+    # Shuffle the lists from the second element onwards. The slices are copies, so they are shuffled and then
+    # assigned back (shuffling list1_copy[1:] directly left the lists unchanged)
+    for points in (list1_copy, list2_copy):
+        rest = points[1:]
+        random.shuffle(rest)
+        points[1:] = rest
 
     return list1_copy, list2_copy
 
 
 
 if __name__ == "__main__":
-    filename = ''
-    while filename == '':
-        filename = input("Please enter the filename to load the map points: ")
-        if not os.path.exists(filename):
+    parser = argparse.ArgumentParser(description="Computes and plots the trajectory of a map after removing and disordering some of its cones.")
+    parser.add_argument('map', nargs='?', help="Map file to load. Asked interactively if not given")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1),
+                        help="If all points are outside the track, try changing semiplane from +1 to -1 or viceversa")
+    parser.add_argument('--skip-size', type=int, default=2, help="Change the skip_size to randomly remove more or less consecutive points")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for the removed cones and the disorder")
+    parser.add_argument('--output', help="Write the trajectory to this file")
+    parser.add_argument('--no-plot', action='store_true', help="Do not plot the steps nor the final trajectory")
+    parser.add_argument('--record', help="Record the steps instead of plotting them and render them to this .gif or .mp4 file in the background")
+    parser.add_argument('--trace', choices=('debug', 'info', 'warning'), default=None,
+                        help="Print the events of the computation from this level (debug prints every step)")
+    parser.add_argument('--trace-dump', help="If the computation fails, write its last trace events to this file (JSON lines)")
+    args = parser.parse_args()
+
+    filename = args.map or ''
+    while filename == '' or not os.path.exists(filename):
+        if filename != '':
             print("File does not exist. Please enter a valid filename.")
-            filename = ''
+        filename = input("Please enter the filename to load the map points: ")
     
     og_right_points, og_left_points = deserialize_points(file_path=filename)
-    # Change the skip_size to randomly remove more or less consecutive points
-    right_points, left_points = remove_some_cones(og_right_points, og_left_points, skip_size=2)
+    if og_right_points is None:
+        raise SystemExit(1)
+    if args.seed is not None:
+        random.seed(args.seed)
+    right_points, left_points = remove_some_cones(og_right_points, og_left_points, skip_size=args.skip_size)
     right_points, left_points = disorder_points(right_points, left_points)
-    #If all points are outside the track, try changing semiplane from +1 to -1 or viceversa
-    mid_points = compute_trajectory(right_points, left_points, semiplane=-1)
-    plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points)
-    
\ No newline at end of file
+    if not args.no_plot:
+        from visualization import StepPlotter, plot_trajectory_and_cones
+    if args.record:
+        from frame_recorder import FrameRecorder
+        step_plotter = FrameRecorder()
+    else:
+        step_plotter = None if args.no_plot else StepPlotter(pause=0.5)
+    trace_level = getattr(tracing, args.trace.upper()) if args.trace else tracing.DEBUG
+    recorder = tracing.TraceRecorder(level=trace_level, echo=args.trace is not None, dump_on_error=args.trace_dump)
+    if args.trace is None and args.trace_dump is None:
+        recorder = contextlib.nullcontext()
+    with recorder:
+        mid_points = compute_trajectory(right_points, left_points, semiplane=args.semiplane, observer=step_plotter)
+    render = step_plotter.render_async(args.record) if args.record else None
+    if args.output:
+        serialize_trajectory(args.output, mid_points)
+    if not args.no_plot:
+        if not args.record:
+            step_plotter.show()
+        plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points)
+    if render is not None:
+        print(f"Rendered {render.result()} steps into {args.record}")
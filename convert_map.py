@@ -0,0 +1,40 @@
+import sys
+
+from clean_trajectory_generator import deserialize_points
+from map_format import BINARY_MAP_EXTENSION, is_binary_map, load_binary_map
+from point_gen import serialize_points, serialize_points_binary
+
+
+def convert_map(input_path, output_path):
+    """Converts a map between the RIGHT_POINTS/LEFT_POINTS text format and the binary format of map_format.py.
+
+    The direction is chosen from the input file: binary maps are written as text and text maps are written as binary.
+
+    Args:
+        input_path (str): The map to convert.
+        output_path (str): The path of the converted map.
+    """
+    if is_binary_map(input_path):
+        right_points, left_points = load_binary_map(input_path)
+        serialize_points(output_path, right_points, left_points)
+    else:
+        right_points, left_points = deserialize_points(input_path)
+        if right_points is None:
+            raise ValueError(f"Could not read the map {input_path}")
+        serialize_points_binary(output_path, right_points, left_points)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python convert_map.py INPUT [OUTPUT]")
+        print(f"Converts text maps to binary maps ({BINARY_MAP_EXTENSION}) and binary maps to text maps (.dat)")
+        sys.exit(1)
+
+    input_path = sys.argv[1]
+    if len(sys.argv) == 3:
+        output_path = sys.argv[2]
+    else:
+        stem = input_path.rsplit('.', 1)[0]
+        output_path = stem + (".dat" if is_binary_map(input_path) else BINARY_MAP_EXTENSION)
+    convert_map(input_path, output_path)
+    print(f"Converted {input_path} into {output_path}")
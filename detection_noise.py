@@ -0,0 +1,207 @@
+import argparse
+import time
+
+import numpy as np
+
+
+# VECTORISED DETECTION NOISE ------------------------------------------------------------------------
+#
+# remove_some_cones and disorder_points perturb one cone set at a time with the random module, one cone after
+# the other. DetectionNoise draws whole batches of perturbed cone sets from the original cones of a map in a
+# few NumPy operations, with a model of what the perception actually gets wrong:
+#
+#   * Dropout: every detected cone is followed by a run of missed cones with probability dropout_rate. The length
+#     of the run is uniform between 1 and max_dropout_run, so whole stretches of a side can be missing, and the
+#     cone after the run is detected again. With dropout_rate = s / (s + 1) and max_dropout_run = s, the number
+#     of cones missed after each detected cone is uniform between 0 and s, like remove_some_cones with skip_size s.
+#   * Position noise: every detected cone is moved by Gaussian noise of standard deviation position_sigma.
+#   * Misclassification: every detected cone is given to the other side with probability swap_probability.
+#   * False positives: each trial has a Poisson number of cones that do not exist, false_positive_rate per
+#     real cone on average. They are placed around random real cones, false_positive_spread away on average,
+#     and assigned to a random side.
+#   * Reordering: the cones of each side are randomly permuted.
+#
+# The first cone of each side is kept as it is, in the first position, like remove_some_cones and
+# disorder_points do, since compute_trajectory starts the trajectory between them.
+#
+# A batch is returned padded, in the format of batch_trajectory.py: arrays of shape (trials, max_cones, 2) with
+# masks of shape (trials, max_cones), ready for compute_trajectory_batch. All the randomness comes from a
+# numpy Generator, so the same seed gives the same batch:
+#
+#     noise = DetectionNoise(dropout_rate=0.2, position_sigma=0.05)
+#     right, right_mask, left, left_mask = noise.sample(og_right_points, og_left_points, 10000, rng=0)
+#     mid_points, lengths = compute_trajectory_batch(right, left, right_mask, left_mask, semiplane=-1)
+
+
+class DetectionNoise:
+    """Model of the detection errors of the perception, that generates batches of perturbed cone sets.
+
+    See the description above. With the defaults, the cone sets are only reordered.
+
+    Args:
+        dropout_rate (float, optional): Probability that a detected cone is followed by a run of missed cones. Defaults to 0.
+        max_dropout_run (int, optional): Maximum length of a run of missed cones. Defaults to 1.
+        position_sigma (float, optional): Standard deviation of the position noise, in meters. Defaults to 0.
+        swap_probability (float, optional): Probability that a cone is given to the other side. Defaults to 0.
+        false_positive_rate (float, optional): Average number of false cones per real cone. Defaults to 0.
+        false_positive_spread (float, optional): Standard deviation, in meters, of the distance between a false
+            cone and the real cone it is placed around. Defaults to 2.
+        shuffle (bool, optional): If True, the cones of each side are randomly reordered. Defaults to True.
+
+    Raises:
+        ValueError: If a probability is not between 0 and 1, or a rate, spread or sigma is negative.
+    """
+
+    def __init__(self, dropout_rate=0.0, max_dropout_run=1, position_sigma=0.0, swap_probability=0.0,
+                 false_positive_rate=0.0, false_positive_spread=2.0, shuffle=True):
+        for name, value in (('dropout_rate', dropout_rate), ('swap_probability', swap_probability)):
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name} must be between 0 and 1, got {value}")
+        for name, value in (('position_sigma', position_sigma), ('false_positive_rate', false_positive_rate),
+                            ('false_positive_spread', false_positive_spread)):
+            if not value >= 0:
+                raise ValueError(f"{name} must not be negative, got {value}")
+        if max_dropout_run < 1:
+            raise ValueError(f"max_dropout_run must be at least 1, got {max_dropout_run}")
+        self.dropout_rate = dropout_rate
+        self.max_dropout_run = max_dropout_run
+        self.position_sigma = position_sigma
+        self.swap_probability = swap_probability
+        self.false_positive_rate = false_positive_rate
+        self.false_positive_spread = false_positive_spread
+        self.shuffle = shuffle
+
+    @classmethod
+    def like_remove_some_cones(cls, skip_size=2, **kwargs):
+        """Returns a model whose dropout is the one of remove_some_cones with the given skip_size (which skips
+        between 0 and skip_size cones after every kept cone), plus the given noise."""
+        return cls(dropout_rate=skip_size / (skip_size + 1), max_dropout_run=max(skip_size, 1), **kwargs)
+
+    def __repr__(self):
+        return (f"DetectionNoise(dropout_rate={self.dropout_rate}, max_dropout_run={self.max_dropout_run}, "
+                f"position_sigma={self.position_sigma}, swap_probability={self.swap_probability}, "
+                f"false_positive_rate={self.false_positive_rate}, false_positive_spread={self.false_positive_spread}, "
+                f"shuffle={self.shuffle})")
+
+    def _detected(self, trials, num_cones, rng):
+        """Returns the mask of shape (trials, num_cones) of the cones that are not dropped."""
+        if self.dropout_rate == 0 or num_cones == 0:
+            return np.ones((trials, num_cones), dtype=bool)
+        # Cones missed after each detected cone. There are at most num_cones detected cones, the first one included
+        runs = np.where(rng.random((trials, num_cones)) < self.dropout_rate,
+                        rng.integers(1, self.max_dropout_run + 1, (trials, num_cones)), 0)
+        positions = np.cumsum(runs + 1, axis=1) - runs - 1
+        detected = np.zeros((trials, num_cones), dtype=bool)
+        trial_index, cone_index = np.nonzero(positions < num_cones)
+        detected[trial_index, positions[trial_index, cone_index]] = True
+        return detected
+
+    def sample(self, og_right_points, og_left_points, trials, rng=None):
+        """Draws a batch of perturbed cone sets.
+
+        Args:
+            og_right_points (list): The original right cones, a list of points or an array of shape (n, 2).
+            og_left_points (list): The original left cones.
+            trials (int): Number of cone sets of the batch.
+            rng (numpy.random.Generator or int, optional): Generator or seed of the randomness. Defaults to None (unseeded).
+
+        Returns:
+            tuple: right_points, right_mask, left_points, left_mask. The points have shape (trials, max_cones, 2)
+            and the masks, True for the cones of the trial, shape (trials, max_cones). The cones of each trial are
+            at the front, and the first one is the first original cone of the side.
+        """
+        rng = np.random.default_rng(rng)
+        og_right = np.asarray(og_right_points, dtype=float).reshape(-1, 2)
+        og_left = np.asarray(og_left_points, dtype=float).reshape(-1, 2)
+        n_right, n_left = len(og_right), len(og_left)
+        og = np.concatenate([og_right, og_left])
+        n = len(og)
+
+        # Real cones of every trial, with the side each one is detected on
+        valid = np.concatenate([self._detected(trials, n_right, rng), self._detected(trials, n_left, rng)], axis=1)
+        right = np.zeros((trials, n), dtype=bool)
+        right[:, :n_right] = True
+        points = np.broadcast_to(og, (trials, n, 2))
+        if self.position_sigma > 0:
+            points = points + rng.normal(0.0, self.position_sigma, (trials, n, 2))
+        if self.swap_probability > 0:
+            right ^= rng.random((trials, n)) < self.swap_probability
+
+        # False positives are appended after the real cones, masked up to the count of each trial
+        if self.false_positive_rate > 0 and n and trials:
+            counts = rng.poisson(self.false_positive_rate * n, trials)
+            extra = int(counts.max())
+            around = og[rng.integers(0, n, (trials, extra))]
+            false_points = around + rng.normal(0.0, self.false_positive_spread, (trials, extra, 2))
+            points = np.concatenate([points, false_points], axis=1)
+            valid = np.concatenate([valid, np.arange(extra) < counts[:, None]], axis=1)
+            right = np.concatenate([right, rng.random((trials, extra)) < 0.5], axis=1)
+
+        # The first cone of each side is always detected, on its side and without noise
+        firsts = [first for first, count in ((0, n_right), (n_right, n_left)) if count]
+        valid[:, firsts] = True
+        right[:, firsts] = [first == 0 and n_right > 0 for first in firsts]
+        if self.position_sigma > 0:
+            points[:, firsts] = og[firsts]
+
+        return self._gather(points, valid & right, 0 if n_right else None, rng) + \
+            self._gather(points, valid & ~right, n_right if n_left else None, rng)
+
+    def _gather(self, points, side_mask, first, rng):
+        """Moves the cones of one side to the front, the first cone first and the others shuffled, and trims the padding."""
+        if self.shuffle:
+            keys = rng.random(side_mask.shape)
+        else:
+            keys = np.tile(np.arange(side_mask.shape[1], dtype=float) / side_mask.shape[1], (side_mask.shape[0], 1))
+        keys[~side_mask] = 2.0
+        if first is not None:
+            keys[:, first] = -1.0
+        order = np.argsort(keys, axis=1, kind='stable')
+        counts = side_mask.sum(axis=1)
+        width = int(counts.max()) if len(counts) else 0
+        order = order[:, :width]
+        mask = np.arange(width) < counts[:, None]
+        side_points = np.take_along_axis(points, order[:, :, None], axis=1)
+        side_points[~mask] = 0.0
+        return side_points, mask
+
+
+def cone_lists(points, mask):
+    """Returns the cones of every trial of a padded batch as lists of points, for compute_trajectory."""
+    return [trial[trial_mask].tolist() for trial, trial_mask in zip(points, mask)]
+
+
+if __name__ == "__main__":
+    from clean_trajectory_generator import deserialize_points
+
+    parser = argparse.ArgumentParser(description="Measures how many perturbed cone sets of a map DetectionNoise generates per minute.")
+    parser.add_argument('map', help="Map file")
+    parser.add_argument('--trials', type=int, default=100000, help="Trials of every batch")
+    parser.add_argument('--batches', type=int, default=5)
+    parser.add_argument('--dropout-rate', type=float, default=0.2)
+    parser.add_argument('--max-dropout-run', type=int, default=2)
+    parser.add_argument('--position-sigma', type=float, default=0.05)
+    parser.add_argument('--swap-probability', type=float, default=0.01)
+    parser.add_argument('--false-positive-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    og_right_points, og_left_points = deserialize_points(file_path=args.map)
+    if og_right_points is None:
+        raise SystemExit(1)
+    try:
+        noise = DetectionNoise(args.dropout_rate, args.max_dropout_run, args.position_sigma, args.swap_probability,
+                               args.false_positive_rate)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    rng = np.random.default_rng(args.seed)
+
+    start = time.perf_counter()
+    for _ in range(args.batches):
+        right, right_mask, left, left_mask = noise.sample(og_right_points, og_left_points, args.trials, rng)
+    elapsed = time.perf_counter() - start
+    trials = args.trials * args.batches
+    print(noise)
+    print(f"{trials} trials in {elapsed:.2f} s: {trials / elapsed * 60 / 1e6:.1f} million trials per minute")
+    print(f"Mean cones per trial: {right_mask.sum(axis=1).mean():.1f} right, {left_mask.sum(axis=1).mean():.1f} left "
+          f"(originally {len(og_right_points)} and {len(og_left_points)})")
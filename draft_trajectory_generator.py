@@ -1,5 +1,4 @@
 import os
-import matplotlib.pyplot as plt
 import random
 
 def deserialize_points(file_path="map.dat"):
@@ -170,7 +169,7 @@ def order_point_list(list):
     #! Add a way to take as second points the ones in the semiplane ahead of the car
     # Assume the first point is still the first point
     ordered_list = [list[0]] #Assume the first point is ordered correctly
-    remaining_points = list[1:]
+    remaining_points = [point for point in list[1:]] # A list, also for a PointArray (see point_containers.py)
     
     while remaining_points:
         closest_point = min(remaining_points, key=lambda point: euclidean_norm(ordered_list[-1], point))
@@ -231,7 +230,9 @@ def compute_trajectory2(right_points, left_points):
     return mid_points
 
 
-def compute_trajectory2_wsteps_circ(right_points, left_points):
+def compute_trajectory2_wsteps_circ(right_points, left_points, observer = None):
+    # observer is called after every step with a dictionary like the one of compute_trajectory in
+    # clean_trajectory_generator.py (see visualization.StepPlotter). Nothing is plotted without it
     # Assert the points are correctly ordered
     rpoints = order_point_list(right_points)
     lpoints = order_point_list(left_points)
@@ -243,7 +244,6 @@ def compute_trajectory2_wsteps_circ(right_points, left_points):
     # Auxiliary variables
     last_ri = 0
     last_li = 0
-    rotated = False
     # Main loop
     while last_ri < len(rpoints) - 1 or last_li < len(lpoints) - 1:
         if last_ri < len(rpoints) - 1 and last_li < len(lpoints) - 1:
@@ -257,21 +257,19 @@ def compute_trajectory2_wsteps_circ(right_points, left_points):
             distl = 0  # Force left side movement
 
         if distr <= distl:
+            right = True
             last_ri += 1
             last_cone = rpoints[last_ri]
             other_last_cone = lpoints[last_li]
             slope = compute_slope(rpoints[last_ri-1], last_cone)
-            # For plotting
-            p1 = rpoints[last_ri-1]
-            p2 = last_cone
+            anchor_slope = rpoints[last_ri-1]
         else:
+            right = False
             last_li += 1
             last_cone = lpoints[last_li]
             other_last_cone = rpoints[last_ri]
             slope = compute_slope(lpoints[last_li-1], last_cone)
-            # For plotting
-            p1 = lpoints[last_li-1]
-            p2 = last_cone
+            anchor_slope = lpoints[last_li-1]
         
         print(f"last ri:{last_ri}, last_li: {last_li}")
 
@@ -288,20 +286,16 @@ def compute_trajectory2_wsteps_circ(right_points, left_points):
             print(f"Too close to last cone, separating to 1.5")
             
         # Trying to prevent getting outside with circunferences
+        rotation_circles = None
         if euclidean_norm(other_last_cone, last_cone) < 0.95 * euclidean_norm(other_last_cone ,new_point):
             vector = compute_vector(last_cone, new_point)
             vector = rotate_180(vector)
-            # Plot the circles
-            circle1 = plt.Circle(other_last_cone, euclidean_norm(other_last_cone, last_cone), color='black', fill=False)
-            circle2 = plt.Circle(other_last_cone, euclidean_norm(other_last_cone, new_point), color='red', fill=False)
-            prev_rot = new_point
-            rotated = True
+            # For plotting the circles: their centre, their radius and the point before the rotation
+            rotation_circles = (other_last_cone, euclidean_norm(other_last_cone, last_cone), euclidean_norm(other_last_cone, new_point), new_point)
 
             new_point = [last_cone[0] + vector[0], last_cone[1] + vector[1]]
             print('Rotated 180º')
 
-            
-            
 
         mid_points.append(new_point)
 
@@ -310,31 +304,25 @@ def compute_trajectory2_wsteps_circ(right_points, left_points):
             mid_points[-3:] = order_point_list(mid_points[-3:])
 
         # In case 2 trajectory points are too close, remove them and take the only midpoint
-        if euclidean_norm(mid_points[-1], mid_points[-2]) < 2 :
+        merged = euclidean_norm(mid_points[-1], mid_points[-2]) < 2
+        if merged:
             mid_point = [(mid_points[-1][0] + mid_points[-2][0])/2, (mid_points[-1][1] + mid_points[-2][1])/2]
             mid_points[-2:] = [mid_point]
             print(f"Removed 2 close points and replaced with midpoint")
 
-        plt.clf()
-        if rotated:
-            plt.gca().add_patch(circle1)
-            plt.gca().add_patch(circle2)
-            plt.scatter([prev_rot[0]], [prev_rot[1]], c='k')
-            rotated = False
-        plt.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', label='Left cones')
-        plt.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', label='Right cones')
-        plt.scatter([p[0] for p in mid_points], [p[1] for p in mid_points], c='g', label='Mid points')
-        plt.plot([p1[0], p2[0]], [p1[1], p2[1]], c='k', label='Last segment')
-        plt.plot([p2[0], new_point[0]], [p2[1], new_point[1]], c='r', label='Perpendicular line')
-        plt.legend()
-        plt.waitforbuttonpress()
-
-    plt.show()
+        if observer is not None:
+            observer({'rpoints': rpoints, 'lpoints': lpoints, 'mid_points': mid_points,
+                      'last_ri': last_ri, 'last_li': last_li, 'right': right,
+                      'anchor_slope': anchor_slope, 'last_cone': last_cone, 'new_point': new_point,
+                      'rotated': rotation_circles is not None, 'merged': merged, 'rotation_circles': rotation_circles})
+
     return mid_points
 
 
 
-def compute_trajectory2_wsteps_slopes(right_points, left_points):
+def compute_trajectory2_wsteps_slopes(right_points, left_points, observer = None):
+    # observer is called after every step with a dictionary like the one of compute_trajectory in
+    # clean_trajectory_generator.py (see visualization.StepPlotter). Nothing is plotted without it
     # Assert the points are correctly ordered
     rpoints = order_point_list(right_points)
     lpoints = order_point_list(left_points)
@@ -359,25 +347,21 @@ def compute_trajectory2_wsteps_slopes(right_points, left_points):
             distl = 0  # Force left side movement
 
         if distr <= distl:
+            right = True
             last_ri += 1
             last_cone = rpoints[last_ri]
             other_last_cone = lpoints[last_li]
             anchor_slope = rpoints[last_ri-1]
             slope = compute_slope(anchor_slope, last_cone)
             other_slope = compute_slope(anchor_slope, other_last_cone)
-            # For plotting
-            p1 = rpoints[last_ri-1]
-            p2 = last_cone
         else:
+            right = False
             last_li += 1
             last_cone = lpoints[last_li]
             other_last_cone = rpoints[last_ri]
             anchor_slope = lpoints[last_li-1]
             slope = compute_slope(anchor_slope, last_cone)
             other_slope = compute_slope(anchor_slope, other_last_cone)
-            # For plotting
-            p1 = lpoints[last_li-1]
-            p2 = last_cone
         
         print(f"last ri:{last_ri}, last_li: {last_li}")
 
@@ -396,7 +380,8 @@ def compute_trajectory2_wsteps_slopes(right_points, left_points):
         # Trying to prevent getting outside with slopes
         slope_list = [slope, other_slope] if slope < other_slope else [other_slope, slope]
         cond = compute_slope(anchor_slope, new_point) > slope_list[0] and compute_slope(anchor_slope, new_point) < slope_list[1]
-        if cond == False:
+        rotated = cond == False
+        if rotated:
             vector = compute_vector(last_cone, new_point)
             vector = rotate_180(vector)
             new_point = [last_cone[0] + vector[0], last_cone[1] + vector[1]]
@@ -409,25 +394,24 @@ def compute_trajectory2_wsteps_slopes(right_points, left_points):
             mid_points[-3:] = order_point_list(mid_points[-3:])
 
         # In case 2 trajectory points are too close, remove them and take the only midpoint
-        if euclidean_norm(mid_points[-1], mid_points[-2]) < 2 :
+        merged = euclidean_norm(mid_points[-1], mid_points[-2]) < 2
+        if merged:
             mid_point = [(mid_points[-1][0] + mid_points[-2][0])/2, (mid_points[-1][1] + mid_points[-2][1])/2]
             mid_points[-2:] = [mid_point]
             print(f"Removed 2 close points and replaced with midpoint")
 
-        plt.clf()
-        plt.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', label='Left cones')
-        plt.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', label='Right cones')
-        plt.scatter([p[0] for p in mid_points], [p[1] for p in mid_points], c='g', label='Mid points')
-        plt.plot([p1[0], p2[0]], [p1[1], p2[1]], c='k', label='Last segment')
-        plt.plot([p2[0], new_point[0]], [p2[1], new_point[1]], c='r', label='Perpendicular line')
-        plt.legend()
-        plt.waitforbuttonpress()
+        if observer is not None:
+            observer({'rpoints': rpoints, 'lpoints': lpoints, 'mid_points': mid_points,
+                      'last_ri': last_ri, 'last_li': last_li, 'right': right,
+                      'anchor_slope': anchor_slope, 'last_cone': last_cone, 'new_point': new_point,
+                      'rotated': rotated, 'merged': merged})
 
-    plt.show()
     return mid_points
 
 
-def compute_trajectory2_wsteps_clockwise(right_points, left_points):
+def compute_trajectory2_wsteps_clockwise(right_points, left_points, observer = None):
+    # observer is called after every step with a dictionary like the one of compute_trajectory in
+    # clean_trajectory_generator.py (see visualization.StepPlotter). Nothing is plotted without it
     # Assert the points are correctly ordered
     rpoints = order_point_list(right_points)
     lpoints = order_point_list(left_points)
@@ -458,9 +442,6 @@ def compute_trajectory2_wsteps_clockwise(right_points, left_points):
             other_last_cone = lpoints[last_li]
             anchor_slope = rpoints[last_ri-1]
             slope = compute_slope(anchor_slope, last_cone)
-            # For plotting
-            p1 = rpoints[last_ri-1]
-            p2 = last_cone
         else:
             right = False
             last_li += 1
@@ -468,9 +449,6 @@ def compute_trajectory2_wsteps_clockwise(right_points, left_points):
             other_last_cone = rpoints[last_ri]
             anchor_slope = lpoints[last_li-1]
             slope = compute_slope(anchor_slope, last_cone)
-            # For plotting
-            p1 = lpoints[last_li-1]
-            p2 = last_cone
         
         print(f"last ri:{last_ri}, last_li: {last_li}")
 
@@ -486,6 +464,7 @@ def compute_trajectory2_wsteps_clockwise(right_points, left_points):
             print(f"Too close to last cone, separating to 1.5")
             
         # Trying to prevent getting outside with counter-clockwise or clokwise:
+        rotated = False
         cond = is_clockwise(compute_vector(other_last_cone, last_cone), compute_vector(other_last_cone, new_point))
         if cond is not None: 
             cond = cond if right else not cond
@@ -493,6 +472,7 @@ def compute_trajectory2_wsteps_clockwise(right_points, left_points):
                 vector = compute_vector(last_cone, new_point)
                 vector = rotate_180(vector)
                 new_point = [last_cone[0] + vector[0], last_cone[1] + vector[1]]
+                rotated = True
                 print('Rotated 180º')
 
         mid_points.append(new_point)
@@ -502,47 +482,32 @@ def compute_trajectory2_wsteps_clockwise(right_points, left_points):
             mid_points[-3:] = order_point_list(mid_points[-3:])
 
         # In case 2 trajectory points are too close, remove them and take the only midpoint
-        if euclidean_norm(mid_points[-1], mid_points[-2]) < 2 :
+        merged = euclidean_norm(mid_points[-1], mid_points[-2]) < 2
+        if merged:
             mid_point = [(mid_points[-1][0] + mid_points[-2][0])/2, (mid_points[-1][1] + mid_points[-2][1])/2]
             mid_points[-2:] = [mid_point]
             print(f"Removed 2 close points and replaced with midpoint")
 
-        plt.clf()
-        plt.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', label='Left cones')
-        plt.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', label='Right cones')
-        plt.scatter([p[0] for p in mid_points], [p[1] for p in mid_points], c='g', label='Mid points')
-        plt.plot([p1[0], p2[0]], [p1[1], p2[1]], c='k', label='Last segment')
-        plt.plot([p2[0], new_point[0]], [p2[1], new_point[1]], c='r', label='Perpendicular line')
-        plt.legend()
-        plt.waitforbuttonpress()
+        if observer is not None:
+            observer({'rpoints': rpoints, 'lpoints': lpoints, 'mid_points': mid_points,
+                      'last_ri': last_ri, 'last_li': last_li, 'right': right,
+                      'anchor_slope': anchor_slope, 'last_cone': last_cone, 'new_point': new_point,
+                      'rotated': rotated, 'merged': merged})
 
-    plt.show()
     return mid_points
 
 
 
-def plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points):
-    # Plot mid_points as a black line
-    x, y = zip(*[point for point in mid_points if point])  # Filter out empty points
-    plt.plot(x, y, 'k-', label='Trajectory')
+# The StepPlotter observer and plot_trajectory_and_cones are the ones of visualization.py, imported on first use
+# so that this module does not import matplotlib (see clean_trajectory_generator.py)
+_VISUALIZATION_NAMES = ('StepPlotter', 'plot_trajectory_and_cones')
 
-    # Plot midpoints as green scatter points
-    plt.scatter(x, y, c='g', label='Midpoints')
 
-    # Plot right_points and left_points in red
-    all_detected = right_points + left_points
-    x, y = zip(*all_detected)
-    plt.scatter(x, y, c='r', label='Detected cones')
-
-    # Plot undetected cones in blue
-    undetected = [p for p in og_right_points + og_left_points if p not in all_detected]
-    if undetected:
-        x, y = zip(*undetected)
-        plt.scatter(x, y, c='b', label='Undetected cones')
-
-    plt.legend()
-    plt.axis('equal')
-    plt.show()
+def __getattr__(name):
+    if name in _VISUALIZATION_NAMES:
+        import visualization
+        return getattr(visualization, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def remove_some_cones(og_right_points, og_left_points, skip_size=2):
@@ -586,15 +551,20 @@ def disorder_points(list1, list2):
     list1_copy = list1.copy()
     list2_copy = list2.copy()
 
-    # Shuffle the lists from the second element onwards
-    random.shuffle(list1_copy[1:])
-    random.shuffle(list2_copy[1:])
+    # Shuffle the lists from the second element onwards. The slices are copies, so they are shuffled and then
+    # assigned back (shuffling list1_copy[1:] directly left the lists unchanged)
+    for points in (list1_copy, list2_copy):
+        rest = points[1:]
+        random.shuffle(rest)
+        points[1:] = rest
 
     return list1_copy, list2_copy
 
 
 
 if __name__ == "__main__":
+    from visualization import StepPlotter, plot_trajectory_and_cones
+
     filename = 'circ_map.dat'
     while filename == '':
         filename = input("Please enter the filename to load the map points: ")
@@ -607,8 +577,10 @@ if __name__ == "__main__":
     right_points, left_points = disorder_points(right_points, left_points)
     # mid_points = compute_trajectory(right_points, left_points, threshold = 1.5)
     # mid_points = compute_trajectory2(right_points, left_points)
-    # mid_points = compute_trajectory2_wsteps_slopes(right_points, left_points)
-    # mid_points = compute_trajectory2_wsteps_circ(right_points, left_points)
-    mid_points = compute_trajectory2_wsteps_clockwise(right_points, left_points)
+    # mid_points = compute_trajectory2_wsteps_slopes(right_points, left_points, observer=StepPlotter(pause=None))
+    # mid_points = compute_trajectory2_wsteps_circ(right_points, left_points, observer=StepPlotter(pause=None))
+    plotter = StepPlotter(pause=None)
+    mid_points = compute_trajectory2_wsteps_clockwise(right_points, left_points, observer=plotter)
+    plotter.show()
     plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points)
     
\ No newline at end of file
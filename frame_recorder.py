@@ -0,0 +1,159 @@
+import argparse
+import collections
+import contextlib
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# OFFLINE RECORDING OF THE PLANNING STEPS -----------------------------------------------------------
+#
+# StepPlotter draws every step on screen and waits half a second after each one, so following a run of 500
+# cones takes minutes and needs a display. FrameRecorder is an observer that only keeps what is needed to
+# draw each step later, and the drawing is done by visualization.render_frames in a background process:
+#
+#     recorder = FrameRecorder()
+#     mid_points = compute_trajectory(right_points, left_points, -1, observer=recorder)
+#     future = recorder.render_async('run.gif', fps=20)   # The planner goes on at full speed
+#     ...
+#     future.result()
+#
+# Copying the whole trajectory at every step would make the recording quadratic, so each frame keeps the
+# length of the trajectory and its last FRAME_TAIL points. The steps only change the end of the trajectory (a
+# new point, or the last 2 points merged into 1), so the trajectory of each frame is the one of the previous
+# frame cut to its length, with the tail replaced. The cones are copied only when they change.
+#
+# The frames are rendered with the Agg canvas, without pyplot: the cones are drawn once into a background that
+# is restored for every frame, and only the trajectory and the lines of the step are drawn on top (blitting).
+# GIF files are written with Pillow and MP4 files with ffmpeg, which must be installed.
+
+FRAME_TAIL = 3
+
+# A recorded step. cones is the index of the cone snapshot of the step in FrameRecorder.cones
+Frame = collections.namedtuple('Frame', ('length', 'tail', 'anchor_slope', 'last_cone', 'new_point', 'right',
+                                         'rotated', 'merged', 'rotation_circles', 'cones'))
+
+
+class FrameRecorder:
+    """Observer for compute_trajectory (and the compute_trajectory2_wsteps_* functions) that records the steps.
+
+    Args:
+        tail (int, optional): Points at the end of the trajectory kept for each frame. Must be at least 3, since a
+            merge replaces the last 2 points. Defaults to FRAME_TAIL.
+    """
+
+    def __init__(self, tail=FRAME_TAIL):
+        self.tail = tail
+        self.frames = []
+        self.cones = []  # Snapshots (right cones, left cones), a new one whenever the cones of the steps change
+        self._cones_source = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __call__(self, step):
+        rpoints, lpoints = step['rpoints'], step['lpoints']
+        source = (id(rpoints), len(rpoints), id(lpoints), len(lpoints))
+        if source != self._cones_source:
+            self.cones.append(([tuple(p) for p in rpoints], [tuple(p) for p in lpoints]))
+            self._cones_source = source
+        mid_points = step['mid_points']
+        self.frames.append(Frame(len(mid_points), [tuple(p) for p in mid_points[-self.tail:]],
+                                 tuple(step['anchor_slope']), tuple(step['last_cone']), tuple(step['new_point']),
+                                 step['right'], step['rotated'], step['merged'], step.get('rotation_circles'),
+                                 len(self.cones) - 1))
+
+    def clear(self):
+        self.frames.clear()
+        self.cones.clear()
+        self._cones_source = None
+
+    def render(self, path, fps=10, size=(800, 600), every=1):
+        """Renders the recorded steps to a GIF or MP4 file in this process (see visualization.render_frames)."""
+        return _render(self.frames, self.cones, path, fps, size, every)
+
+    def render_async(self, path, fps=10, size=(800, 600), every=1, executor=None):
+        """Renders the recorded steps to a GIF or MP4 file in a background process.
+
+        The frames recorded so far are sent to the process, so the recorder can be cleared or reused right away.
+
+        Args:
+            path (str): Output file. Its extension (.gif or .mp4) selects the format.
+            fps (float, optional): Frames per second of the animation. Defaults to 10.
+            size (tuple, optional): Width and height of the animation in pixels. Defaults to (800, 600).
+            every (int, optional): Only every this many steps are rendered (the last one always is). Defaults to 1.
+            executor (Executor, optional): Executor to render in. Defaults to None, which starts a process for this render.
+
+        Returns:
+            Future: Resolves to the number of rendered frames, or raises the error of the render.
+        """
+        if executor is not None:
+            return executor.submit(_render, list(self.frames), list(self.cones), path, fps, size, every)
+        # Spawned, not forked, so the process does not inherit a GUI backend the caller may have started
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            return executor.submit(_render, list(self.frames), list(self.cones), path, fps, size, every)
+        finally:
+            # The process exits once the render is done, without blocking here
+            executor.shutdown(wait=False)
+
+
+def iter_trajectories(frames):
+    """Yields the full trajectory of every frame, rebuilt from the lengths and tails (see the description above).
+
+    The same list is updated and yielded for every frame, so it must be copied to be kept.
+    """
+    trajectory = []
+    for frame in frames:
+        del trajectory[max(frame.length - len(frame.tail), 0):]
+        trajectory.extend(frame.tail)
+        yield trajectory
+
+
+def _render(frames, cones, path, fps, size, every):
+    # Imported here so that recording never imports matplotlib, only the process that renders
+    from visualization import render_frames
+
+    if every > 1:
+        selected = {i for i in range(len(frames)) if i % every == every - 1 or i == len(frames) - 1}
+        trajectories = [list(trajectory) for i, trajectory in enumerate(iter_trajectories(frames)) if i in selected]
+        frames = [frame for i, frame in enumerate(frames) if i in selected]
+    else:
+        trajectories = iter_trajectories(frames)
+    return render_frames(frames, trajectories, cones, path, fps, size)
+
+
+if __name__ == "__main__":
+    import clean_trajectory_generator as ctg
+
+    parser = argparse.ArgumentParser(description="Records the steps of compute_trajectory on a map and renders them to a GIF or MP4 file.")
+    parser.add_argument('map', help="Map file")
+    parser.add_argument('output', help="Animation file, .gif or .mp4 (needs ffmpeg)")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--skip-size', type=int, default=0, help="skip_size given to remove_some_cones")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for the removed cones and the disorder")
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--every', type=int, default=1, help="Render one of every this many steps")
+    args = parser.parse_args()
+
+    og_right_points, og_left_points = ctg.deserialize_points(file_path=args.map)
+    if og_right_points is None:
+        raise SystemExit(1)
+    if args.seed is not None:
+        random.seed(args.seed)
+    right_points, left_points = ctg.remove_some_cones(og_right_points, og_left_points, skip_size=args.skip_size)
+    right_points, left_points = ctg.disorder_points(right_points, left_points)
+
+    recorder = FrameRecorder()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ctg.compute_trajectory(right_points, left_points, args.semiplane, observer=recorder)
+    print(f"Recorded {len(recorder)} steps in {(time.perf_counter() - start) * 1e3:.1f} ms")
+    start = time.perf_counter()
+    try:
+        rendered = recorder.render_async(args.output, args.fps, every=args.every).result()
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(str(e))
+    print(f"Rendered {rendered} frames into {args.output} in {time.perf_counter() - start:.1f} s")
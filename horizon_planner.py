@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import math
+import os
+import time
+
+from clean_trajectory_generator import compute_slope, compute_trajectory
+from lap_planner import MATCH_RADIUS
+from spatial_index import ConeHashGrid
+
+
+# RECEDING HORIZON PLANNING -------------------------------------------------------------------------
+#
+# compute_trajectory orders and plans every cone it is given, so its latency grows with the map. While driving
+# only the next few tens of meters matter, so HorizonPlanner keeps the accumulated cones of each side in a
+# ConeHashGrid and, for every vehicle pose, plans only the window around it:
+#
+#     planner = HorizonPlanner(look_ahead=40.0)
+#     planner.add_cones(new_right_points, new_left_points)    # Every frame, re-detections are ignored
+#     mid_points = planner.plan(x, y, heading)
+#
+#   1. The cones within look_ahead of the vehicle are found with ConeHashGrid.within, whose cost only depends on
+#      the cones around the vehicle. Cones more than BEHIND_DISTANCE behind the vehicle are dropped.
+#   2. The closest remaining cone of each side is put first, so the trajectory starts next to the vehicle.
+#   3. The semiplane that compute_trajectory needs to order the cones is the side of the line between those
+#      two cones that the heading points to, so it no longer has to be known for the map.
+#   4. compute_trajectory plans the window.
+#
+# The window holds about the same number of cones wherever the vehicle is, so the latency of plan is constant no
+# matter how large the accumulated map gets. Adding a cone is constant time too.
+
+DEFAULT_LOOK_AHEAD = 40.0  # Radius of the planned window around the vehicle, in meters
+BEHIND_DISTANCE = 2.0      # Cones up to this distance behind the vehicle are kept, they can be beside it
+HORIZON_CELL_SIZE = 10.0   # Cell size of the grids. The grids start empty, so it cannot be estimated from the cones
+
+
+def semiplane_from_heading(right_cone, left_cone, heading):
+    """Returns the semiplane of compute_trajectory that is in front of the vehicle.
+
+    Args:
+        right_cone (list): The first right cone.
+        left_cone (list): The first left cone.
+        heading (float): Direction of travel of the vehicle, in radians from the x axis.
+
+    Returns:
+        int: +1 if the heading points above the line through both cones (or to the right if it is vertical), -1 otherwise.
+    """
+    slope = compute_slope(right_cone, left_cone)
+    if slope == float('inf'):
+        return 1 if math.cos(heading) > 0 else -1
+    # (-slope, 1) is the normal of the line that points above it
+    return 1 if math.sin(heading) - slope * math.cos(heading) > 0 else -1
+
+
+class HorizonPlanner:
+    """Planner of the trajectory in a bounded window ahead of the vehicle (see the description above).
+
+    Args:
+        look_ahead (float, optional): Radius of the planned window, in meters. Defaults to DEFAULT_LOOK_AHEAD.
+        behind_distance (float, optional): Cones farther than this behind the vehicle are not planned. Defaults to BEHIND_DISTANCE.
+        match_radius (float, optional): A new cone closer than this to a known cone of the same side is the same
+            cone. 0 keeps every cone. Defaults to MATCH_RADIUS.
+        cell_size (float, optional): Cell size of the grids of cones. Defaults to HORIZON_CELL_SIZE.
+        stats (PlannerStats, optional): Same as in compute_trajectory, records every plan. Defaults to None.
+    """
+
+    def __init__(self, look_ahead=DEFAULT_LOOK_AHEAD, behind_distance=BEHIND_DISTANCE, match_radius=MATCH_RADIUS,
+                 cell_size=HORIZON_CELL_SIZE, stats=None):
+        self.look_ahead = look_ahead
+        self.behind_distance = behind_distance
+        self.match_radius = match_radius
+        self.stats = stats
+        self.rpoints, self.lpoints = [], []
+        self._grids = (ConeHashGrid([], cell_size), ConeHashGrid([], cell_size))
+
+    def __len__(self):
+        """Number of cones in the map, of both sides."""
+        return len(self.rpoints) + len(self.lpoints)
+
+    def add_cones(self, new_right_points=(), new_left_points=()):
+        """Adds newly detected cones to the map. Cones matching a known cone of the same side, and cones with NaN or
+        infinite coordinates, are ignored.
+
+        Returns:
+            int: The number of cones added.
+        """
+        added = 0
+        for points, known, grid in ((new_right_points, self.rpoints, self._grids[0]),
+                                    (new_left_points, self.lpoints, self._grids[1])):
+            for point in points:
+                if not (math.isfinite(point[0]) and math.isfinite(point[1])):
+                    continue
+                if self.match_radius > 0 and grid.within(point, self.match_radius):
+                    continue
+                grid.add(point)
+                known.append(point)
+                added += 1
+        return added
+
+    def window(self, x, y, heading):
+        """Returns the cones of each side to plan from the given pose, the closest one of each side first.
+
+        Returns:
+            tuple: The right and left cones of the window. A side is empty if it has no cones in the window.
+        """
+        ux, uy = math.cos(heading), math.sin(heading)
+        sides = []
+        for known, grid in ((self.rpoints, self._grids[0]), (self.lpoints, self._grids[1])):
+            # within sorts by distance, so the first cone left is the closest one
+            sides.append([known[i] for i in grid.within((x, y), self.look_ahead)
+                          if (known[i][0] - x) * ux + (known[i][1] - y) * uy >= -self.behind_distance])
+        return sides[0], sides[1]
+
+    def plan(self, x, y, heading, observer=None):
+        """Plans the trajectory in the window ahead of the vehicle.
+
+        Args:
+            x (float): Position of the vehicle.
+            y (float): Position of the vehicle.
+            heading (float): Direction of travel of the vehicle, in radians from the x axis.
+            observer (callable, optional): Same as in compute_trajectory. Defaults to None.
+
+        Returns:
+            list: The trajectory points, or an empty list if a side has no cones in the window.
+        """
+        right_points, left_points = self.window(x, y, heading)
+        if not right_points or not left_points:
+            return []
+        semiplane = semiplane_from_heading(right_points[0], left_points[0], heading)
+        return compute_trajectory(right_points, left_points, semiplane, observer=observer, stats=self.stats)
+
+
+if __name__ == "__main__":
+    import clean_trajectory_generator as ctg
+    from point_gen import get_procedural_track, random_segments
+
+    parser = argparse.ArgumentParser(description="Compares the latency of HorizonPlanner.plan and compute_trajectory on procedural tracks of growing length.")
+    parser.add_argument('--segments', type=int, nargs='+', default=[10, 100, 1000], help="Segments of each track")
+    parser.add_argument('--look-ahead', type=float, default=DEFAULT_LOOK_AHEAD)
+    parser.add_argument('--poses', type=int, default=50, help="Poses planned along every track")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'cones':>10}{'plan ms':>12}{'window cones':>14}{'full ms':>12}")
+    for num_segments in args.segments:
+        og_right_points, og_left_points = get_procedural_track(random_segments(num_segments, args.seed), args.seed)
+        og_right_points, og_left_points = og_right_points.tolist(), og_left_points.tolist()
+        planner = HorizonPlanner(args.look_ahead)
+        planner.add_cones(og_right_points, og_left_points)
+
+        # Poses on the centreline, heading to the next pair of cones
+        n = min(len(og_right_points), len(og_left_points))
+        poses = []
+        for i in range(0, n - 1, max((n - 1) // args.poses, 1)):
+            x, y = ctg.compute_midpoint(og_right_points[i], og_left_points[i])
+            nx, ny = ctg.compute_midpoint(og_right_points[i + 1], og_left_points[i + 1])
+            poses.append((x, y, math.atan2(ny - y, nx - x)))
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            for pose in poses:
+                planner.plan(*pose)
+            plan_time = (time.perf_counter() - start) / len(poses)
+            window_cones = sum(sum(map(len, planner.window(*pose))) for pose in poses) / len(poses)
+            start = time.perf_counter()
+            ctg.compute_trajectory(og_right_points, og_left_points, -1)
+            full_time = time.perf_counter() - start
+        print(f"{len(planner):>10}{plan_time * 1e3:>12.2f}{window_cones:>14.1f}{full_time * 1e3:>12.1f}")
@@ -0,0 +1,80 @@
+import json
+from time import perf_counter
+
+
+# INSTRUMENTATION OF compute_trajectory --------------------------------------------------------------
+#
+# A PlannerStats object can be given to compute_trajectory (and extend_trajectory, order_both_lists_of_cones
+# and StreamingPlanner) to record the wall time spent in each stage and counters of the events of each call.
+# When no object is given, the only cost is an `is not None` check per stage.
+
+# Stages of compute_trajectory, in the order they run
+STAGES = ('ordering', 'intersection', 'reprojection', 'rotation', 'reorder', 'merge')
+# Events counted in each call
+COUNTERS = ('steps', 'rotations', 'merges', 'semiplane_failures')
+
+
+class PlannerStats:
+    """Per call wall time of each stage of compute_trajectory and counters of its events.
+
+    Every call to compute_trajectory starts a new record with start_call. Records are dictionaries with
+    the time in seconds of each stage in STAGES and the value of each counter in COUNTERS.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._current = None
+
+    def start_call(self):
+        """Starts recording a new call."""
+        self._current = dict.fromkeys(STAGES, 0.0)
+        self._current.update(dict.fromkeys(COUNTERS, 0))
+        self.calls.append(self._current)
+
+    def _record(self):
+        if self._current is None:
+            # Functions used on their own, like extend_trajectory, record into an implicit call
+            self.start_call()
+        return self._current
+
+    def lap(self, stage, start):
+        """Adds the time since start to the given stage and returns the current time, to be used as the start of the next stage."""
+        now = perf_counter()
+        self._record()[stage] += now - start
+        return now
+
+    def count(self, counter, n=1):
+        """Increments the given counter of the current call."""
+        self._record()[counter] += n
+
+    def summary(self):
+        """Returns, for every stage and counter, its total, mean and maximum over the recorded calls, and the number of calls."""
+        summary = {'calls': len(self.calls)}
+        for key in STAGES + COUNTERS:
+            values = [call[key] for call in self.calls]
+            summary[key] = {
+                'total': sum(values),
+                'mean': sum(values) / len(values) if values else 0,
+                'max': max(values, default=0),
+            }
+        return summary
+
+    def to_json(self, path=None, include_calls=False):
+        """Returns the summary as a JSON string, writing it to path if given. With include_calls the record of every call is included too."""
+        data = {'summary': self.summary()}
+        if include_calls:
+            data['calls'] = self.calls
+        text = json.dumps(data, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def __str__(self):
+        summary = self.summary()
+        lines = [f"{summary['calls']} calls"]
+        for stage in STAGES:
+            lines.append(f"  {stage:<18} {summary[stage]['total'] * 1e3:10.3f} ms total, {summary[stage]['mean'] * 1e3:8.3f} ms per call")
+        for counter in COUNTERS:
+            lines.append(f"  {counter:<18} {summary[counter]['total']:10d} total, {summary[counter]['mean']:8.2f} per call")
+        return "\n".join(lines)
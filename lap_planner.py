@@ -0,0 +1,227 @@
+import math
+
+from clean_trajectory_generator import compute_midpoint, euclidean_norm, extend_trajectory
+from spatial_index import ConeHashGrid
+from streaming_planner import StreamingPlanner
+
+
+# LOOP CLOSURE FOR CIRCUITS -------------------------------------------------------------------------
+#
+# On a circuit like circ_map.dat, the ordered cones of each side end up wrapping around to their first cone,
+# and from then on every lap sees the same cones again. LapPlanner is a StreamingPlanner that notices it:
+#
+#   1. Cones that are within MATCH_RADIUS of a cone already received on the same side are re-detections and
+#      are ignored, so the second lap does not append the cones of the first one again.
+#   2. After every update, each side is checked for loop closure (see is_closed_loop), only going over the cones
+#      added since the last check, so the check does not grow with the lap. Once both sides are
+#      closed, the trajectory is sealed into a lap: the main loop runs once more over the cones with the first
+#      LAP_WRAP_CONES of each side appended again, so the seam between the end and the start of the track is
+#      planned with real cones, and it is cut where it comes back to its starting point.
+#   3. While sealed, updates only look for contradicting cones (new cones that match no known cone). If there
+#      are none, the lap is returned right away. Otherwise everything is planned again with the new cones,
+#      and the lap is sealed again if the cones still close the loop. A new cone that is closer to a known cone
+#      than to the midpoints between that cone and its neighbours is the same cone, detected somewhere else: it
+#      replaces the known cone, so the wrong detection does not shape the next laps. Any other new cone is added.
+
+MATCH_RADIUS = 1.0      # A cone closer than this to a known cone of the same side is the same cone
+CLOSURE_FACTOR = 1.5    # The gap between the last and the first cone can be this times the spacing of the cones around it
+MIN_LOOP_CONES = 4
+LAP_WRAP_CONES = 2
+
+
+def _turn(a, b, c):
+    """Signed angle, in (-π, π], between the segments a-b and b-c."""
+    turn = math.atan2(c[1] - b[1], c[0] - b[0]) - math.atan2(b[1] - a[1], b[0] - a[0])
+    return (turn + math.pi) % (2 * math.pi) - math.pi
+
+
+class _LoopCheck:
+    """is_closed_loop for a list of cones that only grows at its end, checked again after every update.
+
+    The turns of the open polyline are added as cones are appended, so a check only looks at the new cones and
+    at the gap between the last and the first cone, instead of going over the whole list. A list that is not
+    the one of the last check (the planner ordered the cones again) is followed from its start.
+    """
+
+    def __init__(self, closure_factor=CLOSURE_FACTOR):
+        self.closure_factor = closure_factor
+        self._points = None
+        self._next_vertex = 1  # First vertex whose turn is not in _turns yet
+        self._turns = 0.0      # Total turn of the open polyline at the vertices 1 to _next_vertex - 1
+
+    def closes(self, ordered_points):
+        """Returns is_closed_loop(ordered_points)."""
+        if ordered_points is not self._points:
+            self._points = ordered_points
+            self._next_vertex = 1
+            self._turns = 0.0
+        n = len(ordered_points)
+        for i in range(self._next_vertex, n - 1):
+            self._turns += _turn(ordered_points[i - 1], ordered_points[i], ordered_points[i + 1])
+        self._next_vertex = max(self._next_vertex, n - 1)
+        if n < MIN_LOOP_CONES:
+            return False
+
+        gap = euclidean_norm(ordered_points[-1], ordered_points[0])
+        spacing = max(euclidean_norm(ordered_points[0], ordered_points[1]), euclidean_norm(ordered_points[-2], ordered_points[-1]))
+        if not gap <= self.closure_factor * spacing:
+            return False
+        # Total turn of the closed polygon, which is ±2π for a loop: the open polyline plus the turns at both ends of the gap
+        winding = self._turns + _turn(ordered_points[-2], ordered_points[-1], ordered_points[0]) + \
+            _turn(ordered_points[-1], ordered_points[0], ordered_points[1])
+        return abs(abs(winding) - 2 * math.pi) < math.pi / 2
+
+
+def is_closed_loop(ordered_points, closure_factor=CLOSURE_FACTOR):
+    """Checks if an ordered list of cones wraps around to its first cone.
+
+    The gap between the last and the first cone must be similar to the distance between consecutive cones at
+    both ends, and the polygon closed by that gap must turn a full circle. The second condition rejects open
+    tracks whose ends happen to be close, like a U-turn.
+
+    Args:
+        ordered_points (list): The cones of one side, ordered along the track.
+        closure_factor (float, optional): Maximum ratio between the gap and the spacing of the cones at the ends.
+            Defaults to CLOSURE_FACTOR.
+
+    Returns:
+        bool: True if the cones form a closed loop.
+    """
+    return _LoopCheck(closure_factor).closes(ordered_points)
+
+
+def seal_lap(rpoints, lpoints, wrap_cones=LAP_WRAP_CONES):
+    """Computes the closed trajectory of a circuit from its ordered cones.
+
+    Args:
+        rpoints (list): The ordered right cones, forming a closed loop.
+        lpoints (list): The ordered left cones, forming a closed loop.
+        wrap_cones (int, optional): Cones of each side planned again after the last one, to plan the seam. Defaults to LAP_WRAP_CONES.
+
+    Returns:
+        list: The lap, whose last point is its first point.
+    """
+    mid_points = [compute_midpoint(rpoints[0], lpoints[0])]
+    extend_trajectory(rpoints + rpoints[:wrap_cones], lpoints + lpoints[:wrap_cones], mid_points)
+    start = mid_points[0]
+    # The lap ends where the trajectory comes back to its start, somewhere in its second half
+    end = min(range(len(mid_points) // 2, len(mid_points)), key=lambda i: euclidean_norm(mid_points[i], start), default=len(mid_points))
+    return mid_points[:end] + [start]
+
+
+class _ConeMatcher:
+    """Grid of the known cones of one side with cells of size radius, to find if a cone was already received."""
+
+    def __init__(self, radius):
+        self.radius = radius
+        self._cells = {}
+
+    def _cell(self, point):
+        return (math.floor(point[0] / self.radius), math.floor(point[1] / self.radius))
+
+    def add(self, point):
+        self._cells.setdefault(self._cell(point), []).append(point)
+
+    def matches(self, point):
+        cx, cy = self._cell(point)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for known in self._cells.get((cx + dx, cy + dy), ()):
+                    if euclidean_norm(known, point) <= self.radius:
+                        return True
+        return False
+
+
+def _replace_contradicted(ordered_points, new_points):
+    """Returns the cones of a sealed side with the new cones, each one replacing the known cone it contradicts.
+
+    A new cone contradicts the closest known cone if it is closer to it than half the distance from that cone to
+    its closest neighbour in the ordered list, and is added otherwise.
+    """
+    points = list(ordered_points)
+    n = len(ordered_points)
+    for point in new_points:
+        if not n:
+            points.append(point)
+            continue
+        k = min(range(n), key=lambda i: euclidean_norm(ordered_points[i], point))
+        spacing = min((euclidean_norm(ordered_points[k], ordered_points[j]) for j in (k - 1, (k + 1) % n) if j != k), default=0.0)
+        if euclidean_norm(ordered_points[k], point) < spacing / 2:
+            points[k] = point
+        else:
+            points.append(point)
+    return points
+
+
+class LapPlanner(StreamingPlanner):
+    """StreamingPlanner that closes the trajectory of a circuit and serves the next laps from it.
+
+    See the description above. While the loop is not closed it behaves like StreamingPlanner, except that cones
+    matching a known cone of the same side are ignored.
+
+    Args:
+        semiplane (int, optional): Same as in compute_trajectory. Defaults to None.
+        observer (callable, optional): Same as in StreamingPlanner. Defaults to None.
+        stats (PlannerStats, optional): Same as in StreamingPlanner. Updates answered from the lap record nothing. Defaults to None.
+        index_type (type, optional): Same as in compute_trajectory. Defaults to ConeHashGrid.
+        match_radius (float, optional): Distance under which a new cone is a known cone. Defaults to MATCH_RADIUS.
+    """
+
+    def __init__(self, semiplane=None, observer=None, stats=None, index_type=ConeHashGrid, match_radius=MATCH_RADIUS):
+        super().__init__(semiplane, observer, stats, index_type)
+        self.match_radius = match_radius
+        self.lap = None
+        self.replans = 0
+        self._matchers = (_ConeMatcher(match_radius), _ConeMatcher(match_radius))
+        self._loop_checks = (_LoopCheck(), _LoopCheck())
+
+    @property
+    def closed(self):
+        """True if the trajectory is sealed into a lap."""
+        return self.lap is not None
+
+    def _unknown_points(self, points, matcher):
+        """Returns the points that do not match a known cone, adding them to the known cones. Cones with NaN or
+        infinite coordinates are dropped, since they cannot be matched and would break the lap on every update."""
+        unknown = []
+        for point in points:
+            if not (math.isfinite(point[0]) and math.isfinite(point[1])):
+                continue
+            if not matcher.matches(point):
+                unknown.append(point)
+                matcher.add(point)
+        return unknown
+
+    def update(self, new_right_points=(), new_left_points=()):
+        """Adds newly detected cones and extends the trajectory, or returns the lap if the loop is closed and the
+        cones match it.
+
+        Args:
+            new_right_points (list, optional): The right cones detected since the last update. Known cones are ignored.
+            new_left_points (list, optional): The left cones detected since the last update. Known cones are ignored.
+
+        Returns:
+            list: The trajectory computed with all the cones received so far (the lap once it is sealed). It is the list kept by the planner, so it must not be modified.
+        """
+        new_right_points = self._unknown_points(new_right_points, self._matchers[0])
+        new_left_points = self._unknown_points(new_left_points, self._matchers[1])
+
+        if self.lap is not None:
+            if not new_right_points and not new_left_points:
+                return self.lap
+            # The new cones contradict the lap, plan everything again with them
+            self.replans += 1
+            right_points = _replace_contradicted(self.rpoints, new_right_points)
+            left_points = _replace_contradicted(self.lpoints, new_left_points)
+            self.lap = None
+            self.rpoints, self.lpoints, self.mid_points = [], [], []
+            self.last_ri = self.last_li = 0
+            self._checkpoint = None
+            super().update(right_points, left_points)
+        elif new_right_points or new_left_points:
+            super().update(new_right_points, new_left_points)
+
+        if self._loop_checks[0].closes(self.rpoints) and self._loop_checks[1].closes(self.lpoints):
+            self.lap = seal_lap(self.rpoints, self.lpoints)
+            self.mid_points = self.lap
+        return self.mid_points
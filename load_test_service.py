@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import clean_trajectory_generator as ctg
+from benchmark import build_track
+from planning_service import INLINE_MAX_CONES, PlanningClient
+
+
+# LOAD TEST OF THE PLANNING SERVICE -----------------------------------------------------------------
+#
+# Opens many concurrent connections to a planning service and measures the latency of every request and the
+# overall throughput. Without --unix or --port it starts a local instance of planning_service.py on a
+# temporary Unix socket and stops it at the end.
+#
+# Small maps like map.dat are always planned in the event loop of the service, since they have fewer than
+# INLINE_MAX_CONES cones. Every other request is therefore taken from a circular track with --large-cones cones
+# per side, which is sent to the worker processes, so both paths are measured. --large-cones 0 only sends the map.
+#
+#     python load_test_service.py map.dat --clients 16 --requests 200
+
+DEFAULT_LARGE_CONES = 2 * INLINE_MAX_CONES  # Cones per side of the large track, about 2 * INLINE_MAX_CONES remain after removing some
+CONE_SETS = 64  # Different cone sets of each kind, cycled through by the clients
+
+
+def percentile(values, q):
+    """Returns the q-th percentile (0 to 100) of the values, with linear interpolation."""
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def build_requests(og_right_points, og_left_points, count, skip_size=2, seed=0):
+    """Returns count (right_points, left_points) cone sets, each one with some random cones of the map removed."""
+    rng_state = random.getstate()
+    random.seed(seed)
+    try:
+        return [ctg.remove_some_cones(og_right_points, og_left_points, skip_size=skip_size) for _ in range(count)]
+    finally:
+        random.setstate(rng_state)
+
+
+async def _run_client(connect, cone_sets, semiplane, latencies, errors):
+    client = await connect()
+    try:
+        for right_points, left_points in cone_sets:
+            start = time.perf_counter()
+            try:
+                await client.plan(right_points, left_points, semiplane)
+            except Exception:
+                errors.append(1)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await client.close()
+
+
+async def run_load_test(connect, cone_sets, clients, requests, semiplane=-1):
+    """Sends requests requests from each of the clients concurrent connections.
+
+    Args:
+        connect (callable): Coroutine function that returns a connected PlanningClient.
+        cone_sets (list): Cone sets to send, cycled through by every client.
+
+    Returns:
+        dict: The number of requests and errors, the number of requests with more than INLINE_MAX_CONES cones,
+        the wall time, the throughput in requests per second and the mean, p50, p95, p99 and max latency in milliseconds.
+    """
+    latencies = []
+    errors = []
+    per_client = [[cone_sets[(c + i) % len(cone_sets)] for i in range(requests)] for c in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(_run_client(connect, sets, semiplane, latencies, errors) for sets in per_client))
+    wall = time.perf_counter() - start
+    ms = [latency * 1e3 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'large_requests': sum(len(right_points) + len(left_points) > INLINE_MAX_CONES
+                              for sets in per_client for right_points, left_points in sets),
+        'wall_seconds': wall,
+        'throughput_rps': len(latencies) / wall if wall else 0.0,
+        'latency_mean_ms': sum(ms) / len(ms) if ms else float('nan'),
+        'latency_p50_ms': percentile(ms, 50),
+        'latency_p95_ms': percentile(ms, 95),
+        'latency_p99_ms': percentile(ms, 99),
+        'latency_max_ms': max(ms, default=float('nan')),
+    }
+
+
+def start_local_service(unix_path, workers=None, timeout=30):
+    """Starts planning_service.py on a Unix socket in a subprocess and waits until it accepts connections.
+
+    Raises:
+        RuntimeError: If the service exits or does not accept connections within timeout seconds. It is killed in that case.
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'planning_service.py'), '--unix', unix_path]
+    if workers is not None:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"The planning service exited with status {process.returncode} before accepting connections")
+        if os.path.exists(unix_path):
+            try:
+                with socket.socket(socket.AF_UNIX) as probe:
+                    probe.connect(unix_path)
+                return process
+            except OSError:
+                pass  # The socket is bound but not listening yet
+        if time.monotonic() > deadline:
+            process.kill()
+            process.wait()
+            raise RuntimeError(f"The planning service did not start in {timeout} s")
+        time.sleep(0.05)
+
+
+def stop_local_service(process, timeout=10):
+    """Stops a service started by start_local_service, killing it if it does not stop within timeout seconds.
+
+    The service is interrupted like with Ctrl+C, so it shuts its worker processes down. Terminating it would
+    leave them running, holding its output open.
+    """
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the latency and throughput of the planning service.")
+    parser.add_argument('map', help="Map whose cones are sent, with some of them removed in every request")
+    parser.add_argument('--clients', type=int, default=8, help="Number of concurrent connections")
+    parser.add_argument('--requests', type=int, default=100, help="Requests sent by each client")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--skip-size', type=int, default=2, help="skip_size given to remove_some_cones")
+    parser.add_argument('--large-cones', type=int, default=DEFAULT_LARGE_CONES,
+                        help="Cones per side of the circular track sent by every other request, to use the worker processes. 0 only sends the map")
+    parser.add_argument('--unix', help="Unix socket of a running service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="TCP port of a running service")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes of the local service, if one is started")
+    parser.add_argument('--json', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    og_right_points, og_left_points = ctg.deserialize_points(file_path=args.map)
+    if og_right_points is None:
+        raise SystemExit(1)
+    cone_sets = build_requests(og_right_points, og_left_points, CONE_SETS, args.skip_size)
+    if args.large_cones > 0:
+        large_sets = build_requests(*build_track(args.large_cones), CONE_SETS, args.skip_size)
+        cone_sets = [cone_set for pair in zip(cone_sets, large_sets) for cone_set in pair]
+
+    process = None
+    with tempfile.TemporaryDirectory() as directory:
+        unix_path = args.unix
+        if unix_path is None and args.port is None:
+            unix_path = os.path.join(directory, 'planner.sock')
+            process = start_local_service(unix_path, args.workers)
+        try:
+            connect = lambda: PlanningClient.connect(unix_path=unix_path, host=args.host, port=args.port)
+            results = asyncio.run(run_load_test(connect, cone_sets, args.clients, args.requests, args.semiplane))
+        finally:
+            if process is not None:
+                stop_local_service(process)
+
+    for key, value in results.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
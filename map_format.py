@@ -0,0 +1,152 @@
+import struct
+
+
+# BINARY CONE MAP FORMAT ---------------------------------------------------------------------------
+#
+# Compact alternative to the RIGHT_POINTS/LEFT_POINTS text format. The file is:
+#
+#   Header (32 bytes, little endian):
+#       magic       8 bytes   b"CONEMAP\0"
+#       version     uint32    BINARY_MAP_VERSION
+#       reserved    uint32    0
+#       n_right     uint64    number of right cones
+#       n_left      uint64    number of left cones
+#   Data:
+#       n_right packed float64 (x, y) pairs with the right cones, followed by
+#       n_left packed float64 (x, y) pairs with the left cones.
+#
+# Each pair has the layout of `struct Point { double x, y; }` in src/point_loader.cpp, and the header size
+# keeps the data aligned to 8 bytes, so the points can be used directly from a memory map.
+
+BINARY_MAP_MAGIC = b"CONEMAP\0"
+BINARY_MAP_VERSION = 1
+BINARY_MAP_HEADER = struct.Struct("<8sIIQQ")
+BINARY_MAP_EXTENSION = ".bin"
+
+
+class MapFormatError(ValueError):
+    """Raised when a map file does not follow the expected format."""
+
+
+def pack_header(n_right, n_left):
+    """Returns the header of a binary map with the given number of right and left cones."""
+    return BINARY_MAP_HEADER.pack(BINARY_MAP_MAGIC, BINARY_MAP_VERSION, 0, n_right, n_left)
+
+
+def unpack_header(data):
+    """Parses the header of a binary map.
+
+    Args:
+        data (bytes): At least the first BINARY_MAP_HEADER.size bytes of the file.
+
+    Returns:
+        tuple: The number of right cones and the number of left cones.
+    """
+    if len(data) < BINARY_MAP_HEADER.size:
+        raise MapFormatError("The file is too short to be a binary map")
+    magic, version, _, n_right, n_left = BINARY_MAP_HEADER.unpack_from(data)
+    if magic != BINARY_MAP_MAGIC:
+        raise MapFormatError("The file is not a binary map")
+    if version != BINARY_MAP_VERSION:
+        raise MapFormatError(f"Unsupported binary map version {version}")
+    return n_right, n_left
+
+
+def is_binary_map(file_path):
+    """Returns True if the file starts with the binary map magic bytes."""
+    with open(file_path, 'rb') as file:
+        return file.read(len(BINARY_MAP_MAGIC)) == BINARY_MAP_MAGIC
+
+
+def load_binary_map(file_path):
+    """Loads a binary map through a memory map, without copying nor parsing the points.
+
+    Args:
+        file_path (str): The path to the binary map.
+
+    Returns:
+        tuple: Two read only numpy arrays of shape (n, 2) with the right and left cones. Both are views of the same memory map.
+    """
+    import numpy as np
+
+    with open(file_path, 'rb') as file:
+        n_right, n_left = unpack_header(file.read(BINARY_MAP_HEADER.size))
+        file.seek(0, 2)
+        size = file.tell()
+
+    expected = BINARY_MAP_HEADER.size + 16 * (n_right + n_left)
+    if size != expected:
+        raise MapFormatError(f"Expected {expected} bytes for {n_right} right and {n_left} left cones, found {size}")
+
+    if n_right + n_left == 0:
+        points = np.empty((0, 2), dtype='<f8')
+    else:
+        points = np.memmap(file_path, dtype='<f8', mode='r', offset=BINARY_MAP_HEADER.size, shape=(n_right + n_left, 2))
+    return points[:n_right], points[n_right:]
+
+
+# STREAMING READER ---------------------------------------------------------------------------------
+
+RIGHT_SECTION = "RIGHT_POINTS"
+LEFT_SECTION = "LEFT_POINTS"
+
+
+class MapLineError(MapFormatError):
+    """Raised when a line of a text map cannot be parsed. The line number (starting at 1) is in line_number."""
+
+    def __init__(self, file_path, line_number, line):
+        super().__init__(f"{file_path}:{line_number}: expected 'x y', found {line!r}")
+        self.file_path = file_path
+        self.line_number = line_number
+        self.line = line
+
+
+def iter_point_chunks(file_path, chunk_size=4096):
+    """Reads a map file lazily, yielding its cones in chunks of at most chunk_size points.
+
+    Text maps are read line by line, so the memory used does not depend on the size of the file. As in
+    deserialize_points, points are assigned to the last RIGHT_POINTS or LEFT_POINTS header seen, lines before
+    the first header are ignored and a section can appear several times. Binary maps are also accepted, and
+    their chunks are views of the memory map.
+
+    Args:
+        file_path (str): The path to the map file.
+        chunk_size (int, optional): Maximum number of points of each chunk. Defaults to 4096.
+
+    Yields:
+        tuple: The section of the chunk (RIGHT_SECTION or LEFT_SECTION) and a list of points [x, y]
+        (a numpy array of shape (n, 2) for binary maps). Consecutive chunks of a section keep the file order.
+
+    Raises:
+        MapLineError: If a line of a section is not made of exactly 2 numbers.
+    """
+    if is_binary_map(file_path):
+        right_points, left_points = load_binary_map(file_path)
+        for section, points in ((RIGHT_SECTION, right_points), (LEFT_SECTION, left_points)):
+            for start in range(0, len(points), chunk_size):
+                yield section, points[start:start + chunk_size]
+        return
+
+    with open(file_path, 'r') as file:
+        section = None
+        chunk = []
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if line == RIGHT_SECTION or line == LEFT_SECTION:
+                if chunk:
+                    yield section, chunk
+                    chunk = []
+                section = line
+            elif line and section is not None:
+                values = line.split()
+                try:
+                    if len(values) != 2:
+                        raise ValueError
+                    chunk.append([float(values[0]), float(values[1])])
+                except ValueError:
+                    raise MapLineError(file_path, line_number, line) from None
+                if len(chunk) >= chunk_size:
+                    yield section, chunk
+                    chunk = []
+        if chunk:
+            yield section, chunk
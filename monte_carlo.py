@@ -0,0 +1,145 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import clean_trajectory_generator as ctg
+from detection_noise import DetectionNoise, cone_lists
+from trajectory_metrics import SegmentGrid, build_centreline, centreline_deviations
+
+
+# MONTE CARLO ROBUSTNESS HARNESS ---------------------------------------------------------------------
+#
+# Runs many seeded trials of the __main__ block of clean_trajectory_generator.py (remove some cones, disorder
+# them and compute_trajectory) over a process pool and aggregates how often the trajectory fails. The cones of
+# each trial are drawn with DetectionNoise.like_remove_some_cones, which removes and reorders them like
+# remove_some_cones and disorder_points.
+#
+# Every trial gets its own seed, drawn from the master seed in trial order, which seeds the numpy Generator of
+# its DetectionNoise sample. The results are collected in trial order, so the aggregated statistics only
+# depend on the master seed and not on the number of workers.
+
+# Map loaded in each worker by _init_worker, so it is not sent again with every trial
+_worker_map = None
+
+
+def trial_seeds(master_seed, trials):
+    """Returns the seed of each trial, derived from the master seed."""
+    rng = random.Random(master_seed)
+    return [rng.getrandbits(64) for _ in range(trials)]
+
+
+def _init_worker(og_right_points, og_left_points):
+    global _worker_map
+    centreline, half_widths = build_centreline(og_right_points, og_left_points)
+    # The grid over the centreline is built once per worker and reused by all its trials
+    grid = SegmentGrid(centreline[:-1], centreline[1:]) if len(centreline) > 1 else None
+    _worker_map = (og_right_points, og_left_points, centreline, half_widths, grid)
+
+
+def run_trial(trial, seed, skip_size=2, semiplane=-1):
+    """Runs one trial on the map loaded by _init_worker.
+
+    Returns:
+        dict: The trial number, its seed, the error message if compute_trajectory raised one (None otherwise),
+        the number of trajectory points, the number of 180º rotations, the number of points off the track
+        and the largest distance outside of the track.
+    """
+    og_right_points, og_left_points, centreline, half_widths, grid = _worker_map
+    right, right_mask, left, left_mask = DetectionNoise.like_remove_some_cones(skip_size).sample(
+        og_right_points, og_left_points, 1, rng=seed)
+    right_points, left_points = cone_lists(right, right_mask)[0], cone_lists(left, left_mask)[0]
+
+    rotations = 0
+    def count_rotations(step):
+        nonlocal rotations
+        rotations += step['rotated']
+
+    result = {'trial': trial, 'seed': seed, 'error': None, 'points': 0, 'rotations': 0,
+              'off_track_points': 0, 'max_off_track': 0.0}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            mid_points = ctg.compute_trajectory(right_points, left_points, semiplane=semiplane, observer=count_rotations)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['rotations'] = rotations
+        return result
+
+    # How far each point is outside of the track, or 0 if it is inside. NaN points are infinitely far
+    deviations, widths = centreline_deviations(mid_points, centreline, half_widths, grid)
+    distances = np.maximum(deviations - widths, 0.0)
+    result['points'] = len(mid_points)
+    result['rotations'] = rotations
+    result['off_track_points'] = int((distances > 0).sum())
+    result['max_off_track'] = float(distances.max()) if len(distances) else 0.0
+    return result
+
+
+def _run_trial_args(args):
+    return run_trial(*args)
+
+
+def summarize(results):
+    """Aggregates the results of the trials. A trial fails if compute_trajectory raised an error or any point is off the track."""
+    trials = len(results)
+    failures = sum(1 for r in results if r['error'] is not None or r['off_track_points'] > 0)
+    points = sum(r['points'] for r in results)
+    rotations = [r['rotations'] for r in results]
+    return {
+        'trials': trials,
+        'errors': sum(1 for r in results if r['error'] is not None),
+        'failures': failures,
+        'failure_rate': failures / trials if trials else 0.0,
+        'rotations_total': sum(rotations),
+        'rotations_mean': sum(rotations) / trials if trials else 0.0,
+        'rotations_max': max(rotations, default=0),
+        'off_track_points': sum(r['off_track_points'] for r in results),
+        'off_track_point_rate': sum(r['off_track_points'] for r in results) / points if points else 0.0,
+        'max_off_track': max((r['max_off_track'] for r in results), default=0.0),
+    }
+
+
+def run_monte_carlo(og_right_points, og_left_points, trials, master_seed=0, workers=None, skip_size=2, semiplane=-1):
+    """Runs the trials over a pool of workers processes (or in this process if workers is 1).
+
+    Returns:
+        tuple: The summary given by summarize and the list of results of each trial, in trial order.
+    """
+    tasks = [(trial, seed, skip_size, semiplane) for trial, seed in enumerate(trial_seeds(master_seed, trials))]
+    if workers == 1:
+        _init_worker(og_right_points, og_left_points)
+        results = [_run_trial_args(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(og_right_points, og_left_points)) as executor:
+            chunksize = max(1, trials // (4 * (workers or os.cpu_count() or 1)))
+            results = list(executor.map(_run_trial_args, tasks, chunksize=chunksize))
+    return summarize(results), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs seeded trials of compute_trajectory on randomly removed and disordered cones in parallel.")
+    parser.add_argument('map', help="Map file with the original cones, ordered along the track")
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help="Master seed. The same seed gives the same results for any number of workers")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes. Defaults to the number of CPUs")
+    parser.add_argument('--skip-size', type=int, default=2, help="skip_size given to DetectionNoise.like_remove_some_cones")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--json', help="Write the summary and the results of every trial to this JSON file")
+    args = parser.parse_args()
+
+    og_right_points, og_left_points = ctg.deserialize_points(file_path=args.map)
+    if og_right_points is None:
+        raise SystemExit(1)
+    summary, results = run_monte_carlo(og_right_points, og_left_points, args.trials, args.seed, args.workers,
+                                       args.skip_size, args.semiplane)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'results': results}, f, indent=2)
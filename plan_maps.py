@@ -0,0 +1,178 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import clean_trajectory_generator as ctg
+from map_format import BINARY_MAP_EXTENSION, MapFormatError
+
+
+# BATCH PLANNING OF MAP FILES ------------------------------------------------------------------------
+#
+# Non-interactive entry point to push many maps through compute_trajectory, e.g. a nightly regression corpus:
+#
+#     python plan_maps.py maps/ extra_map.dat --output results/ --workers 8
+#
+# Directories are searched (not recursively) for text (.dat) and binary (.bin) maps. Every map is planned in a
+# worker process with plotting disabled, and the output directory gets one <map name>.traj file per map with
+# its trajectory (see serialize_trajectory) plus timing.csv and summary.json with the per-map timing.
+
+MAP_EXTENSIONS = ('.dat', BINARY_MAP_EXTENSION)
+TRAJECTORY_EXTENSION = '.traj'
+TIMING_FIELDS = ('map', 'right_cones', 'left_cones', 'points', 'load_seconds', 'plan_seconds', 'error')
+
+
+def find_maps(paths):
+    """Returns the map files given directly or found in the given directories, without repetitions and sorted."""
+    maps = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                file_path = os.path.join(path, name)
+                if name.endswith(MAP_EXTENSIONS) and os.path.isfile(file_path):
+                    maps.add(file_path)
+        else:
+            maps.add(path)
+    return sorted(maps)
+
+
+def trajectory_path(output_dir, map_path):
+    """Returns the path of the trajectory file of a map: its name with TRAJECTORY_EXTENSION, in the output directory."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(map_path))[0] + TRAJECTORY_EXTENSION)
+
+
+def load_map(map_path):
+    """Reads a map with deserialize_points, raising the error it prints instead.
+
+    Raises:
+        MapFormatError: If the map cannot be read. The message is the one of deserialize_points, which has the
+            path and number of the line for a malformed line.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        right_points, left_points = ctg.deserialize_points(map_path)
+    if right_points is None:
+        message = output.getvalue().strip().splitlines()
+        raise MapFormatError(message[-1] if message else "Could not read the map")
+    return right_points, left_points
+
+
+def plan_map(map_path, output_dir, semiplane=-1):
+    """Loads a map, computes its trajectory and writes it to the output directory.
+
+    Returns:
+        dict: The timing of the map, with the fields of TIMING_FIELDS. error is None if the map was planned, and
+        has the line number of the malformed line if the map could not be parsed.
+    """
+    result = {'map': map_path, 'right_cones': 0, 'left_cones': 0, 'points': 0,
+              'load_seconds': 0.0, 'plan_seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        right_points, left_points = load_map(map_path)
+    except MapFormatError as e:
+        result['error'] = str(e)
+        return result
+    result['load_seconds'] = time.perf_counter() - start
+    result['right_cones'] = len(right_points)
+    result['left_cones'] = len(left_points)
+
+    # compute_trajectory prints its errors, which would flood the console
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            start = time.perf_counter()
+            mid_points = ctg.compute_trajectory(right_points, left_points, semiplane)
+            result['plan_seconds'] = time.perf_counter() - start
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+            return result
+
+    result['points'] = len(mid_points)
+    ctg.serialize_trajectory(trajectory_path(output_dir, map_path), mid_points)
+    return result
+
+
+def plan_maps(map_paths, output_dir, semiplane=-1, workers=None, verbose=True):
+    """Plans every map over a pool of worker processes (or in this process if workers is 1).
+
+    The largest files are sent first, so a big map at the end of the list does not leave the other workers idle.
+
+    Returns:
+        list: The timing of every map, in the order of map_paths.
+
+    Raises:
+        ValueError: If two maps have the same name (in different directories).
+    """
+    names = [trajectory_path(output_dir, map_path) for map_path in map_paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Several maps have the same name, their trajectories would overwrite each other")
+    os.makedirs(output_dir, exist_ok=True)
+    order = sorted(map_paths, key=lambda path: os.path.getsize(path) if os.path.exists(path) else 0, reverse=True)
+    results = {}
+    if workers == 1:
+        for map_path in order:
+            results[map_path] = plan_map(map_path, output_dir, semiplane)
+            if verbose:
+                _print_result(results[map_path])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(plan_map, map_path, output_dir, semiplane): map_path for map_path in order}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if verbose:
+                    _print_result(results[futures[future]])
+    return [results[map_path] for map_path in map_paths]
+
+
+def _print_result(result):
+    if result['error'] is None:
+        print(f"{result['map']}: {result['points']} points in {result['plan_seconds']:.3f}s")
+    else:
+        print(f"{result['map']}: {result['error']}")
+
+
+def write_timing(output_dir, results, total_seconds):
+    """Writes timing.csv with one row per map and summary.json with the totals and the same rows."""
+    with open(os.path.join(output_dir, 'timing.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TIMING_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    summary = {
+        'maps': len(results),
+        'failed': sum(1 for r in results if r['error'] is not None),
+        'wall_seconds': total_seconds,
+        'load_seconds': sum(r['load_seconds'] for r in results),
+        'plan_seconds': sum(r['plan_seconds'] for r in results),
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump({'summary': summary, 'maps': results}, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Computes the trajectory of many maps in parallel, without plotting.")
+    parser.add_argument('paths', nargs='+', help="Map files and directories with map files (.dat or .bin)")
+    parser.add_argument('--output', '-o', required=True, help="Directory for the trajectories and the timing")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes. Defaults to the number of CPUs")
+    parser.add_argument('--quiet', action='store_true', help="Only print the summary")
+    args = parser.parse_args()
+
+    map_paths = find_maps(args.paths)
+    if not map_paths:
+        raise SystemExit("No map files found")
+
+    start = time.perf_counter()
+    try:
+        results = plan_maps(map_paths, args.output, args.semiplane, args.workers, verbose=not args.quiet)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    summary = write_timing(args.output, results, time.perf_counter() - start)
+    print(f"Planned {summary['maps'] - summary['failed']}/{summary['maps']} maps in {summary['wall_seconds']:.2f}s "
+          f"({summary['plan_seconds']:.2f}s planning)")
+    if summary['failed']:
+        raise SystemExit(1)
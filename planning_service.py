@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import clean_trajectory_generator as ctg
+from trajectory_cache import TrajectoryCache
+
+
+# LOCAL PLANNING SERVICE ----------------------------------------------------------------------------
+#
+# Keeps compute_trajectory loaded in a long running process, so a client (e.g. the perception stack) pays
+# neither the interpreter startup nor the imports on every request. The service listens on a Unix socket or
+# on a localhost TCP port and speaks length-prefixed binary messages:
+#
+#     message  = length (uint32) + payload, with length = len(payload)
+#     request  = semiplane (int8, 0 for None) + n_right (uint32) + n_left (uint32) + the right and then the left cones
+#     response = status (uint8, STATUS_OK) + n_points (uint32) + the trajectory points
+#              | status (uint8, STATUS_ERROR) + a UTF-8 error message
+#
+# Points are packed x/y float64 pairs. Everything is little endian, like the binary map format.
+#
+# Every connection can send any number of requests, and they are answered in order. Small requests are planned
+# right away in the event loop, since they take less time than sending them to another process, and larger ones
+# are sent to a pool of worker processes, so one big map does not block the other clients. With --cache-size, the
+# responses of the last requests are kept in a TrajectoryCache and repeated cone sets are answered from it.
+
+MESSAGE_LENGTH = struct.Struct('<I')
+REQUEST_HEADER = struct.Struct('<bII')
+RESPONSE_HEADER = struct.Struct('<BI')
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+INLINE_MAX_CONES = 64  # Requests with at most this many cones are planned in the event loop
+
+
+class PlanningError(Exception):
+    """Error returned by the service for a request."""
+
+
+# PROTOCOL ------------------------------------------------------------------------------------------
+
+def _pack_points(points):
+    data = array('d', (c for point in points for c in (point[0], point[1])))
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _unpack_points(buffer, offset, n):
+    data = array('d')
+    data.frombytes(buffer[offset:offset + 16 * n])
+    if sys.byteorder == 'big':
+        data.byteswap()
+    values = iter(data)
+    return [[x, y] for x, y in zip(values, values)]
+
+
+def encode_request(right_points, left_points, semiplane=None):
+    """Returns the payload of a request to plan the given cones."""
+    header = REQUEST_HEADER.pack(semiplane or 0, len(right_points), len(left_points))
+    return header + _pack_points(right_points) + _pack_points(left_points)
+
+
+def decode_request(payload):
+    """Returns the right cones, left cones and semiplane of a request payload.
+
+    Raises:
+        PlanningError: If the payload is malformed.
+    """
+    if len(payload) < REQUEST_HEADER.size:
+        raise PlanningError("Request too short")
+    semiplane, n_right, n_left = REQUEST_HEADER.unpack_from(payload)
+    if semiplane not in (-1, 0, 1):
+        raise PlanningError(f"Invalid semiplane {semiplane}")
+    if len(payload) != REQUEST_HEADER.size + 16 * (n_right + n_left):
+        raise PlanningError(f"Expected {n_right} right and {n_left} left cones, got {len(payload) - REQUEST_HEADER.size} bytes")
+    right_points = _unpack_points(payload, REQUEST_HEADER.size, n_right)
+    left_points = _unpack_points(payload, REQUEST_HEADER.size + 16 * n_right, n_left)
+    return right_points, left_points, semiplane or None
+
+
+def encode_response(mid_points):
+    return RESPONSE_HEADER.pack(STATUS_OK, len(mid_points)) + _pack_points(mid_points)
+
+
+def encode_error(message):
+    return RESPONSE_HEADER.pack(STATUS_ERROR, 0) + message.encode('utf-8')
+
+
+def decode_response(payload):
+    """Returns the trajectory of a response payload.
+
+    Raises:
+        PlanningError: If the service could not plan the request.
+    """
+    status, n = RESPONSE_HEADER.unpack_from(payload)
+    if status != STATUS_OK:
+        raise PlanningError(payload[RESPONSE_HEADER.size:].decode('utf-8', errors='replace'))
+    return _unpack_points(payload, RESPONSE_HEADER.size, n)
+
+
+async def read_message(reader):
+    """Reads one message and returns its payload, or None if the connection was closed before a new message."""
+    try:
+        header = await reader.readexactly(MESSAGE_LENGTH.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        return None
+    length, = MESSAGE_LENGTH.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise PlanningError(f"Message of {length} bytes is larger than {MAX_MESSAGE_SIZE}")
+    return await reader.readexactly(length)
+
+
+def write_message(writer, payload):
+    writer.write(MESSAGE_LENGTH.pack(len(payload)) + payload)
+
+
+# SERVER --------------------------------------------------------------------------------------------
+
+def plan_payload(payload):
+    """Plans a request payload and returns the response payload. compute_trajectory prints are discarded."""
+    try:
+        right_points, left_points, semiplane = decode_request(payload)
+        if not right_points or not left_points:
+            raise PlanningError("Both sides need at least one cone")
+        with contextlib.redirect_stdout(io.StringIO()):
+            mid_points = ctg.compute_trajectory(right_points, left_points, semiplane)
+    except Exception as e:
+        return encode_error(f"{type(e).__name__}: {e}")
+    return encode_response(mid_points)
+
+
+def _init_worker():
+    # Workers never print anything
+    sys.stdout = open(os.devnull, 'w')
+
+
+class PlanningServer:
+    """asyncio server that answers planning requests (see the protocol above).
+
+    Args:
+        workers (int, optional): Number of worker processes for the large requests. Defaults to the number of CPUs.
+        inline_max_cones (int, optional): Requests with at most this many cones are planned in the event loop.
+            Defaults to INLINE_MAX_CONES.
+        cache_size (int, optional): Number of responses kept for repeated requests. Defaults to 0 (no cache).
+    """
+
+    def __init__(self, workers=None, inline_max_cones=INLINE_MAX_CONES, cache_size=0):
+        self.workers = workers
+        self.inline_max_cones = inline_max_cones
+        self.cache = TrajectoryCache(maxsize=cache_size) if cache_size else None
+        self.stats = {'connections': 0, 'requests': 0, 'inline': 0, 'offloaded': 0, 'cached': 0, 'errors': 0}
+        self._executor = None
+        self._server = None
+        self._connections = {}  # Handler task of each open connection, to close them with the server
+
+    async def start(self, unix_path=None, host='127.0.0.1', port=0):
+        """Starts listening on the Unix socket unix_path if given, or on host:port otherwise (port 0 picks a free one).
+
+        Returns:
+            The listening address: the socket path or the (host, port) tuple.
+        """
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self._server = await asyncio.start_unix_server(self._handle, path=unix_path)
+            return unix_path
+        self._server = await asyncio.start_server(self._handle, host=host, port=port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Closing the connections ends their handlers, which wait_closed waits for
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    async def _plan(self, payload):
+        if self.cache is None:
+            return await self._plan_uncached(payload)
+        try:
+            key = self.cache.key(*decode_request(payload))
+        except PlanningError:
+            # Malformed, plan_payload answers with the error
+            key = None
+        response = self.cache.get(key)
+        if response is not None:
+            self.stats['cached'] += 1
+            return response
+        response = await self._plan_uncached(payload)
+        if response[0] == STATUS_OK:
+            self.cache.put(key, response)
+        return response
+
+    async def _plan_uncached(self, payload):
+        if len(payload) >= REQUEST_HEADER.size:
+            _, n_right, n_left = REQUEST_HEADER.unpack_from(payload)
+            if n_right + n_left > self.inline_max_cones:
+                self.stats['offloaded'] += 1
+                return await asyncio.get_running_loop().run_in_executor(self._executor, plan_payload, payload)
+        self.stats['inline'] += 1
+        return plan_payload(payload)
+
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    payload = await read_message(reader)
+                except (PlanningError, asyncio.IncompleteReadError) as e:
+                    # The rest of the stream cannot be trusted, answer and close the connection
+                    self.stats['errors'] += 1
+                    write_message(writer, encode_error(str(e) or "Truncated message"))
+                    break
+                if payload is None:
+                    break
+                response = await self._plan(payload)
+                self.stats['requests'] += 1
+                if response[0] != STATUS_OK:
+                    self.stats['errors'] += 1
+                write_message(writer, response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+# CLIENT --------------------------------------------------------------------------------------------
+
+class PlanningClient:
+    """Connection to a PlanningServer. Requests on the same connection are answered in order."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, unix_path=None, host='127.0.0.1', port=None):
+        """Connects to the Unix socket unix_path if given, or to host:port otherwise."""
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def plan(self, right_points, left_points, semiplane=None):
+        """Sends the cones and returns the trajectory computed by the service.
+
+        Raises:
+            PlanningError: If the service could not plan them.
+        """
+        async with self._lock:
+            write_message(self._writer, encode_request(right_points, left_points, semiplane))
+            await self._writer.drain()
+            payload = await read_message(self._reader)
+        if payload is None:
+            raise ConnectionError("The service closed the connection")
+        return decode_response(payload)
+
+    async def close(self):
+        self._writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self._writer.wait_closed()
+
+
+async def _serve(args):
+    server = PlanningServer(workers=args.workers, inline_max_cones=args.inline_max_cones, cache_size=args.cache_size)
+    address = await server.start(unix_path=args.unix, host=args.host, port=args.port)
+    print(f"Planning service listening on {address}", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves compute_trajectory over a Unix socket or a localhost TCP port.")
+    parser.add_argument('--unix', help="Path of the Unix socket. If not given, it listens on --host:--port")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for the large requests. Defaults to the number of CPUs")
+    parser.add_argument('--inline-max-cones', type=int, default=INLINE_MAX_CONES,
+                        help="Requests with at most this many cones are planned without a worker")
+    parser.add_argument('--cache-size', type=int, default=0, help="Responses kept to answer repeated requests. 0 disables the cache")
+    args = parser.parse_args()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(_serve(args))
@@ -0,0 +1,162 @@
+import numpy as np
+
+from map_format import LEFT_SECTION, RIGHT_SECTION, is_binary_map, iter_point_chunks, load_binary_map
+
+
+# ARRAY BACKED POINT CONTAINERS ---------------------------------------------------------------------
+#
+# Points are usually two element lists [x, y], which costs more than 100 bytes per point (the list and its
+# two float objects) plus the pointer in the outer list. The containers in this file store the points in a
+# contiguous float64 array of shape (n, 2) instead, 16 bytes per point, and slicing them gives views of the
+# same array instead of copies.
+#
+# They behave like a list of points for the functions of clean_trajectory_generator.py,
+# draft_trajectory_generator.py and point_gen.py: len(), iteration, points[i][0], slicing, copy(), + and `in`
+# work as with lists, and indexing with a list of indexes selects several points. A single point is returned as a new list [x, y] of Python floats, so the algorithms do
+# not pay for NumPy scalars, and np.asarray() gives the underlying array without copying it.
+
+# Points converted to lists at once while iterating, to keep the iteration fast without copying the whole array
+_ITER_CHUNK = 4096
+
+
+class PointArray:
+    """Sequence of 2D points backed by a float64 NumPy array of shape (n, 2).
+
+    Args:
+        points (optional): The points, as a list of points [x, y], an array of shape (n, 2) or another PointArray.
+            Arrays of float64 (like the memory maps of load_binary_map) are used without copying them.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, points=()):
+        data = points._data if isinstance(points, PointArray) else np.asarray(points, dtype=np.float64)
+        if data.size == 0:
+            data = data.reshape(0, 2)
+        if data.ndim != 2 or data.shape[1] != 2:
+            raise ValueError(f"Expected points of shape (n, 2), got {data.shape}")
+        self._data = data
+
+    @property
+    def array(self):
+        """The underlying array of shape (n, 2)."""
+        return self._data
+
+    @property
+    def xs(self):
+        """View of the x coordinates."""
+        return self._data[:, 0]
+
+    @property
+    def ys(self):
+        """View of the y coordinates."""
+        return self._data[:, 1]
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or dtype == self._data.dtype:
+            return self._data.copy() if copy else self._data
+        return self._data.astype(dtype)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return type(self)(self._data[index])
+        if isinstance(index, (int, np.integer)):
+            return self._data[index].tolist()
+        # A sequence of indexes or a boolean mask selects several points, like NumPy fancy indexing
+        return type(self)(self._data[np.asarray(index)])
+
+    def __setitem__(self, index, value):
+        self._data[index] = value
+
+    def __iter__(self):
+        for start in range(0, len(self._data), _ITER_CHUNK):
+            yield from self._data[start:start + _ITER_CHUNK].tolist()
+
+    def __contains__(self, point):
+        return bool((self._data == np.asarray(point, dtype=np.float64)).all(axis=1).any())
+
+    def __add__(self, other):
+        return type(self)(np.concatenate([self._data, PointArray(other)._data]))
+
+    def __radd__(self, other):
+        return type(self)(np.concatenate([PointArray(other)._data, self._data]))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._data.tolist() if len(self) <= 6 else f'<{len(self)} points>'})"
+
+    def copy(self):
+        """Returns a copy that does not share the array."""
+        return type(self)(self._data.copy())
+
+    def tolist(self):
+        """Returns the points as a list of points [x, y]."""
+        return self._data.tolist()
+
+
+class Trajectory(PointArray):
+    """PointArray for the trajectory points (mid_points) given by compute_trajectory."""
+
+    __slots__ = ()
+
+    def path_length(self):
+        """Returns the length of the trajectory."""
+        return float(np.sqrt((np.diff(self._data, axis=0) ** 2).sum(axis=1)).sum())
+
+
+class ConeSet:
+    """The right and left cones of a map, each one a PointArray.
+
+    It unpacks like the tuple returned by deserialize_points, so `right_points, left_points = cone_set`
+    and `compute_trajectory(*cone_set)` work.
+
+    Args:
+        right_points: The right cones, in any form accepted by PointArray.
+        left_points: The left cones, in any form accepted by PointArray.
+    """
+
+    __slots__ = ('right', 'left')
+
+    def __init__(self, right_points=(), left_points=()):
+        self.right = PointArray(right_points)
+        self.left = PointArray(left_points)
+
+    def __iter__(self):
+        yield self.right
+        yield self.left
+
+    def __repr__(self):
+        return f"ConeSet({len(self.right)} right cones, {len(self.left)} left cones)"
+
+    @property
+    def nbytes(self):
+        return self.right.nbytes + self.left.nbytes
+
+    def copy(self):
+        return ConeSet(self.right.copy(), self.left.copy())
+
+
+def load_cone_set(file_path, chunk_size=65536):
+    """Loads a map file into a ConeSet.
+
+    Binary maps are memory mapped without copying them. Text maps are parsed in chunks with iter_point_chunks
+    and each chunk is packed into an array right away, so the cones are never held as lists all at once.
+
+    Raises:
+        MapFormatError: If a binary map is malformed.
+        MapLineError: If a line of a text map is not made of exactly 2 numbers.
+    """
+    if is_binary_map(file_path):
+        return ConeSet(*load_binary_map(file_path))
+
+    chunks = {RIGHT_SECTION: [], LEFT_SECTION: []}
+    for section, chunk in iter_point_chunks(file_path, chunk_size):
+        chunks[section].append(np.array(chunk, dtype=np.float64).reshape(-1, 2))
+    right, left = (np.concatenate(c) if c else np.empty((0, 2)) for c in (chunks[RIGHT_SECTION], chunks[LEFT_SECTION]))
+    return ConeSet(right, left)
@@ -1,6 +1,8 @@
+import argparse
 import math
 import random
-import matplotlib.pyplot as plt
+
+from map_format import BINARY_MAP_EXTENSION, pack_header
 
 
 # This script generates a track defined by cone coordinates.
@@ -104,28 +106,51 @@ def get_straight_path():
     return {'straight_r': r_points, 'straight_l': l_points}
     
 
+def serialize_points(filename: str, right_points, left_points):
+    """Writes the cones in the RIGHT_POINTS/LEFT_POINTS text format read by deserialize_points."""
+    with open(filename, 'w') as f:
+        # Write right points
+        f.write("RIGHT_POINTS\n")
+        for point in right_points:
+            f.write(f"{point[0]} {point[1]}\n")
+
+        # Write left points
+        f.write("LEFT_POINTS\n")
+        for point in left_points:
+            f.write(f"{point[0]} {point[1]}\n")
+
+
+def serialize_points_binary(filename: str, right_points, left_points):
+    """Writes the cones in the binary map format described in map_format.py (packed float64 x/y pairs after a header with the counts)."""
+    import numpy as np
+
+    with open(filename, 'wb') as f:
+        f.write(pack_header(len(right_points), len(left_points)))
+        for points in (right_points, left_points):
+            # Lists of points and PointArray (see point_containers.py) alike, as little endian float64 pairs
+            f.write(np.asarray(points, dtype='<f8').reshape(-1, 2).tobytes())
+
+
+def write_map_file(filename: str, right_points, left_points):
+    """Writes the cones in the binary format if the filename ends with BINARY_MAP_EXTENSION, or in the text format otherwise."""
+    if filename.endswith(BINARY_MAP_EXTENSION):
+        serialize_points_binary(filename, right_points, left_points)
+    else:
+        serialize_points(filename, right_points, left_points)
+
+
 def gen_map(filename: str = None, plot: bool = True):
     map = {}
     map.update(get_first_curve())
     map.update(get_second_curve())
     map.update(get_straight_path())
 
+    right_points = [point for key in map if key.endswith('_r') for point in map[key]]
+    left_points = [point for key in map if key.endswith('_l') for point in map[key]]
+
     try:
         if filename is not None:
-            with open(filename, 'w') as f:
-                # Write right points
-                f.write("RIGHT_POINTS\n")
-                for key in map:
-                    if key.endswith('_r'):
-                        for point in map[key]:
-                            f.write(f"{point[0]} {point[1]}\n")
-                
-                # Write left points
-                f.write("LEFT_POINTS\n")
-                for key in map:
-                    if key.endswith('_l'):
-                        for point in map[key]:
-                            f.write(f"{point[0]} {point[1]}\n")
+            write_map_file(filename, right_points, left_points)
             print("Successfully serialized the map points into " + filename)
         else:
             print("No filename given for serializing")
@@ -138,33 +163,11 @@ def gen_map(filename: str = None, plot: bool = True):
     finally:
         print("Plotting the map")
         if plot:
-            # Create a set to track added labels so that they don't repeat
-            added_labels = set()
-
-            # Plot right points in yellow
-            for key in map:
-                if key.endswith('_r'):
-                    x, y = zip(*map[key])
-                    plt.scatter(x, y, color='yellow', label='Right Points' if 'Right Points' not in added_labels else "")
-                    added_labels.add('Right Points')
-
-            # Plot left points in blue
-            for key in map:
-                if key.endswith('_l'):
-                    x, y = zip(*map[key])
-                    plt.scatter(x, y, color='blue', label='Left Points' if 'Left Points' not in added_labels else "")
-                    added_labels.add('Left Points')
-
-            plt.xlabel('X')
-            plt.ylabel('Y')
-            plt.title('Map Points')
-            plt.grid(True)
-            plt.axis('equal')
-            plt.legend()
-            plt.show()
+            from visualization import plot_map
+            plot_map(right_points, left_points)
 
-def gen_circular_map(radius: float, num_cones: int, filename: str = None, plot: bool = True):
-    """Generates a circular map with the given radius and number of cones."""
+def get_circular_track(radius: float, num_cones: int):
+    """Returns the cones of a circular track with the given inner radius, 3m wide and with num_cones cones on each side."""
     map = {'circular_r': [], 'circular_l': []}
     
     angle_increment = 360.0 / num_cones
@@ -183,18 +186,15 @@ def gen_circular_map(radius: float, num_cones: int, filename: str = None, plot:
         y_outer = (radius + 3) * math.sin(angle_radians)
         map['circular_l'].append([x_outer, y_outer])
 
+    return map
+
+def gen_circular_map(radius: float, num_cones: int, filename: str = None, plot: bool = True):
+    """Generates a circular map with the given radius and number of cones."""
+    map = get_circular_track(radius, num_cones)
+
     try:
         if filename is not None:
-            with open(filename, 'w') as f:
-                # Write right points
-                f.write("RIGHT_POINTS\n")
-                for point in map['circular_r']:
-                    f.write(f"{point[0]} {point[1]}\n")
-                
-                # Write left points
-                f.write("LEFT_POINTS\n")
-                for point in map['circular_l']:
-                    f.write(f"{point[0]} {point[1]}\n")
+            write_map_file(filename, map['circular_r'], map['circular_l'])
             print("Successfully serialized the map points into " + filename)
         else:
             print("No filename given for serializing")
@@ -206,36 +206,234 @@ def gen_circular_map(radius: float, num_cones: int, filename: str = None, plot:
     finally:
         print("Plotting the map")
         if plot:
-            # Plot right points in yellow
-            x, y = zip(*map['circular_r'])
-            plt.scatter(x, y, color='yellow', label='Right Points')
+            from visualization import plot_map
+            plot_map(map['circular_r'], map['circular_l'])
 
-            # Plot left points in blue
-            x, y = zip(*map['circular_l'])
-            plt.scatter(x, y, color='blue', label='Left Points')
 
-            plt.xlabel('X')
-            plt.ylabel('Y')
-            plt.title('Map Points')
-            plt.grid(True)
-            plt.axis('equal')
-            plt.legend()
-            plt.show()
+# PROCEDURAL TRACKS ------------------------------------------------------------------------------------
+#
+# Long tracks are described as a sequence of segments (arcs, straights, slaloms and hairpins) that are placed
+# one after the other, each one starting at the position and heading where the previous one ended. The cones
+# of each segment are computed with NumPy over its whole centreline at once, in chunks of at most chunk_size
+# cones, so tracks with millions of cones can be streamed to disk without holding them in memory.
+#
+# Like gen_map, tracks start at (0, 0) pointing in the positive x axis, with the right cones on the right of
+# the direction of travel.
+
+_SLALOM_BLOCK = 4096
+HAIRPIN_CLEARANCE = 20.0  # Minimum length of the straights around a pair of hairpins of random_segments, in meters
+
+def arc(radius: float, angle: float, width: float = 3, spacing: float = 5):
+    """Arc of the given centreline radius turning angle degrees, to the left if positive and to the right if negative."""
+    return {'type': 'arc', 'radius': radius, 'angle': angle, 'width': width, 'spacing': spacing}
+
+def straight(length: float, width: float = 3, spacing: float = 5):
+    """Straight section of the given length with cones every spacing meters."""
+    return {'type': 'straight', 'length': length, 'width': width, 'spacing': spacing}
+
+def slalom(length: float, min_spacing: float = 7.5, max_spacing: float = 12, min_width: float = 3, max_width: float = 5):
+    """Straight section like the one of gen_map: random cone spacing and a track width that varies randomly at every cone."""
+    return {'type': 'slalom', 'length': length, 'min_spacing': min_spacing, 'max_spacing': max_spacing,
+            'min_width': min_width, 'max_width': max_width}
+
+def hairpin(radius: float = 6, direction: int = 1, width: float = 3, spacing: float = 3):
+    """180-degree turn of the given centreline radius, to the left if direction is +1 and to the right if it is -1."""
+    return arc(radius, 180 * direction, width, spacing)
+
+def random_segments(num_segments: int, seed: int = None):
+    """Returns a random sequence of segments.
+
+    Turns are chosen so that the heading stays within 90 degrees of the positive x axis, and hairpins always come
+    in pairs that turn back to the original heading, so the track keeps advancing and does not cross itself. The
+    heading is steered back to the positive x axis before a pair of hairpins, and a pair is only added if both
+    hairpins fit in num_segments.
+
+    A pair moves the track sideways by four hairpin radii, and its hairpins bulge forwards and backwards along
+    the x axis, so it is put between two straights of at least HAIRPIN_CLEARANCE meters. The rest of the track,
+    other pairs included, is then too far along the x axis to be crossed by it.
+    """
+    rng = random.Random(seed)
+    segments = []
+    heading = 0.0
+    while len(segments) < num_segments:
+        kind = rng.choice(('arc', 'straight', 'slalom', 'hairpins'))
+        if kind == 'arc':
+            angle = rng.uniform(20, 90)
+            # Turn back towards the positive x axis if the track is already turning a lot
+            direction = -1 if heading + angle > 90 else (1 if heading - angle < -90 else rng.choice((-1, 1)))
+            heading += direction * angle
+            segments.append(arc(rng.uniform(9, 40), direction * angle))
+        elif kind == 'straight':
+            segments.append(straight(rng.uniform(20, 200)))
+        elif kind == 'slalom':
+            segments.append(slalom(rng.uniform(40, 150)))
+        else:
+            # The pair starts along the positive x axis, so an arc steers the heading back to 0 first if needed
+            steer = abs(heading) >= 1e-9
+            if len(segments) + 4 + steer > num_segments:
+                continue  # The pair and its straights do not fit, another kind of segment is chosen
+            if steer:
+                segments.append(arc(rng.uniform(9, 40), -heading))
+                heading = 0.0
+            direction = rng.choice((-1, 1))
+            segments.append(straight(rng.uniform(HAIRPIN_CLEARANCE, 2 * HAIRPIN_CLEARANCE)))
+            segments.append(hairpin(direction=direction))
+            segments.append(hairpin(direction=-direction))
+            segments.append(straight(rng.uniform(HAIRPIN_CLEARANCE, 2 * HAIRPIN_CLEARANCE)))
+    return segments
+
+def _segment_centreline(segment, pose, rng, chunk_size):
+    """Yields chunks (x, y, heading, half_width) of the centreline points of a segment where cones are placed.
+
+    The start of the segment is not included, since it is the end of the previous one. Returns the end pose (x, y, heading).
+    """
+    import numpy as np
+
+    x0, y0, heading0 = pose
+    kind = segment['type']
+
+    if kind == 'slalom':
+        # Random spacings are drawn in blocks whose size only depends on the segment, so the track does not depend on chunk_size
+        s_done = 0.0
+        length = segment['length']
+        while s_done < length:
+            block = min(_SLALOM_BLOCK, math.ceil((length - s_done) / segment['min_spacing']) + 1)
+            s = s_done + np.cumsum(rng.uniform(segment['min_spacing'], segment['max_spacing'], block))
+            half_width = rng.uniform(segment['min_width'], segment['max_width'], block) / 2
+            inside = s < length
+            if not inside.all():
+                # Like random_partition, the last cones are at the end of the segment
+                end = np.count_nonzero(inside)
+                if end and length - s[end - 1] < segment['min_spacing'] / 2:
+                    end -= 1
+                s[end] = length
+                s, half_width = s[:end + 1], half_width[:end + 1]
+            for start in range(0, len(s), chunk_size):
+                part = s[start:start + chunk_size]
+                yield (x0 + part * np.cos(heading0), y0 + part * np.sin(heading0), np.full(len(part), heading0),
+                       half_width[start:start + chunk_size])
+            s_done = s[-1]
+        return (x0 + length * np.cos(heading0), y0 + length * np.sin(heading0), heading0)
+
+    if kind == 'straight':
+        length = segment['length']
+        curvature = 0.0
+    else:
+        length = segment['radius'] * math.radians(abs(segment['angle']))
+        curvature = math.copysign(1 / segment['radius'], segment['angle'])
+
+    num_cones = max(1, round(length / segment['spacing']))
+    for start in range(1, num_cones + 1, chunk_size):
+        s = np.arange(start, min(start + chunk_size, num_cones + 1)) * (length / num_cones)
+        if curvature == 0:
+            x = x0 + s * np.cos(heading0)
+            y = y0 + s * np.sin(heading0)
+        else:
+            x = x0 + (np.sin(heading0 + curvature * s) - np.sin(heading0)) / curvature
+            y = y0 - (np.cos(heading0 + curvature * s) - np.cos(heading0)) / curvature
+        yield (x, y, heading0 + curvature * s, np.full(len(s), segment['width'] / 2))
+
+    heading = heading0 + curvature * length
+    if curvature == 0:
+        return (x0 + length * np.cos(heading0), y0 + length * np.sin(heading0), heading)
+    return (x0 + (np.sin(heading) - np.sin(heading0)) / curvature, y0 - (np.cos(heading) - np.cos(heading0)) / curvature, heading)
+
+def iter_track_chunks(segments, seed: int = None, chunk_size: int = 65536, start_width: float = 3):
+    """Places the segments one after the other and yields the cones of the track in chunks.
+
+    Args:
+        segments (list): Segments created with arc, straight, slalom and hairpin.
+        seed (int, optional): Seed of the random spacings and widths of the slaloms. The same seed gives the same track.
+        chunk_size (int, optional): Maximum number of cones per side of each chunk. Defaults to 65536.
+        start_width (float, optional): Track width at the starting line. Defaults to 3.
+
+    Yields:
+        tuple: Two numpy arrays of shape (n, 2) with the right and left cones of the chunk. Both have the same number of cones.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    half = start_width / 2
+    yield np.array([[0.0, -half]]), np.array([[0.0, half]])
+
+    pose = (0.0, 0.0, 0.0)
+    for segment in segments:
+        centreline = _segment_centreline(segment, pose, rng, chunk_size)
+        while True:
+            try:
+                x, y, heading, half_width = next(centreline)
+            except StopIteration as stop:
+                pose = stop.value
+                break
+            # Unit vector pointing to the right of the direction of travel
+            nx, ny = np.sin(heading) * half_width, -np.cos(heading) * half_width
+            yield np.column_stack((x + nx, y + ny)), np.column_stack((x - nx, y - ny))
+
+def get_procedural_track(segments, seed: int = None):
+    """Returns the right and left cones of a procedural track as two numpy arrays of shape (n, 2)."""
+    import numpy as np
+
+    chunks = list(iter_track_chunks(segments, seed))
+    return np.concatenate([r for r, _ in chunks]), np.concatenate([l for _, l in chunks])
+
+def gen_procedural_map(segments, filename: str, seed: int = None, chunk_size: int = 65536):
+    """Streams the cones of a procedural track to a map file, without holding the whole track in memory.
+
+    The binary format is used if the filename ends with BINARY_MAP_EXTENSION, and the text format otherwise.
+    Both formats store all the right cones before the left cones, so the track is generated twice with the
+    same seed: once to write the right cones and once to write the left cones.
+
+    Returns:
+        int: The number of cones per side.
+    """
+    binary = filename.endswith(BINARY_MAP_EXTENSION)
+    with open(filename, 'wb' if binary else 'w') as f:
+        if binary:
+            f.write(pack_header(0, 0))  # Placeholder until the number of cones is known
+        num_cones = 0
+        for side, section in ((0, "RIGHT_POINTS"), (1, "LEFT_POINTS")):
+            if not binary:
+                f.write(section + "\n")
+            num_cones = 0
+            for chunk in iter_track_chunks(segments, seed, chunk_size):
+                points = chunk[side]
+                num_cones += len(points)
+                if binary:
+                    f.write(points.astype('<f8').tobytes())
+                else:
+                    f.write("".join(f"{x} {y}\n" for x, y in points.tolist()))
+        if binary:
+            f.seek(0)
+            f.write(pack_header(num_cones, num_cones))
+    return num_cones
+
+
+def _map_filename(filename):
+    if filename == '':
+        return None #This does not save it, only plot it
+    if "." not in filename:
+        return filename + ".dat" # Use the .bin extension to save it in the binary format
+    return filename
 
 
 if __name__ == "__main__":
-    random.seed(3)  # Set a seed for the random numbers
-    filename = input("Please enter the filename to save the map points: ")
-    if filename == '':
-        filename = None #This does not save it, only plot it
-    if filename is not None and "." not in filename:
-        filename = filename + ".dat"
-    gen_map(filename)
+    parser = argparse.ArgumentParser(description="Generates the example map and a circular map. Filenames that are not given are asked interactively.")
+    parser.add_argument('map_file', nargs='?', help="File to save the map points ('' to only plot it)")
+    parser.add_argument('circular_file', nargs='?', help="File to save the circular map points ('' to only plot it)")
+    parser.add_argument('--seed', type=int, default=3, help="Seed for the random numbers")
+    parser.add_argument('--radius', type=float, default=20, help="Radius of the circular map")
+    parser.add_argument('--num-cones', type=int, default=20, help="Number of cones per side of the circular map")
+    parser.add_argument('--no-plot', action='store_true', help="Do not plot the maps")
+    args = parser.parse_args()
+
+    random.seed(args.seed)  # Set a seed for the random numbers
+    filename = args.map_file
+    if filename is None:
+        filename = input("Please enter the filename to save the map points: ")
+    gen_map(_map_filename(filename), plot=not args.no_plot)
 
     # Also create a circular map file
-    circular_filename = input("Please enter the filename to save the circular map points: ")
-    if circular_filename == '':
-        circular_filename = None #This does not save it, only plot it
-    if circular_filename is not None and "." not in circular_filename:
-        circular_filename = circular_filename + ".dat"
-    gen_circular_map(radius=20, num_cones=20, filename=circular_filename)
+    circular_filename = args.circular_file
+    if circular_filename is None:
+        circular_filename = input("Please enter the filename to save the circular map points: ")
+    gen_circular_map(radius=args.radius, num_cones=args.num_cones, filename=_map_filename(circular_filename), plot=not args.no_plot)
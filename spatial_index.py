@@ -0,0 +1,432 @@
+import math
+
+
+# SPATIAL INDEXES FOR THE CONE ORDERING ----------------------------------------------------------
+#
+# The ordering functions in clean_trajectory_generator.py repeatedly ask for "the closest remaining
+# cone to the last ordered one" and then remove it. Doing that with min() and list.remove() over the
+# whole list is quadratic, so the indexes in this file answer the same query in logarithmic
+# (ConeKDTree) or near constant (ConeHashGrid) time while supporting deletions.
+#
+# To give exactly the same ordering as the brute force version, distances are computed with the
+# same expression as euclidean_norm and ties are broken by the position of the point in the list
+# that was used to build the index (min() returns the first minimal element).
+
+
+class ConeKDTree:
+    """2D KD-tree over a list of points that supports nearest neighbour queries and deletions.
+
+    The tree is built once and never rebalanced. Removing a point only marks it as deleted and
+    shrinks the bounding boxes of the alive points of every subtree in its path, so subtrees that
+    are empty or too far away are skipped during the queries. Points with NaN coordinates are kept
+    out of the tree, since they can never be the closest point (see nearest).
+
+    Args:
+        points (list): A list of points [x, y]. The indexes returned by the queries refer to this list.
+    """
+
+    def __init__(self, points):
+        n = len(points)
+        self._xs = [p[0] for p in points]
+        self._ys = [p[1] for p in points]
+        self._removed = [False] * n
+        self._size = n
+        self._first = 0            # No point below this index is alive
+        self._node_of = [-1] * n   # Node that stores each point, -1 for the points out of the tree
+
+        indexes = [i for i in range(n) if self._xs[i] == self._xs[i] and self._ys[i] == self._ys[i]]
+        m = len(indexes)
+        # Node arrays. Every node stores exactly one point
+        self._point = [0] * m      # Index of the point stored in the node
+        self._left = [-1] * m
+        self._right = [-1] * m
+        self._parent = [-1] * m
+        self._alive = [True] * m
+        # Bounding box of the alive points of each subtree, inf/-inf when the subtree is empty
+        self._minx = [0.0] * m
+        self._maxx = [0.0] * m
+        self._miny = [0.0] * m
+        self._maxy = [0.0] * m
+        self._root = -1
+
+        if m:
+            self._build(indexes)
+
+    def _build(self, indexes):
+        coords = (self._xs, self._ys)
+        next_node = 0
+        # Each entry: (indexes of the subtree, depth, parent node, True if it is the left child)
+        stack = [(indexes, 0, -1, False)]
+        while stack:
+            idx, depth, parent, is_left = stack.pop()
+            c = coords[depth % 2]
+            # Sorting by (coordinate, index) keeps the build deterministic when coordinates repeat
+            idx.sort(key=lambda i: (c[i], i))
+            mid = len(idx) // 2
+
+            node = next_node
+            next_node += 1
+            point = idx[mid]
+            self._point[node] = point
+            self._parent[node] = parent
+            self._node_of[point] = node
+
+            if parent == -1:
+                self._root = node
+            elif is_left:
+                self._left[parent] = node
+            else:
+                self._right[parent] = node
+
+            if mid > 0:
+                stack.append((idx[:mid], depth + 1, node, True))
+            if mid + 1 < len(idx):
+                stack.append((idx[mid + 1:], depth + 1, node, False))
+
+        # Children always get a higher node number than their parent, so the boxes can be computed bottom-up
+        for node in range(len(self._point) - 1, -1, -1):
+            self._update_box(node)
+
+    def _update_box(self, node):
+        """Recomputes the bounding box of the alive points of a subtree from its root and its children.
+
+        Returns:
+            bool: True if the bounding box changed.
+        """
+        if self._alive[node]:
+            i = self._point[node]
+            minx = maxx = self._xs[i]
+            miny = maxy = self._ys[i]
+        else:
+            minx = miny = math.inf
+            maxx = maxy = -math.inf
+        for child in (self._left[node], self._right[node]):
+            if child != -1:
+                if self._minx[child] < minx: minx = self._minx[child]
+                if self._maxx[child] > maxx: maxx = self._maxx[child]
+                if self._miny[child] < miny: miny = self._miny[child]
+                if self._maxy[child] > maxy: maxy = self._maxy[child]
+        if (minx, maxx, miny, maxy) == (self._minx[node], self._maxx[node], self._miny[node], self._maxy[node]):
+            return False
+        self._minx[node] = minx
+        self._maxx[node] = maxx
+        self._miny[node] = miny
+        self._maxy[node] = maxy
+        return True
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        """Returns an independent copy of the tree that shares the (read only) structure but not the deletions."""
+        other = ConeKDTree.__new__(ConeKDTree)
+        other.__dict__.update(self.__dict__)
+        for name in ('_removed', '_alive', '_minx', '_maxx', '_miny', '_maxy'):
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    def remove(self, i):
+        """Removes the point with index i from the tree. Removing an already removed point does nothing."""
+        if self._removed[i]:
+            return
+        self._removed[i] = True
+        self._size -= 1
+        node = self._node_of[i]
+        if node == -1:
+            return
+        self._alive[node] = False
+        # Ancestors only need updating while the boxes keep shrinking
+        while node != -1 and self._update_box(node):
+            node = self._parent[node]
+
+    def nearest(self, point):
+        """Finds the closest alive point to the given point.
+
+        Args:
+            point (list or tuple): The query point [x, y].
+
+        Returns:
+            int: The index of the closest point, or None if the tree is empty. If several points are at
+            the same distance, the one with the lowest index is returned.
+        """
+        if self._size == 0:
+            return None
+
+        qx, qy = point[0], point[1]
+        xs, ys = self._xs, self._ys
+
+        # min() keeps its first element when its distance is NaN, since nothing compares lower than NaN
+        while self._removed[self._first]:
+            self._first += 1
+        first = self._first
+        d = ((xs[first] - qx) ** 2 + (ys[first] - qy) ** 2) ** 0.5
+        if d != d:
+            return first
+
+        pts, lefts, rights, alive = self._point, self._left, self._right, self._alive
+        minx, maxx, miny, maxy = self._minx, self._maxx, self._miny, self._maxy
+        # Starting from the first alive point, the result is still an alive point if all of them are infinitely far
+        best_d = math.inf
+        best_i = first
+
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, box_d = stack.pop()
+            # Subtrees are pushed together with the distance to their bounding box, so they can be
+            # discarded if a closer point was found in the meantime. The small tolerance keeps
+            # subtrees whose points could tie with the current best once rounding is involved.
+            if box_d > best_d * (1 + 1e-12):
+                continue
+
+            if alive[node]:
+                i = pts[node]
+                d = ((xs[i] - qx) ** 2 + (ys[i] - qy) ** 2) ** 0.5
+                if d < best_d or (d == best_d and i < best_i):
+                    best_d = d
+                    best_i = i
+
+            # Visit the closest child first
+            children = []
+            for child in (lefts[node], rights[node]):
+                if child != -1 and minx[child] <= maxx[child]:
+                    dx = max(minx[child] - qx, 0.0, qx - maxx[child])
+                    dy = max(miny[child] - qy, 0.0, qy - maxy[child])
+                    children.append(((dx * dx + dy * dy) ** 0.5, child))
+            if len(children) == 2 and children[0][0] < children[1][0]:
+                children.reverse()
+            for child_d, child in children:
+                stack.append((child, child_d))
+
+        return best_i
+
+
+class ConeHashGrid:
+    """Uniform grid of square cells over a list of points, stored as a dictionary from cell to points.
+
+    It has the same interface and gives the same results as ConeKDTree (nearest, remove, copy), and also answers
+    "points within a radius" and "k nearest points" queries. Queries only look at the cells around the query
+    point, in rings of growing size, so they take near constant time when the points are spread along a track
+    and the cell size is a small multiple of the distance between neighbouring points. Removed (visited) points are
+    taken out of their cells, so they cost nothing in later queries.
+
+    Points with NaN coordinates are kept out of the grid like in ConeKDTree, and points with infinite
+    coordinates are checked in every query.
+
+    Args:
+        points (list): A list of points [x, y]. The indexes returned by the queries refer to this list.
+        cell_size (float, optional): Side of the cells. Defaults to about 8 times the distance between
+            neighbouring points, see estimate_cell_size.
+    """
+
+    def __init__(self, points, cell_size=None):
+        n = len(points)
+        self._xs = [p[0] for p in points]
+        self._ys = [p[1] for p in points]
+        self._removed = [False] * n
+        self._size = n
+        self._first = 0            # No point below this index is alive
+        self.cell_size = cell_size if cell_size is not None else estimate_cell_size(self._xs, self._ys)
+
+        self._cells = {}           # Alive points of each cell, sorted by index
+        self._unbounded = []       # Alive points with infinite coordinates
+        self._cell_of = [None] * n
+        s = self.cell_size
+        for i in range(n):
+            x, y = self._xs[i], self._ys[i]
+            if x != x or y != y:
+                continue
+            if math.isinf(x) or math.isinf(y):
+                self._unbounded.append(i)
+                continue
+            cell = (math.floor(x / s), math.floor(y / s))
+            self._cell_of[i] = cell
+            self._cells.setdefault(cell, []).append(i)
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        """Returns an independent copy of the grid that shares the points but not the deletions."""
+        other = ConeHashGrid.__new__(ConeHashGrid)
+        other.__dict__.update(self.__dict__)
+        other._removed = self._removed.copy()
+        other._cells = {cell: indexes.copy() for cell, indexes in self._cells.items()}
+        other._unbounded = self._unbounded.copy()
+        return other
+
+    def add(self, point):
+        """Adds a point to the grid, in constant time. The cell size is not changed, so a grid meant to grow
+        should be created with an explicit cell_size. Copies share the coordinates with the grid they come from,
+        so points must not be added to a grid that has copies in use.
+
+        Returns:
+            int: The index of the new point.
+        """
+        i = len(self._xs)
+        x, y = point[0], point[1]
+        self._xs.append(x)
+        self._ys.append(y)
+        self._removed.append(False)
+        self._cell_of.append(None)
+        self._size += 1
+        if x != x or y != y:
+            return i
+        if math.isinf(x) or math.isinf(y):
+            self._unbounded.append(i)
+            return i
+        cell = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+        self._cell_of[i] = cell
+        self._cells.setdefault(cell, []).append(i)
+        return i
+
+    def remove(self, i):
+        """Removes the point with index i from the grid. Removing an already removed point does nothing."""
+        if self._removed[i]:
+            return
+        self._removed[i] = True
+        self._size -= 1
+        cell = self._cell_of[i]
+        if cell is not None:
+            indexes = self._cells[cell]
+            indexes.remove(i)
+            if not indexes:
+                del self._cells[cell]
+        elif i in self._unbounded:
+            self._unbounded.remove(i)
+
+    def _rings(self, qx, qy):
+        """Yields, for rings of growing size around the cell of the query point, the alive points in the ring and the
+        smallest distance from the query point to any point outside of the rings yielded so far.
+
+        When the rings would have more cells than there are occupied cells, or the query point is not finite, the
+        remaining alive points are yielded all together, with an infinite distance to the points left.
+        """
+        cells = self._cells
+        if not (math.isfinite(qx) and math.isfinite(qy)):
+            yield self._unbounded + [i for indexes in cells.values() for i in indexes], math.inf
+            return
+
+        s = self.cell_size
+        cx, cy = math.floor(qx / s), math.floor(qy / s)
+        margin = min(qx - cx * s, (cx + 1) * s - qx, qy - cy * s, (cy + 1) * s - qy)
+
+        yield self._unbounded + cells.get((cx, cy), []), margin
+        ring = 1
+        while 8 * ring <= len(cells):
+            found = []
+            for dx in range(-ring, ring + 1):
+                found.extend(cells.get((cx + dx, cy - ring), ()))
+                found.extend(cells.get((cx + dx, cy + ring), ()))
+            for dy in range(-ring + 1, ring):
+                found.extend(cells.get((cx - ring, cy + dy), ()))
+                found.extend(cells.get((cx + ring, cy + dy), ()))
+            yield found, ring * s + margin
+            ring += 1
+
+        # Every cell farther than ring - 1
+        found = []
+        for (x, y), indexes in cells.items():
+            if max(abs(x - cx), abs(y - cy)) >= ring:
+                found.extend(indexes)
+        yield found, math.inf
+
+    def nearest(self, point):
+        """Finds the closest alive point to the given point, like ConeKDTree.nearest.
+
+        Args:
+            point (list or tuple): The query point [x, y].
+
+        Returns:
+            int: The index of the closest point, or None if the grid is empty. If several points are at
+            the same distance, the one with the lowest index is returned.
+        """
+        if self._size == 0:
+            return None
+
+        qx, qy = point[0], point[1]
+        xs, ys = self._xs, self._ys
+
+        # min() keeps its first element when its distance is NaN, since nothing compares lower than NaN
+        while self._removed[self._first]:
+            self._first += 1
+        first = self._first
+        d = ((xs[first] - qx) ** 2 + (ys[first] - qy) ** 2) ** 0.5
+        if d != d:
+            return first
+
+        # Starting from the first alive point, the result is still an alive point if all of them are infinitely far
+        best_d = math.inf
+        best_i = first
+        for indexes, outside_d in self._rings(qx, qy):
+            for i in indexes:
+                d = ((xs[i] - qx) ** 2 + (ys[i] - qy) ** 2) ** 0.5
+                if d < best_d or (d == best_d and i < best_i):
+                    best_d = d
+                    best_i = i
+            # The small tolerance keeps looking for points that could tie with the current best once rounding is involved
+            if outside_d > best_d * (1 + 1e-12):
+                break
+        return best_i
+
+    def within(self, point, radius):
+        """Finds the alive points at a distance of at most radius from the given point.
+
+        Returns:
+            list: The indexes of the points, sorted by distance and then by index.
+        """
+        qx, qy = point[0], point[1]
+        xs, ys = self._xs, self._ys
+        found = []
+        for indexes, outside_d in self._rings(qx, qy):
+            for i in indexes:
+                d = ((xs[i] - qx) ** 2 + (ys[i] - qy) ** 2) ** 0.5
+                if d <= radius:
+                    found.append((d, i))
+            if outside_d > radius:
+                break
+        found.sort()
+        return [i for _, i in found]
+
+    def k_nearest(self, point, k):
+        """Finds the k closest alive points to the given point (or all of them if there are less than k).
+
+        Returns:
+            list: The indexes of the points, sorted by distance and then by index.
+        """
+        qx, qy = point[0], point[1]
+        xs, ys = self._xs, self._ys
+        found = []
+        if k <= 0:
+            return found
+        for indexes, outside_d in self._rings(qx, qy):
+            for i in indexes:
+                found.append((((xs[i] - qx) ** 2 + (ys[i] - qy) ** 2) ** 0.5, i))
+            if len(found) >= k:
+                found.sort()
+                del found[k:]
+                if outside_d > found[-1][0] * (1 + 1e-12):
+                    break
+        found.sort()
+        return [i for _, i in found]
+
+
+def estimate_cell_size(xs, ys):
+    """Estimates a cell size for ConeHashGrid of about 8 times the distance between neighbouring points.
+
+    The points are first put in a coarse grid of about sqrt(n) x sqrt(n) cells. Points spread along a track
+    only occupy a line of those cells, so the length of the track is roughly the number of occupied cells
+    times their size, and the distance between neighbouring points is that length divided by n.
+
+    Smaller cells hold fewer points, but the queries that have to jump over the points already removed
+    (visited) need more rings. 8 times the distance was the fastest for the ordering of cones along a track.
+    """
+    finite = [(x, y) for x, y in zip(xs, ys) if math.isfinite(x) and math.isfinite(y)]
+    if len(finite) < 2:
+        return 1.0
+    extent = max(max(x for x, _ in finite) - min(x for x, _ in finite),
+                 max(y for _, y in finite) - min(y for _, y in finite))
+    if extent == 0:
+        return 1.0
+    coarse = extent / math.sqrt(len(finite))
+    occupied = len({(math.floor(x / coarse), math.floor(y / coarse)) for x, y in finite})
+    return 8 * occupied * coarse / len(finite)
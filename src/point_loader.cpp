@@ -2,6 +2,8 @@
 #include <fstream>
 #include <vector>
 #include <string>
+#include <cstdint>
+#include <cstring>
 
 struct Point {
     double x, y;
@@ -28,8 +30,38 @@ void deserialize_points(const std::string& filename,
     }
 }
 
+// Reads the binary map format described in map_format.py: a 32 byte header with the number of right and
+// left cones followed by the packed Point values (little endian). Returns false if the file is not a valid map.
+bool deserialize_points_binary(const std::string& filename,
+                               std::vector<Point>& right_points,
+                               std::vector<Point>& left_points) {
+    static_assert(sizeof(Point) == 2 * sizeof(double), "Point must be two packed doubles");
+
+    std::ifstream file(filename, std::ios::binary);
+    char magic[8];
+    std::uint32_t version, reserved;
+    std::uint64_t n_right, n_left;
+    if (!file.read(magic, sizeof(magic)) || std::memcmp(magic, "CONEMAP\0", sizeof(magic)) != 0) {
+        return false;
+    }
+    file.read(reinterpret_cast<char*>(&version), sizeof(version));
+    file.read(reinterpret_cast<char*>(&reserved), sizeof(reserved));
+    file.read(reinterpret_cast<char*>(&n_right), sizeof(n_right));
+    file.read(reinterpret_cast<char*>(&n_left), sizeof(n_left));
+    if (!file || version != 1) {
+        return false;
+    }
+
+    right_points.resize(n_right);
+    left_points.resize(n_left);
+    file.read(reinterpret_cast<char*>(right_points.data()), n_right * sizeof(Point));
+    file.read(reinterpret_cast<char*>(left_points.data()), n_left * sizeof(Point));
+    return static_cast<bool>(file);
+}
+
 /*
 Example use:
 std::vector<Point> right_points, left_points;
 deserialize_points("points.txt", right_points, left_points);
+deserialize_points_binary("points.bin", right_points, left_points);
 */
\ No newline at end of file
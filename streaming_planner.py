@@ -0,0 +1,100 @@
+from time import perf_counter
+
+from clean_trajectory_generator import order_both_lists_of_cones, compute_midpoint, extend_trajectory
+from spatial_index import ConeHashGrid
+
+
+class StreamingPlanner:
+    """Stateful version of compute_trajectory for cones that are detected frame by frame.
+
+    The planner keeps the ordered cones (rpoints, lpoints), the trajectory (mid_points) and the last_ri/last_li
+    cursors between calls to update. New cones are chained to the end of the ordered lists by proximity, and the
+    main loop of compute_trajectory continues from the last step that was taken while both sides still had cones.
+    The steps taken after that point (following the cones of only one side) are undone and recomputed on every
+    update, because the new cones can change them. The cost of an update therefore depends on the number of new
+    cones and not on the length of the track.
+
+    The trajectory is the same that compute_trajectory would give with all the cones received so far, as long as
+    the new cones are detected ahead of the previous ones, which is the case for a car moving along the track.
+    Until both sides have 2 cones, every update orders the cones from scratch with order_both_lists_of_cones.
+
+    Args:
+        semiplane (int, optional): Same as in compute_trajectory. Defaults to None.
+        observer (callable, optional): Same as in compute_trajectory, called for every step that is computed. Defaults to None.
+        stats (PlannerStats, optional): Same as in compute_trajectory, with one call recorded per update. Defaults to None.
+        index_type (type, optional): Same as in compute_trajectory. Defaults to ConeHashGrid.
+    """
+
+    def __init__(self, semiplane=None, observer=None, stats=None, index_type=ConeHashGrid):
+        self.semiplane = semiplane
+        self.observer = observer
+        self.stats = stats
+        self.index_type = index_type
+        self.rpoints = []
+        self.lpoints = []
+        self.mid_points = []
+        self.last_ri = 0
+        self.last_li = 0
+        # State after the last step taken with cones on both sides: (length of mid_points, last 3 mid_points, last_ri, last_li)
+        self._checkpoint = None
+
+    def _restore_checkpoint(self):
+        """Undoes the steps taken after one of the sides ran out of cones."""
+        length, tail, self.last_ri, self.last_li = self._checkpoint
+        # Those steps only modify the points from length-3 onwards (3 point reorder and 2 point average)
+        self.mid_points[max(length - len(tail), 0):] = tail
+
+    def _save_checkpoint(self):
+        self._checkpoint = (len(self.mid_points), self.mid_points[-3:], self.last_ri, self.last_li)
+
+    def _chain_new_points(self, ordered_list, new_points):
+        """Appends the new points to the ordered list, always taking the closest one to the last ordered point."""
+        index = self.index_type(new_points)
+        while len(index):
+            i = index.nearest(ordered_list[-1])
+            ordered_list.append(new_points[i])
+            index.remove(i)
+
+    def update(self, new_right_points=(), new_left_points=()):
+        """Adds newly detected cones and extends the trajectory.
+
+        Args:
+            new_right_points (list, optional): The right cones detected since the last update.
+            new_left_points (list, optional): The left cones detected since the last update.
+
+        Returns:
+            list: The trajectory computed with all the cones received so far. It is the list kept by the planner, so it must not be modified.
+        """
+        new_right_points = list(new_right_points)
+        new_left_points = list(new_left_points)
+        if self.stats is not None:
+            self.stats.start_call()
+            t = perf_counter()
+
+        if len(self.rpoints) < 2 or len(self.lpoints) < 2:
+            # Not enough cones yet to know the direction of the track, order everything again
+            right_points = self.rpoints + new_right_points
+            left_points = self.lpoints + new_left_points
+            if not right_points or not left_points:
+                self.rpoints, self.lpoints = right_points, left_points
+                return self.mid_points
+            self.rpoints, self.lpoints = order_both_lists_of_cones(right_points, left_points, self.semiplane, self.stats, self.index_type)
+            self.mid_points = [compute_midpoint(self.rpoints[0], self.lpoints[0])]
+            self.last_ri = 0
+            self.last_li = 0
+        else:
+            self._restore_checkpoint()
+            if new_right_points:
+                self._chain_new_points(self.rpoints, new_right_points)
+            if new_left_points:
+                self._chain_new_points(self.lpoints, new_left_points)
+
+        if self.stats is not None:
+            self.stats.lap('ordering', t)
+
+        self.last_ri, self.last_li = extend_trajectory(self.rpoints, self.lpoints, self.mid_points,
+                                                       self.last_ri, self.last_li, self.observer, drain=False, stats=self.stats)
+        self._save_checkpoint()
+        self.last_ri, self.last_li = extend_trajectory(self.rpoints, self.lpoints, self.mid_points,
+                                                       self.last_ri, self.last_li, self.observer, stats=self.stats)
+        return self.mid_points
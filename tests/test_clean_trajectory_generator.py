@@ -0,0 +1,25 @@
+import math
+
+import pytest
+
+import clean_trajectory_generator as ctg
+
+
+@pytest.mark.parametrize('horizontal_slope', [0.0, -0.0])
+def test_find_intersection_with_a_horizontal_line(horizontal_slope):
+    # y = 2 and y = x meet at (2, 2). Horizontal lines must not take the vertical branch, since 0.0 == -0.0
+    assert ctg.find_intersection(horizontal_slope, [0.0, 2.0], 1.0, [0.0, 0.0]) == pytest.approx([2.0, 2.0])
+    assert ctg.find_intersection(1.0, [0.0, 0.0], horizontal_slope, [0.0, 2.0]) == pytest.approx([2.0, 2.0])
+
+
+def test_find_intersection_with_a_vertical_line():
+    assert ctg.find_intersection(float('inf'), [3.0, 0.0], 0.0, [0.0, 2.0]) == pytest.approx([3.0, 2.0])
+    assert ctg.find_intersection(0.0, [0.0, 2.0], float('inf'), [3.0, 0.0]) == pytest.approx([3.0, 2.0])
+
+
+def test_trajectory_of_a_straight_horizontal_track_is_finite():
+    right_points = [[5.0 * i, 0.0] for i in range(10)]
+    left_points = [[5.0 * i, 3.0] for i in range(10)]
+    mid_points = ctg.compute_trajectory(right_points, left_points, -1)
+    assert mid_points
+    assert all(math.isfinite(x) and math.isfinite(y) for x, y in mid_points)
@@ -0,0 +1,31 @@
+import random
+
+import numpy as np
+import pytest
+
+import clean_trajectory_generator as ctg
+from detection_noise import DetectionNoise
+
+
+def straight_track(num_cones):
+    return [[5.0 * i, 0.0] for i in range(num_cones)], [[5.0 * i, 3.0] for i in range(num_cones)]
+
+
+@pytest.mark.parametrize('skip_size', [0, 1, 2, 3])
+def test_like_remove_some_cones_keeps_as_many_cones(skip_size):
+    og_right_points, og_left_points = straight_track(40)
+    random.seed(0)
+    kept = [len(ctg.remove_some_cones(og_right_points, og_left_points, skip_size)[0]) for _ in range(4000)]
+    _, right_mask, _, left_mask = DetectionNoise.like_remove_some_cones(skip_size).sample(
+        og_right_points, og_left_points, 4000, rng=0)
+    expected = np.mean(kept)
+    assert right_mask.sum(axis=1).mean() == pytest.approx(expected, rel=0.03)
+    assert left_mask.sum(axis=1).mean() == pytest.approx(expected, rel=0.03)
+
+
+def test_sample_without_trials():
+    og_right_points, og_left_points = straight_track(10)
+    noise = DetectionNoise(dropout_rate=0.3, max_dropout_run=2, false_positive_rate=0.1)
+    right, right_mask, left, left_mask = noise.sample(og_right_points, og_left_points, 0, rng=0)
+    assert right.shape == left.shape == (0, 0, 2)
+    assert right_mask.shape == left_mask.shape == (0, 0)
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import math
+import random
+
+from lap_planner import LapPlanner, _LoopCheck, is_closed_loop
+from point_gen import get_circular_track
+
+
+def circuit(num_cones=40, radius=20):
+    track = get_circular_track(radius, num_cones)
+    return track['circular_r'], track['circular_l']
+
+
+def sealed_planner(right_points, left_points):
+    planner = LapPlanner(-1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(0, len(right_points), 2):
+            planner.update(right_points[i:i + 2], left_points[i:i + 2])
+    assert planner.closed
+    return planner
+
+
+def test_incremental_loop_check_matches_is_closed_loop():
+    rng = random.Random(0)
+    right_points, _ = circuit()
+    noisy = [[x + rng.gauss(0, 0.3), y + rng.gauss(0, 0.3)] for x, y in right_points]
+    check = _LoopCheck()
+    points = []
+    results = []
+    for point in noisy + noisy[:3]:
+        points.append(point)
+        results.append(check.closes(points))
+        assert results[-1] == is_closed_loop(points)
+    assert any(results) and not all(results)
+
+
+def test_replan_replaces_the_contradicted_cone():
+    right_points, left_points = circuit()
+    planner = sealed_planner(right_points, left_points)
+    moved = [right_points[10][0] * 1.06, right_points[10][1] * 1.06]  # 1.2 m outwards, the cones are 3.1 m apart
+    with contextlib.redirect_stdout(io.StringIO()):
+        planner.update([moved], [])
+    assert planner.replans == 1 and planner.closed
+    assert moved in planner.rpoints and right_points[10] not in planner.rpoints
+    assert len(planner.rpoints) == len(right_points)
+
+
+def test_replan_adds_a_cone_between_known_ones():
+    right_points, left_points = circuit()
+    planner = sealed_planner(right_points, left_points)
+    angle = math.radians(9 * 10 + 4.5)  # Halfway between the 10th and 11th cones
+    extra = [20 * math.cos(angle), 20 * math.sin(angle)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        planner.update([extra], [])
+    assert extra in planner.rpoints and right_points[10] in planner.rpoints
+    assert len(planner.rpoints) == len(right_points) + 1
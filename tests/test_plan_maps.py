@@ -0,0 +1,20 @@
+import os
+
+from plan_maps import plan_map, trajectory_path
+
+
+def test_plan_map_reports_the_malformed_line(tmp_path):
+    map_path = tmp_path / 'bad.dat'
+    map_path.write_text("RIGHT_POINTS\n0 0\n1 x\nLEFT_POINTS\n0 3\n")
+    result = plan_map(str(map_path), str(tmp_path))
+    assert f"{map_path}:3:" in result['error']
+    assert not os.path.exists(trajectory_path(str(tmp_path), str(map_path)))
+
+
+def test_plan_map_writes_the_trajectory(tmp_path):
+    map_path = tmp_path / 'good.dat'
+    map_path.write_text("RIGHT_POINTS\n0 0\n5 0\n10 0\nLEFT_POINTS\n0 3\n5 3\n10 3\n")
+    result = plan_map(str(map_path), str(tmp_path))
+    assert result['error'] is None
+    assert result['right_cones'] == result['left_cones'] == 3
+    assert os.path.exists(trajectory_path(str(tmp_path), str(map_path)))
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from point_gen import get_procedural_track, random_segments
+
+
+def is_hairpin(segment):
+    return segment['type'] == 'arc' and abs(segment['angle']) == 180
+
+
+def crossings(right_points, left_points, near, far):
+    """Returns the pairs of cones closer than near that are more than far apart along the track."""
+    cones = np.concatenate([right_points, left_points])
+    centreline = (right_points + left_points) / 2
+    along = np.concatenate([[0.0], np.cumsum(np.sqrt((np.diff(centreline, axis=0) ** 2).sum(axis=1)))])
+    along = np.concatenate([along, along])
+    distances = np.sqrt(((cones[:, None, :] - cones[None, :, :]) ** 2).sum(axis=2))
+    return np.argwhere((distances < near) & (np.abs(along[:, None] - along[None, :]) > far))
+
+
+@pytest.mark.parametrize('num_segments', [1, 2, 5, 10, 60])
+def test_random_segments_length(num_segments):
+    for seed in range(10):
+        assert len(random_segments(num_segments, seed)) == num_segments
+
+
+def test_random_segments_produces_hairpins():
+    assert sum(map(is_hairpin, random_segments(200, 0))) > 0
+
+
+def test_random_tracks_do_not_cross_themselves():
+    for seed in range(40):
+        right_points, left_points = get_procedural_track(random_segments(60, seed), seed)
+        assert not len(crossings(right_points, left_points, near=1.0, far=30.0)), f"seed {seed}"
@@ -0,0 +1,32 @@
+import math
+
+import pytest
+
+import clean_trajectory_generator as ctg
+from spatial_index import ConeHashGrid, ConeKDTree
+
+
+def brute_force_order(points):
+    ordered = [points[0]]
+    remaining = points[1:]
+    while remaining:
+        closest = min(remaining, key=lambda point: ctg.euclidean_norm(ordered[-1], point))
+        ordered.append(closest)
+        remaining.remove(closest)
+    return ordered
+
+
+@pytest.mark.parametrize('index_type', [ConeKDTree, ConeHashGrid])
+def test_nearest_with_only_infinite_points_left(index_type):
+    index = index_type([[0.0, 0.0], [math.inf, 1.0], [2.0, 2.0]])
+    index.remove(0)
+    index.remove(2)
+    assert index.nearest([1.0, 1.0]) == 1
+
+
+@pytest.mark.parametrize('index_type', [ConeKDTree, ConeHashGrid])
+def test_order_point_list_with_an_infinite_coordinate(index_type):
+    # Small lists are ordered with a linear scan and large ones with the index, both must match the brute force
+    for points in ([[0, 0], [1, 1], [math.inf, 1.0], [2, 2]],
+                   [[0, 0]] + [[i, 0.5 * i] for i in range(1, 40)] + [[math.inf, 1.0], [1.5, 0.2]]):
+        assert ctg.order_point_list(points, index_type) == brute_force_order(points)
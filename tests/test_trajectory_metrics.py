@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from trajectory_metrics import SegmentGrid, compute_metrics
+
+
+def brute_force_distances(points, starts, ends):
+    deltas = ends - starts
+    rel = points[:, None, :] - starts[None, :, :]
+    lengths2 = (deltas ** 2).sum(axis=1)
+    t = np.clip((rel * deltas).sum(axis=2) / np.where(lengths2 > 0, lengths2, 1), 0, 1)
+    closest = starts[None, :, :] + t[:, :, None] * deltas[None, :, :]
+    return np.sqrt(((points[:, None, :] - closest) ** 2).sum(axis=2)).min(axis=1)
+
+
+@pytest.mark.parametrize('segments', [True, False])
+def test_nearest_matches_brute_force(segments):
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, 100, (300, 2))
+    ends = starts + rng.normal(0, 3, (300, 2)) if segments else starts
+    # Queries inside, around and far outside of the grid
+    points = np.concatenate([rng.uniform(-50, 150, (500, 2)), rng.uniform(1e4, 2e4, (10, 2))])
+    _, distances, _ = SegmentGrid(starts, ends).nearest(points)
+    np.testing.assert_allclose(distances, brute_force_distances(points, starts, ends))
+
+
+def test_nearest_of_nan_points_and_empty_grids():
+    index, distances, _ = SegmentGrid([[0.0, 0.0], [1.0, 1.0]]).nearest([[np.nan, 0.0], [1.0, 0.0]])
+    assert index[0] == -1 and distances[0] == np.inf
+    assert distances[1] == pytest.approx(1.0)
+    index, distances, _ = SegmentGrid(np.zeros((0, 2))).nearest([[0.0, 0.0]])
+    assert index[0] == -1 and distances[0] == np.inf
+
+
+def test_compute_metrics_counts_nan_points_apart():
+    og_right_points = [[5.0 * i, 0.0] for i in range(10)]
+    og_left_points = [[5.0 * i, 4.0] for i in range(10)]
+    metrics = compute_metrics([[0.0, 2.0], [5.0, 3.0], [np.nan, np.nan]], og_right_points, og_left_points)
+    assert metrics['rms_deviation'] == np.inf
+    assert metrics['nonfinite_points'] == 1
+    assert metrics['finite_rms_deviation'] == pytest.approx(np.sqrt(0.5))
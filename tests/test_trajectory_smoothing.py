@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from trajectory_smoothing import resample, smooth_trajectory
+
+
+@pytest.mark.parametrize('smoothing_length', [0, 10.0])
+def test_smooth_empty_trajectory(smoothing_length):
+    points, kappa = smooth_trajectory([], smoothing_length=smoothing_length, curvature=True)
+    assert points.shape == (0, 2)
+    assert kappa.shape == (0,)
+    assert resample([]).shape == (0, 2)
+
+
+def test_smooth_single_point():
+    points, kappa = smooth_trajectory([[1.0, 2.0]], curvature=True)
+    np.testing.assert_array_equal(points, [[1.0, 2.0]])
+    assert kappa.shape == (1,)
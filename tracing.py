@@ -0,0 +1,122 @@
+import collections
+import json
+import sys
+from time import perf_counter
+
+
+# LEVELED TRACING INTO A RING BUFFER ----------------------------------------------------------------
+#
+# The main loop of compute_trajectory used to print the cone indexes and slopes of every step, and every rotation
+# and merge, which costs more than the step itself when many trajectories are planned. It now emits trace events
+# instead, guarded by a comparison with the module level threshold:
+#
+#     if tracing.level <= tracing.DEBUG:
+#         tracing.emit(tracing.DEBUG, 'step', last_ri=last_ri, last_li=last_li)
+#
+# While no recorder is installed the threshold is DISABLED, so the guard is a single integer comparison and the
+# event is never built. A TraceRecorder keeps the last `capacity` events in a ring buffer, without any I/O, and
+# can dump them as JSON lines after a failure:
+#
+#     with TraceRecorder(capacity=4096, dump_on_error=sys.stderr):
+#         compute_trajectory(right_points, left_points, -1)
+#
+# With echo=True the events are also printed as they are recorded, like the old prints.
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+DISABLED = 100
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# Threshold of the installed recorder, DISABLED if there is none. Events below it are not emitted
+level = DISABLED
+_recorder = None
+
+
+class TraceRecorder:
+    """Ring buffer of trace events.
+
+    Each event is a tuple (sequence number, perf_counter time, level, name, fields).
+
+    Args:
+        capacity (int, optional): Number of events kept. Older events are overwritten. Defaults to 4096.
+        level (int, optional): Minimum level of the recorded events. Defaults to DEBUG.
+        echo (bool, optional): If True, every event is also printed when it is recorded. Defaults to False.
+        dump_on_error (optional): File object or path the events are dumped to if the with block raises an
+            exception. Defaults to None (no dump).
+    """
+
+    def __init__(self, capacity=4096, level=DEBUG, echo=False, dump_on_error=None):
+        self.events = collections.deque(maxlen=capacity)
+        self.level = level
+        self.echo = echo
+        self.dump_on_error = dump_on_error
+        self.recorded = 0  # Events recorded since the creation, including the overwritten ones
+        self._previous = None
+
+    def record(self, event_level, name, fields):
+        self.events.append((self.recorded, perf_counter(), event_level, name, fields))
+        self.recorded += 1
+        if self.echo:
+            print(format_event(self.events[-1]))
+
+    def clear(self):
+        self.events.clear()
+
+    def to_dicts(self):
+        """Returns the buffered events as dictionaries, oldest first."""
+        return [dict(fields, seq=seq, time=t, level=LEVEL_NAMES.get(event_level, event_level), event=name)
+                for seq, t, event_level, name, fields in self.events]
+
+    def dump(self, file=None):
+        """Writes the buffered events as JSON lines, oldest first.
+
+        Args:
+            file (optional): File object or path. Defaults to sys.stderr.
+        """
+        if file is None:
+            file = sys.stderr
+        if isinstance(file, str):
+            with open(file, 'w') as f:
+                self.dump(f)
+            return
+        for event in self.to_dicts():
+            file.write(json.dumps(event, default=repr) + "\n")
+
+    def __enter__(self):
+        self._previous = install(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        install(self._previous)
+        self._previous = None
+        if exc_type is not None and self.dump_on_error is not None:
+            self.dump(self.dump_on_error)
+        return False
+
+
+def install(recorder):
+    """Makes the recorder receive the events, or disables the tracing if it is None.
+
+    Returns:
+        The previously installed recorder.
+    """
+    global level, _recorder
+    previous = _recorder
+    _recorder = recorder
+    level = recorder.level if recorder is not None else DISABLED
+    return previous
+
+
+def emit(event_level, name, **fields):
+    """Records an event in the installed recorder. Callers check `level` first, so nothing is built while it is disabled."""
+    if _recorder is not None and event_level >= level:
+        _recorder.record(event_level, name, fields)
+
+
+def format_event(event):
+    """Returns a one line description of an event tuple."""
+    seq, t, event_level, name, fields = event
+    details = ", ".join(f"{key}: {value}" for key, value in fields.items())
+    return f"[{LEVEL_NAMES.get(event_level, event_level)}] {name} {details}"
@@ -0,0 +1,110 @@
+import contextlib
+import os
+
+import clean_trajectory_generator as ctg
+import draft_trajectory_generator as dtg
+
+
+# REGISTRY OF TRAJECTORY ALGORITHMS -----------------------------------------------------------------
+#
+# draft_trajectory_generator.py keeps the earlier versions of the algorithm, each one with its own signature:
+# some take a threshold, some an observer, none a semiplane, and the first one leaves empty points in the
+# trajectory. The registry wraps all of them and the clean version behind the same headless call,
+#
+#     get_algorithm('draft2_clockwise').plan(right_points, left_points, semiplane=-1)
+#
+# so they can be compared on the same cones (see benchmark_algorithms.py). Their prints are discarded unless
+# quiet=False, and the arguments a variant does not support are ignored.
+
+
+class TrajectoryAlgorithm:
+    """A trajectory algorithm with a common interface.
+
+    Args:
+        name (str): Name used in the registry.
+        function (callable): The algorithm, called as function(right_points, left_points, **kwargs).
+        description (str): One line description.
+        semiplane (bool, optional): If the function takes the semiplane argument of compute_trajectory. Defaults to False.
+        observer (bool, optional): If the function takes an observer for its steps. Defaults to False.
+        orders_cones (bool, optional): If the function orders the cones itself. If False it expects them ordered
+            along the track. Defaults to True.
+    """
+
+    def __init__(self, name, function, description, semiplane=False, observer=False, orders_cones=True):
+        self.name = name
+        self.function = function
+        self.description = description
+        self.semiplane = semiplane
+        self.observer = observer
+        self.orders_cones = orders_cones
+
+    def __repr__(self):
+        return f"TrajectoryAlgorithm({self.name!r})"
+
+    def plan(self, right_points, left_points, semiplane=None, observer=None, quiet=True):
+        """Computes the trajectory of the cones.
+
+        Args:
+            right_points (list): The right cones.
+            left_points (list): The left cones.
+            semiplane (int, optional): Same as in compute_trajectory, ignored if the algorithm does not take it. Defaults to None.
+            observer (callable, optional): Called for every step, ignored if the algorithm does not take it. Defaults to None.
+            quiet (bool, optional): If True, what the algorithm prints is discarded. Defaults to True.
+
+        Returns:
+            list: The trajectory points, without the empty points some drafts leave where they found no intersection.
+        """
+        kwargs = {}
+        if self.semiplane:
+            kwargs['semiplane'] = semiplane
+        if self.observer and observer is not None:
+            kwargs['observer'] = observer
+        if quiet:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                mid_points = self.function(right_points, left_points, **kwargs)
+        else:
+            mid_points = self.function(right_points, left_points, **kwargs)
+        return [point for point in mid_points if len(point)]
+
+
+ALGORITHMS = {}
+
+
+def register(algorithm):
+    """Adds an algorithm to the registry and returns it.
+
+    Raises:
+        ValueError: If there is already an algorithm with the same name.
+    """
+    if algorithm.name in ALGORITHMS:
+        raise ValueError(f"There is already an algorithm called {algorithm.name}")
+    ALGORITHMS[algorithm.name] = algorithm
+    return algorithm
+
+
+def get_algorithm(name):
+    """Returns the registered algorithm with the given name.
+
+    Raises:
+        ValueError: If there is no algorithm with that name.
+    """
+    try:
+        return ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown algorithm {name}, the registered ones are: {', '.join(ALGORITHMS)}") from None
+
+
+register(TrajectoryAlgorithm('clean', ctg.compute_trajectory,
+                             "compute_trajectory of clean_trajectory_generator.py, the working version",
+                             semiplane=True, observer=True))
+register(TrajectoryAlgorithm('draft', lambda right_points, left_points: dtg.compute_trajectory(right_points, left_points, threshold=1.5),
+                             "First draft: intersections of the slopes of both borders, for ordered cones",
+                             orders_cones=False))
+register(TrajectoryAlgorithm('draft2', dtg.compute_trajectory2,
+                             "Perpendicular projection on the last cone, without the rotation check"))
+register(TrajectoryAlgorithm('draft2_circ', dtg.compute_trajectory2_wsteps_circ,
+                             "compute_trajectory2 with the 180º rotation decided with circles", observer=True))
+register(TrajectoryAlgorithm('draft2_slopes', dtg.compute_trajectory2_wsteps_slopes,
+                             "compute_trajectory2 with the 180º rotation decided with slopes", observer=True))
+register(TrajectoryAlgorithm('draft2_clockwise', dtg.compute_trajectory2_wsteps_clockwise,
+                             "compute_trajectory2 with the 180º rotation decided with the clockwise check", observer=True))
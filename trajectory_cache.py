@@ -0,0 +1,150 @@
+import hashlib
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+import clean_trajectory_generator as ctg
+
+
+# CACHE OF TRAJECTORIES -----------------------------------------------------------------------------
+#
+# Consecutive perception frames often hold the same cones, and compute_trajectory gives the same trajectory for
+# them. TrajectoryCache remembers the last trajectories computed, keyed by a hash of the cones and the semiplane,
+# so a repeated request is answered with a dictionary lookup instead of planning it again.
+#
+# The coordinates are rounded to a multiple of `quantum` (1 mm by default) before hashing them, so cones that
+# only differ by noise smaller than that share the trajectory. The key keeps the order of the cones, since the
+# first cone of each side is where the ordering starts and changing it can change the trajectory.
+
+DEFAULT_QUANTUM = 1e-3
+DEFAULT_MAXSIZE = 128
+# Quantised coordinates must fit in an int64
+_MAX_QUANTISED = 2 ** 62
+
+_KEY_HEADER = struct.Struct('<bQQd')
+
+
+def _quantised_bytes(points, inverse_quantum):
+    """Returns the coordinates of the points divided by the quantum and rounded, as little endian int64 bytes
+    (all the x and then all the y), or None if some coordinate is not finite or too large."""
+    if isinstance(points, list):
+        try:
+            # One comprehension per coordinate is about twice as fast as one over the x, y pairs
+            data = array('q', [round(x * inverse_quantum) for x, y in points] + [round(y * inverse_quantum) for x, y in points])
+        except (ValueError, OverflowError):
+            return None
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return data.tobytes()
+
+    # Arrays and PointArrays are quantised at once. np.rint rounds half to even like round(), so the same cones
+    # give the same key as a list or as an array
+    import numpy as np
+    scaled = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2) * inverse_quantum)
+    if not np.isfinite(scaled).all() or (scaled.size and np.abs(scaled).max() >= _MAX_QUANTISED):
+        return None
+    return scaled.T.astype('<i8').tobytes()
+
+
+def cone_set_key(right_points, left_points, semiplane=None, quantum=DEFAULT_QUANTUM):
+    """Returns the cache key of a request: a 16 byte hash of the quantised cones and the semiplane.
+
+    Args:
+        right_points: The right cones, as a list of points [x, y], an array of shape (n, 2) or a PointArray.
+        left_points: The left cones, in the same forms.
+        semiplane (int, optional): The semiplane given to compute_trajectory.
+        quantum (float, optional): Coordinates are rounded to a multiple of this before hashing them.
+
+    Returns:
+        bytes: The key, or None if some coordinate is NaN, infinite or too large to be quantised.
+    """
+    inverse_quantum = 1.0 / quantum
+    right_bytes = _quantised_bytes(right_points, inverse_quantum)
+    left_bytes = _quantised_bytes(left_points, inverse_quantum)
+    if right_bytes is None or left_bytes is None:
+        return None
+    digest = hashlib.blake2b(_KEY_HEADER.pack(semiplane or 0, len(right_points), len(left_points), quantum), digest_size=16)
+    digest.update(right_bytes)
+    digest.update(left_bytes)
+    return digest.digest()
+
+
+class TrajectoryCache:
+    """Bounded cache of trajectories with least recently used eviction.
+
+    Args:
+        maxsize (int, optional): Maximum number of trajectories kept. Defaults to DEFAULT_MAXSIZE.
+        quantum (float, optional): Resolution used to compare the cones. Defaults to DEFAULT_QUANTUM (1 mm).
+        planner (callable, optional): Function called on a miss, with the signature of compute_trajectory.
+            Defaults to compute_trajectory.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, quantum=DEFAULT_QUANTUM, planner=None):
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.maxsize = maxsize
+        self.quantum = quantum
+        self.planner = planner if planner is not None else ctg.compute_trajectory
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'uncacheable': 0}
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def key(self, right_points, left_points, semiplane=None):
+        """Returns the key of a request with the quantum of this cache (see cone_set_key)."""
+        return cone_set_key(right_points, left_points, semiplane, self.quantum)
+
+    def get(self, key, default=None):
+        """Returns the value stored for the key and marks it as the most recently used, or default if it is not stored.
+        Counts a hit or a miss."""
+        value = self._entries.get(key, default) if key is not None else default
+        if value is default:
+            self.stats['misses'] += 1
+            return default
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    def put(self, key, value):
+        """Stores a value for the key, evicting the least recently used entry if the cache is full."""
+        if key is None:
+            self.stats['uncacheable'] += 1
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def compute_trajectory(self, right_points, left_points, semiplane=None, **kwargs):
+        """Returns the trajectory of the cones, computing it with the planner only if it is not cached.
+
+        Other keyword arguments (observer, stats, index_type) are passed to the planner on a miss, and are not
+        used at all on a hit. The trajectory is a new list every time, so the caller can modify it.
+        """
+        key = self.key(right_points, left_points, semiplane)
+        mid_points = self.get(key)
+        if mid_points is None:
+            mid_points = self.planner(right_points, left_points, semiplane, **kwargs)
+            # Stored as tuples so nobody can modify the cached points
+            self.put(key, tuple((point[0], point[1]) for point in mid_points))
+            return mid_points
+        return [[x, y] for x, y in mid_points]
+
+    def clear(self):
+        """Removes every entry. The statistics are kept."""
+        self._entries.clear()
+
+    def hit_rate(self):
+        """Returns the fraction of lookups that were hits, or 0 if there were none."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return (f"TrajectoryCache({len(self)}/{self.maxsize} entries, {self.stats['hits']} hits, "
+                f"{self.stats['misses']} misses, {self.stats['evictions']} evictions)")
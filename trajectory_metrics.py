@@ -0,0 +1,377 @@
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+
+
+# TRAJECTORY QUALITY METRICS ------------------------------------------------------------------------
+#
+# Measures how good a trajectory (mid_points) is against the original cones of the map: how close it gets to
+# the cones, how far it deviates from the true centreline, how many of its points are outside of the corridor
+# between the cones and how long it is.
+#
+# The true centreline joins the midpoints of the i-th right and left cones, so the original cones must be ordered
+# along the track, as in the maps written by point_gen.py. Its half width at each vertex is half the distance
+# between those two cones, and it is linearly interpolated along each segment.
+#
+# Every metric is computed with NumPy for all the trajectory points at once. The nearest cone and the nearest
+# centreline segment of each point are found with a SegmentGrid, so the cost grows linearly with the number of
+# points instead of with the number of points times the number of cones.
+#
+# Measured cost: on a circular track of 100000 cones per side and its 100000 point trajectory, compute_metrics
+# takes 0.4 to 0.6 s. Building the grid of the cones and the grid of the centreline takes 60 to 90 ms each and
+# querying each one 120 ms, and converting the lists of points to arrays most of the rest. The queries gather
+# the candidate segments of every point with NumPy, one ring of cells at a time, so their cost is the gathers
+# and distances of about 10 candidates per point, around 1.2 µs per point.
+
+
+# SPATIAL INDEX -------------------------------------------------------------------------------------
+
+class SegmentGrid:
+    """Uniform grid over a set of segments that finds the nearest segment to many query points at once.
+
+    Each segment is stored in every cell its bounding box touches. Only the non-empty cells are kept, as a sorted
+    array of cell keys, so the grid works for tracks of any extent. Points are stored as segments of length 0.
+
+    A query looks at the cells in rings of growing size around each point, and a point is done once its nearest
+    segment is closer than the distance to the next ring, so the result is exact. See the measured cost above.
+
+    Args:
+        starts (array): Start point of each segment, shape (n, 2).
+        ends (array, optional): End point of each segment, shape (n, 2). Defaults to starts (a grid of points).
+        cell_size (float, optional): Side of the grid cells. Defaults to twice the median segment length, or to the
+            side of a cell holding one point on average if the segments have no length.
+    """
+
+    def __init__(self, starts, ends=None, cell_size=None):
+        self.starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+        self.ends = self.starts if ends is None else np.asarray(ends, dtype=float).reshape(-1, 2)
+        self.deltas = self.ends - self.starts
+        self.lengths2 = np.einsum('ij,ij->i', self.deltas, self.deltas)
+        # Separate contiguous columns, gathering from them is much faster than from the (n, 2) arrays
+        self._columns = (np.ascontiguousarray(self.starts[:, 0]), np.ascontiguousarray(self.starts[:, 1]),
+                         np.ascontiguousarray(self.deltas[:, 0]), np.ascontiguousarray(self.deltas[:, 1]), self.lengths2)
+
+        valid = np.isfinite(self.starts).all(axis=1) & np.isfinite(self.ends).all(axis=1)
+        ids = np.flatnonzero(valid)
+        if cell_size is None:
+            cell_size = self._default_cell_size(ids)
+        self.cell_size = float(cell_size)
+
+        if not len(ids):
+            self.origin = np.zeros(2)
+            self._span = 0
+            self._keys = np.zeros(0, dtype=np.int64)
+            self._cell_starts = self._cell_counts = self._items = np.zeros(0, dtype=np.int64)
+            return
+
+        lows = np.minimum(self.starts[ids], self.ends[ids])
+        highs = np.maximum(self.starts[ids], self.ends[ids])
+        self.origin = lows.min(axis=0)
+        low_cells = np.floor((lows - self.origin) / self.cell_size).astype(np.int64)
+        high_cells = np.floor((highs - self.origin) / self.cell_size).astype(np.int64)
+        # Cells of the grid are in [0, _span) on both axes, the queries can be anywhere
+        self._span = int(high_cells.max()) + 1
+
+        # Every cell of the bounding box of each segment
+        widths = high_cells[:, 0] - low_cells[:, 0] + 1
+        heights = high_cells[:, 1] - low_cells[:, 1] + 1
+        counts = widths * heights
+        owner = np.repeat(np.arange(len(ids)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = low_cells[owner, 0] + offsets % widths[owner]
+        cy = low_cells[owner, 1] + offsets // widths[owner]
+        keys = self._key(cx, cy)
+
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self._items = ids[owner[order]]
+        self._keys, self._cell_starts, self._cell_counts = np.unique(keys, return_index=True, return_counts=True)
+
+    def _default_cell_size(self, ids):
+        lengths = np.sqrt(self.lengths2[ids])
+        lengths = lengths[lengths > 0]
+        if len(lengths):
+            return 2 * float(np.median(lengths))
+        if len(ids) < 2:
+            return 1.0
+        # Cones lie along a curve, so this puts about sqrt(n) of them in the cells they occupy
+        extent = (self.starts[ids].max(axis=0) - self.starts[ids].min(axis=0)).max()
+        return float(extent / np.sqrt(len(ids))) or 1.0
+
+    def _key(self, cx, cy):
+        return cx * self._span + cy
+
+    def __len__(self):
+        return len(self.starts)
+
+    def nearest(self, points):
+        """Finds the nearest segment to each point.
+
+        Args:
+            points (array): Query points, shape (m, 2).
+
+        Returns:
+            tuple: The index of the nearest segment of each point (any of them if there is a tie, -1 for NaN points or an empty grid), the distance
+            to it (inf in that case) and the position t in [0, 1] of the closest point along that segment.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        best_i = np.full(len(points), -1, dtype=np.int64)
+        best_d2 = np.full(len(points), np.inf)
+        best_t = np.zeros(len(points))
+        if not len(self._keys):
+            return best_i, np.sqrt(best_d2), best_t
+
+        finite = np.isfinite(points).all(axis=1)
+        active = np.flatnonzero(finite)
+        points = np.where(finite[:, None], points, self.origin)
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        # Position of each point inside its cell
+        inner = (points - self.origin) - cells * self.cell_size
+        # Queries outside of the grid search from the closest border cell, with no margin to its borders
+        outside = (cells < -1).any(axis=1) | (cells > self._span).any(axis=1)
+        cells = np.clip(cells, -1, self._span)
+
+        # First the 2x2 block of cells around each point: its own cell and the neighbours on the closer side
+        # along each axis. The cells outside of the block are at least half a cell away
+        sides = np.where(inner < self.cell_size / 2, -1, 1)
+        block = np.array([[0, 0], [1, 0], [0, 1], [1, 1]])
+        offsets = block[None, :, :] * sides[active, None, :]
+        self._search(points, active, cells[active, None, :] + offsets, best_i, best_d2, best_t)
+        margins = np.maximum(inner, self.cell_size - inner).min(axis=1)
+        margins[outside] = 0.0
+        active = active[best_d2[active] > margins[active] ** 2]
+        if not len(active):
+            return best_i, np.sqrt(best_d2), best_t
+
+        # Then rings of growing size around the cell of each point, skipping the block already searched
+        margins = np.minimum(inner, self.cell_size - inner).min(axis=1)
+        margins[outside] = 0.0
+        ring = 1
+        while len(active) and ring <= min(self._span + 1, _MAX_RINGS):
+            offsets = _ring_offsets(ring)
+            if ring == 1:
+                offsets = np.concatenate([_ring_offsets(0), offsets])
+                offsets = np.broadcast_to(offsets, (len(active),) + offsets.shape)
+                in_block = (((offsets == 0) | (offsets == sides[active, None, :])).all(axis=2))
+                searched = cells[active, None, :] + offsets
+                self._search(points, active, searched, best_i, best_d2, best_t, ~in_block)
+            else:
+                self._search(points, active, cells[active, None, :] + offsets, best_i, best_d2, best_t)
+            # Any segment outside of the rings searched so far is farther than that
+            active = active[best_d2[active] > (ring * self.cell_size + margins[active]) ** 2]
+            ring += 1
+
+        # Points far away from every segment would need too many rings, they are compared with all the segments
+        items = np.arange(len(self.starts))
+        chunk_size = max(1, _BRUTE_FORCE_ELEMENTS // len(items))
+        for chunk in range(0, len(active), chunk_size):
+            queries = active[chunk:chunk + chunk_size]
+            query = np.repeat(queries, len(items))
+            d2, t = self._distance2(points[:, 0].take(query), points[:, 1].take(query), np.tile(items, len(queries)))
+            # NaN segments are not in the grid
+            d2 = np.where(np.isnan(d2), np.inf, d2).reshape(len(queries), len(items))
+            rows = np.arange(len(queries))
+            closest = d2.argmin(axis=1)
+            best_i[queries] = closest
+            best_d2[queries] = d2[rows, closest]
+            best_t[queries] = t.reshape(len(queries), len(items))[rows, closest]
+        return best_i, np.sqrt(best_d2), best_t
+
+    def _search(self, points, active, cells, best_i, best_d2, best_t, mask=None):
+        """Updates the nearest segment of the active points with the segments in cells, of shape (len(active), c, 2)."""
+        query = np.repeat(active, cells.shape[1])
+        cx = cells[:, :, 0].ravel()
+        cy = cells[:, :, 1].ravel()
+        inside = (cx >= 0) & (cy >= 0) & (cx < self._span) & (cy < self._span)
+        if mask is not None:
+            inside &= mask.ravel()
+        query, keys = query[inside], self._key(cx[inside], cy[inside])
+
+        pos = np.searchsorted(self._keys, keys)
+        pos[pos == len(self._keys)] = 0
+        found = self._keys[pos] == keys
+        query, pos = query[found], pos[found]
+        counts = self._cell_counts.take(pos)
+        query = np.repeat(query, counts)
+        if not len(query):
+            return
+        item = self._items.take(np.repeat(self._cell_starts.take(pos) - np.cumsum(counts) + counts, counts)
+                                + np.arange(len(query)))
+
+        d2, t = self._distance2(points[:, 0].take(query), points[:, 1].take(query), item)
+        # active is sorted, so the candidates of each point are contiguous
+        group_starts = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+        group_queries = query[group_starts]
+        group_d2 = np.minimum.reduceat(d2, group_starts)
+        better = group_d2 < best_d2[group_queries]
+        best_d2[group_queries] = np.minimum(group_d2, best_d2[group_queries])
+        closest = np.flatnonzero(d2 == np.repeat(np.where(better, group_d2, np.nan), np.diff(np.r_[group_starts, len(query)])))
+        best_i[query[closest]] = item[closest]
+        best_t[query[closest]] = t[closest]
+
+    def _distance2(self, px, py, item):
+        """Squared distance from each point to the segment item, and the position of the closest point along it."""
+        sx, sy, dx, dy, lengths2 = (column.take(item) for column in self._columns)
+        rx = px - sx
+        ry = py - sy
+        t = rx * dx + ry * dy
+        np.divide(t, lengths2, out=t, where=lengths2 > 0)
+        t[lengths2 == 0] = 0.0
+        np.clip(t, 0.0, 1.0, out=t)
+        rx -= t * dx
+        ry -= t * dy
+        return rx * rx + ry * ry, t
+
+
+# Rings searched around a point before comparing it with all the segments
+_MAX_RINGS = 8
+# Point to segment distances computed at once when comparing points with all the segments
+_BRUTE_FORCE_ELEMENTS = 1 << 22
+_ring_cache = {}
+
+
+def _ring_offsets(ring):
+    """Cell offsets (dx, dy) with max(|dx|, |dy|) == ring."""
+    if ring not in _ring_cache:
+        r = np.arange(-ring, ring + 1)
+        dx, dy = np.meshgrid(r, r, indexing='ij')
+        on_ring = np.maximum(np.abs(dx), np.abs(dy)) == ring
+        _ring_cache[ring] = np.stack([dx[on_ring], dy[on_ring]], axis=1)
+    return _ring_cache[ring]
+
+
+# METRICS -------------------------------------------------------------------------------------------
+
+def build_centreline(og_right_points, og_left_points):
+    """Returns the true centreline of the track, shape (n, 2), and its half width at each vertex, shape (n,).
+
+    The centreline joins the midpoints of the i-th right and left cones, so both lists must be ordered along the
+    track. If one side has more cones, the extra cones are left out.
+    """
+    n = min(len(og_right_points), len(og_left_points))
+    right = np.asarray(og_right_points, dtype=float).reshape(-1, 2)[:n]
+    left = np.asarray(og_left_points, dtype=float).reshape(-1, 2)[:n]
+    centreline = (right + left) / 2
+    half_widths = np.sqrt(((right - left) ** 2).sum(axis=1)) / 2
+    return centreline, half_widths
+
+
+def path_length(mid_points):
+    """Returns the length of the trajectory."""
+    mid_points = np.asarray(mid_points, dtype=float).reshape(-1, 2)
+    return float(np.sqrt((np.diff(mid_points, axis=0) ** 2).sum(axis=1)).sum())
+
+
+def cone_clearances(mid_points, cones, grid=None):
+    """Returns the distance from each trajectory point to its nearest cone.
+
+    Args:
+        mid_points (list): The trajectory points.
+        cones (list): All the cones of the map, of both sides.
+        grid (SegmentGrid, optional): A grid built over the cones, to reuse it between calls. Defaults to None.
+    """
+    if grid is None:
+        grid = SegmentGrid(cones)
+    return grid.nearest(mid_points)[1]
+
+
+def centreline_deviations(mid_points, centreline, half_widths, grid=None):
+    """Returns the distance from each trajectory point to the centreline and the half width of the track there.
+
+    Args:
+        mid_points (list): The trajectory points.
+        centreline (array): The centreline given by build_centreline.
+        half_widths (array): The half widths given by build_centreline.
+        grid (SegmentGrid, optional): A grid built over the centreline segments, to reuse it between calls. Defaults to None.
+    """
+    if len(centreline) == 1:
+        # A single vertex, the centreline is a segment of length 0
+        starts = ends = centreline
+    else:
+        starts, ends = centreline[:-1], centreline[1:]
+    if grid is None:
+        grid = SegmentGrid(starts, ends)
+    segment, deviations, t = grid.nearest(mid_points)
+    if not len(centreline):
+        return deviations, np.zeros(len(deviations))
+    segment = np.maximum(segment, 0)
+    end = np.minimum(segment + 1, len(half_widths) - 1)
+    widths = half_widths[segment] + t * (half_widths[end] - half_widths[segment])
+    return deviations, widths
+
+
+def compute_metrics(mid_points, og_right_points, og_left_points):
+    """Computes the quality metrics of a trajectory.
+
+    Args:
+        mid_points (list): The trajectory given by compute_trajectory.
+        og_right_points (list): The original right cones of the map, ordered along the track.
+        og_left_points (list): The original left cones of the map, ordered along the track.
+
+    Returns:
+        dict: 'points', the number of trajectory points; 'path_length'; 'min_cone_clearance' and
+        'mean_cone_clearance', the distance from the trajectory points to their nearest cone;
+        'max_deviation', 'mean_deviation' and 'rms_deviation', the distance from the trajectory points to the
+        true centreline; 'outside_points' and 'outside_fraction', the points farther from the centreline
+        than the half width of the track, and 'max_outside_distance', how far outside the worst one is.
+        NaN trajectory points count as outside of the corridor and infinitely far from everything, so a single
+        one makes the deviations infinite: 'nonfinite_points' counts them, and 'finite_rms_deviation' is the
+        RMS deviation of the other points (NaN if there are none).
+    """
+    # Converted once, converting lists of points is a good part of the cost
+    mid_points = np.asarray(mid_points, dtype=float).reshape(-1, 2)
+    og_right_points = np.asarray(og_right_points, dtype=float).reshape(-1, 2)
+    og_left_points = np.asarray(og_left_points, dtype=float).reshape(-1, 2)
+    cones = np.concatenate([og_right_points, og_left_points])
+    centreline, half_widths = build_centreline(og_right_points, og_left_points)
+
+    deviations, widths = centreline_deviations(mid_points, centreline, half_widths)
+    # The cones have no length to choose the cell size from, but they are spaced like the centreline vertices
+    centreline_cell = 2 * float(np.median(np.sqrt((np.diff(centreline, axis=0) ** 2).sum(axis=1)))) if len(centreline) > 1 else 0
+    clearances = cone_clearances(mid_points, cones, SegmentGrid(cones, cell_size=centreline_cell or None))
+    outside = np.maximum(deviations - widths, 0.0)
+    # NaN points are at an infinite distance, so they also count as outside
+    outside_mask = outside > 0
+
+    n = len(mid_points)
+    finite = np.isfinite(deviations)
+    finite_deviations = deviations[finite]
+    return {
+        'points': n,
+        'path_length': path_length(mid_points),
+        'min_cone_clearance': float(clearances.min()) if n else float('inf'),
+        'mean_cone_clearance': float(clearances.mean()) if n else float('inf'),
+        'max_deviation': float(deviations.max()) if n else 0.0,
+        'mean_deviation': float(deviations.mean()) if n else 0.0,
+        'rms_deviation': float(np.sqrt((deviations ** 2).mean())) if n else 0.0,
+        'finite_rms_deviation': float(np.sqrt((finite_deviations ** 2).mean())) if len(finite_deviations) else (float('nan') if n else 0.0),
+        'nonfinite_points': int(n - finite.sum()),
+        'outside_points': int(outside_mask.sum()),
+        'outside_fraction': float(outside_mask.mean()) if n else 0.0,
+        'max_outside_distance': float(outside.max()) if n else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import clean_trajectory_generator as ctg
+
+    parser = argparse.ArgumentParser(description="Computes the quality metrics of the trajectory of a map.")
+    parser.add_argument('map', help="Map file with the original cones, ordered along the track")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    args = parser.parse_args()
+
+    og_right_points, og_left_points = ctg.deserialize_points(file_path=args.map)
+    if og_right_points is None:
+        raise SystemExit(1)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        mid_points = ctg.compute_trajectory(og_right_points, og_left_points, args.semiplane)
+
+    start = time.perf_counter()
+    metrics = compute_metrics(mid_points, og_right_points, og_left_points)
+    elapsed = time.perf_counter() - start
+    for key, value in metrics.items():
+        print(f"{key}: {value}")
+    print(f"Computed in {elapsed * 1e3:.2f} ms")
@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+
+
+# SMOOTHING AND ARC LENGTH RESAMPLING OF TRAJECTORIES -----------------------------------------------
+#
+# The trajectory points given by compute_trajectory are irregularly spaced (the <2m merge step leaves gaps of
+# different lengths) and follow the noise of the cones. smooth_trajectory turns them into points at a fixed
+# arc length step, optionally with the curvature at each of them, for the controller.
+#
+#   1. The polyline is resampled by arc length on a fine uniform grid (about step / OVERSAMPLING) with np.interp.
+#   2. That grid is smoothed with a Whittaker smoother, the discrete version of a cubic smoothing spline: it
+#      minimises |z - y|² + s |D² z|², where D² are the second differences. With a uniform grid the solution is
+#      a filter 1 / (1 + s (2 - 2 cos ω)²) applied in the frequency domain, so it is computed with one real FFT
+#      instead of a banded solve. Closed laps (first point equal to the last one) are periodic already. Open
+#      trajectories have the straight line between their ends subtracted and are then extended by point
+#      reflection into a periodic signal, which keeps their end points and has no jump for the FFT to ring on.
+#   3. The smoothed curve is resampled again by its own arc length at exactly `step`.
+#
+# The smoothing is given as a length: details shorter than it (the zigzag between consecutive cones) are
+# removed, and longer ones (the corners of the track) are kept. Everything is vectorised, with no Python loop
+# over the points, so a trajectory of 10 km is smoothed and resampled every 0.5 m in a few tens of milliseconds.
+
+DEFAULT_STEP = 0.5              # Distance between the resampled points, in meters
+DEFAULT_SMOOTHING_LENGTH = 8.0  # Wavelength that is attenuated by half, in meters
+OVERSAMPLING = 2                # The smoothing grid is this many times denser than the output
+
+
+def arc_lengths(points):
+    """Returns the cumulative arc length at each point of a polyline, starting at 0."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    lengths = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    return np.concatenate([[0.0], np.cumsum(lengths)])
+
+
+def resample(points, step=DEFAULT_STEP, closed=False):
+    """Resamples a polyline at a fixed arc length step with linear interpolation.
+
+    Args:
+        points (list): The points of the polyline.
+        step (float, optional): Distance along the polyline between consecutive points. Defaults to DEFAULT_STEP.
+        closed (bool, optional): If True the polyline is a closed loop whose last point is its first point, and
+            the points are spread evenly over it (the step is adjusted so the loop is split into equal parts).
+
+    Returns:
+        array: The resampled points, shape (m, 2). The first and last points are kept, so the last step of an
+        open polyline can be shorter.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(points):
+        return points.copy()
+    # Repeated points have no direction and would divide by zero in np.interp
+    keep = np.concatenate([[True], (np.diff(points, axis=0) != 0).any(axis=1)])
+    points = points[keep]
+    s = arc_lengths(points)
+    if len(points) < 2 or s[-1] == 0:
+        return points.copy()
+    if closed:
+        samples = np.linspace(0.0, s[-1], max(int(np.ceil(s[-1] / step)), 3) + 1)
+    else:
+        samples = np.append(np.arange(0.0, s[-1], step), s[-1])
+        if len(samples) > 2 and s[-1] - samples[-2] < 1e-9 * step:
+            samples = np.delete(samples, -2)
+    return np.column_stack([np.interp(samples, s, points[:, 0]), np.interp(samples, s, points[:, 1])])
+
+
+def whittaker_smooth(values, smoothing, closed=False):
+    """Smooths uniformly spaced samples with a Whittaker smoother (penalty on the second differences).
+
+    Args:
+        values (array): Samples of shape (n,) or (n, k), smoothed along the first axis.
+        smoothing (float): The penalty s, in samples: the wavelength attenuated by half is 2π s^(1/4) samples.
+        closed (bool, optional): If True the samples are periodic (the first one follows the last one).
+            Otherwise the first and last samples are kept. Defaults to False.
+
+    Returns:
+        array: The smoothed samples, with the same shape.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if smoothing <= 0 or n < 3:
+        return values.copy()
+    if closed:
+        trend = 0.0
+        extended = values
+    else:
+        # Without the line between the ends, both ends are 0 and the point reflection is a smooth periodic signal
+        ramp = np.linspace(0.0, 1.0, n).reshape((n,) + (1,) * (values.ndim - 1))
+        trend = values[0] + ramp * (values[-1] - values[0])
+        detrended = values - trend
+        extended = np.concatenate([detrended, -detrended[-2:0:-1]])
+    m = len(extended)
+    frequencies = np.arange(m // 2 + 1)
+    response = 1.0 / (1.0 + smoothing * (2.0 - 2.0 * np.cos(2 * np.pi * frequencies / m)) ** 2)
+    # The FFT is several times faster over contiguous rows than over the columns of an (n, 2) array
+    rows = np.ascontiguousarray(np.moveaxis(extended, 0, -1))
+    smoothed = np.fft.irfft(np.fft.rfft(rows) * response, n=m)
+    return np.moveaxis(smoothed, -1, 0)[:n] + trend
+
+
+def _fast_length(n):
+    """Returns the smallest number of the form 2^a 3^b 5^c that is at least n, a fast size for the FFT."""
+    best = 2 * max(n, 1)
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35
+            while length < n:
+                length *= 2
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def curvatures(points, closed=False):
+    """Returns the signed curvature (positive when turning left) at each point of a uniformly resampled curve.
+
+    The derivatives are central differences with respect to the arc length, and one-sided at the ends of an
+    open curve. For a closed curve the last point must be the first one, and both get the same value.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 3:
+        return np.zeros(len(points))
+    if closed:
+        loop = points[:-1]
+        forward, backward = np.roll(loop, -1, axis=0) - loop, loop - np.roll(loop, 1, axis=0)
+    else:
+        loop = points
+        steps = np.diff(points, axis=0)
+        forward = np.concatenate([steps, steps[-1:]])
+        backward = np.concatenate([steps[:1], steps])
+    h_forward = np.sqrt((forward ** 2).sum(axis=1))
+    h_backward = np.sqrt((backward ** 2).sum(axis=1))
+    # First and second derivatives of a parabola through the 3 points, per unit of arc length
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first = (forward / h_forward[:, None] + backward / h_backward[:, None]) / 2
+        second = 2 * (forward / h_forward[:, None] - backward / h_backward[:, None]) / (h_forward + h_backward)[:, None]
+        kappa = (first[:, 0] * second[:, 1] - first[:, 1] * second[:, 0]) / (first ** 2).sum(axis=1) ** 1.5
+    kappa = np.nan_to_num(kappa, nan=0.0, posinf=0.0, neginf=0.0)
+    if not closed:
+        # One-sided differences at the ends are not better than copying the neighbour value
+        kappa[0], kappa[-1] = kappa[1], kappa[-2]
+        return kappa
+    return np.append(kappa, kappa[0])
+
+
+def smooth_trajectory(mid_points, step=DEFAULT_STEP, smoothing_length=DEFAULT_SMOOTHING_LENGTH, closed=None, curvature=False):
+    """Smooths a trajectory and resamples it at a fixed arc length step (see the description above).
+
+    Args:
+        mid_points (list): The trajectory given by compute_trajectory (or a lap of LapPlanner).
+        step (float, optional): Distance between the output points, in meters. Defaults to DEFAULT_STEP.
+        smoothing_length (float, optional): Wavelength, in meters, attenuated by half. 0 only resamples the
+            polyline. Defaults to DEFAULT_SMOOTHING_LENGTH.
+        closed (bool, optional): If the trajectory is a closed lap. Defaults to None, which checks if its first and
+            last points are equal.
+        curvature (bool, optional): If True, the curvature at each output point is returned too. Defaults to False.
+
+    Returns:
+        array: The points, shape (m, 2), or a tuple with the points and the curvatures, shape (m,), if curvature is True.
+        An empty trajectory gives an empty array of shape (0, 2).
+
+    Raises:
+        ValueError: If step is not positive or the trajectory has NaN or infinite points.
+    """
+    if not step > 0:
+        raise ValueError(f"step must be positive, got {step}")
+    points = np.asarray(mid_points, dtype=float).reshape(-1, 2)
+    if not np.isfinite(points).all():
+        raise ValueError("The trajectory has NaN or infinite points")
+    if closed is None:
+        closed = len(points) > 2 and bool((points[0] == points[-1]).all())
+
+    if smoothing_length > 0:
+        # Fine uniform grid, with a number of intervals that makes a fast FFT (the FFT of an open trajectory has twice as many samples)
+        length = arc_lengths(points)[-1]
+        intervals = _fast_length(int(np.ceil(length * OVERSAMPLING / step)))
+        fine = resample(points, length / intervals if length else step, closed=True)
+    else:
+        fine = resample(points, step / OVERSAMPLING, closed)
+    if smoothing_length > 0 and len(fine) > 2:
+        # Closed loops drop the repeated last point for the periodic filter
+        spacing = arc_lengths(fine)[-1] / (len(fine) - 1)
+        penalty = (smoothing_length / (2 * np.pi * spacing)) ** 4
+        if closed:
+            fine = whittaker_smooth(fine[:-1], penalty, closed=True)
+            fine = np.concatenate([fine, fine[:1]])
+        else:
+            fine = whittaker_smooth(fine, penalty)
+    result = resample(fine, step, closed)
+    if curvature:
+        return result, curvatures(result, closed)
+    return result
+
+
+if __name__ == "__main__":
+    import clean_trajectory_generator as ctg
+
+    parser = argparse.ArgumentParser(description="Smooths the trajectory of a map and resamples it at a fixed step.")
+    parser.add_argument('map', help="Map file")
+    parser.add_argument('--semiplane', type=int, default=-1, choices=(-1, 1))
+    parser.add_argument('--step', type=float, default=DEFAULT_STEP, help="Distance between the output points, in meters")
+    parser.add_argument('--smoothing-length', type=float, default=DEFAULT_SMOOTHING_LENGTH,
+                        help="Details shorter than this, in meters, are smoothed out. 0 disables the smoothing")
+    parser.add_argument('--output', help="Write the resampled trajectory to this file")
+    args = parser.parse_args()
+
+    right_points, left_points = ctg.deserialize_points(file_path=args.map)
+    if right_points is None:
+        raise SystemExit(1)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        mid_points = ctg.compute_trajectory(right_points, left_points, args.semiplane)
+
+    start = time.perf_counter()
+    points, kappa = smooth_trajectory(mid_points, args.step, args.smoothing_length, curvature=True)
+    elapsed = time.perf_counter() - start
+    print(f"{len(mid_points)} trajectory points resampled into {len(points)} points in {elapsed * 1e3:.2f} ms")
+    print(f"Length: {arc_lengths(mid_points)[-1]:.2f} m raw, {arc_lengths(points)[-1]:.2f} m smoothed")
+    print(f"Max |curvature|: {np.abs(kappa).max():.4f} 1/m")
+    if args.output:
+        ctg.serialize_trajectory(args.output, points.tolist())
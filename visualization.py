@@ -0,0 +1,372 @@
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+# PLOTTING OF MAPS, STEPS AND TRAJECTORIES ---------------------------------------------------------
+#
+# Importing matplotlib.pyplot takes around half a second, more than planning a whole map, and headless users
+# (plan_maps.py, planning_service.py, the benchmarks) never plot anything. Everything that plots lives in this
+# module, and the planning and generation modules only import it when something is actually plotted:
+#
+#   * clean_trajectory_generator.StepPlotter and plot_trajectory_and_cones (and the same names of
+#     draft_trajectory_generator.py) still work, they are loaded from here on first use.
+#   * point_gen.gen_map and gen_circular_map import it only when plot is True.
+#
+# benchmark_startup.py checks that the planning modules can still be imported without matplotlib.
+
+
+class StepPlotter:
+    """Observer for compute_trajectory that plots every step of the computation.
+
+    Each step receives a dictionary with the following keys:
+        rpoints, lpoints (list): The ordered right and left cones.
+        mid_points (list): The trajectory computed so far. It is the list being built, so it must not be modified.
+        last_ri, last_li (int): Indexes of the last right and left cones considered.
+        right (bool): True if the step advanced on the right side, False if it advanced on the left side.
+        anchor_slope (list): The previous cone on the side that advanced.
+        last_cone (list): The cone the step advanced to.
+        new_point (list): The trajectory point computed in the step.
+        rotated (bool): True if the new point was rotated 180º respect to the last cone.
+        merged (bool): True if the last 2 trajectory points were too close and were replaced by their average.
+
+    The steps of compute_trajectory2_wsteps_circ (draft_trajectory_generator.py) can also have a 'rotation_circles'
+    tuple (centre, cone radius, point radius, point before the rotation) with the circles that made it rotate the
+    point, which are drawn too.
+
+    Args:
+        pause (float, optional): Seconds to wait after drawing each step. If None, it waits for a key or mouse press instead. Defaults to 0.5.
+    """
+
+    def __init__(self, pause=0.5):
+        self.pause = pause
+
+    def __call__(self, step):
+        lpoints = step['lpoints']
+        rpoints = step['rpoints']
+        mid_points = step['mid_points']
+        anchor_slope = step['anchor_slope']
+        last_cone = step['last_cone']
+        new_point = step['new_point']
+
+        plt.clf()
+        if step.get('rotation_circles') is not None:
+            centre, cone_radius, point_radius, point_before_rotation = step['rotation_circles']
+            plt.gca().add_patch(plt.Circle(centre, cone_radius, color='black', fill=False))
+            plt.gca().add_patch(plt.Circle(centre, point_radius, color='red', fill=False))
+            plt.scatter([point_before_rotation[0]], [point_before_rotation[1]], c='k')
+        plt.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', label='Left cones')
+        plt.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', label='Right cones')
+        plt.scatter([p[0] for p in mid_points], [p[1] for p in mid_points], c='g', label='Mid points')
+        plt.plot([anchor_slope[0], last_cone[0]], [anchor_slope[1], last_cone[1]], c='k', linestyle='--', label='Last segment')
+        plt.plot([last_cone[0], new_point[0]], [last_cone[1], new_point[1]], c='r', label='Perpendicular line')
+        if len(mid_points) >= 2:
+            plt.plot([mid_points[-2][0], new_point[0]], [mid_points[-2][1], new_point[1]], c='k')
+        plt.legend()
+        if self.pause is None:
+            plt.waitforbuttonpress()
+        else:
+            plt.pause(self.pause)
+
+    def show(self):
+        """Keeps the last step on screen until the window is closed."""
+        plt.show()
+
+
+# LEVEL OF DETAIL FOR LARGE MAPS -------------------------------------------------------------------
+#
+# A procedural map can have hundreds of thousands of cones, and scattering all of them takes minutes and gives
+# a solid blob. plot_trajectory_and_cones works on arrays instead:
+#
+#   * The undetected cones are found with a set of the detected ones, instead of a list membership test per cone.
+#   * With a viewport, the points outside of it are dropped before plotting. The trajectory keeps the points
+#     next to the border so its lines still reach it, and it is cut where it leaves the viewport.
+#   * Layers with more than max_points points are decimated: the cones keep one point per cell of a
+#     LOD_GRID x LOD_GRID grid over the plotted area, which is finer than the pixels of the image, and the
+#     trajectory keeps one of every few points. Their markers are drawn smaller and rasterized.
+#
+# Maps under max_points points per layer are plotted as before.
+
+LOD_MAX_POINTS = 20000  # Points of a layer above which it is decimated
+LOD_GRID = 1024         # Cells per side of the decimation grid of the cones
+
+
+def _as_array(points):
+    """Returns the points as a float array of shape (n, 2), without the empty points some drafts leave."""
+    if isinstance(points, list):
+        points = [point for point in points if len(point)]
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+
+def _undetected_points(og_points, detected_points):
+    """Returns the original points that are not among the detected points, with a set instead of a list search."""
+    detected = set(map(tuple, detected_points.tolist()))
+    keep = np.fromiter((point not in detected for point in map(tuple, og_points.tolist())), dtype=bool, count=len(og_points))
+    return og_points[keep]
+
+
+def _in_viewport(points, viewport):
+    xmin, xmax, ymin, ymax = viewport
+    return (points[:, 0] >= xmin) & (points[:, 0] <= xmax) & (points[:, 1] >= ymin) & (points[:, 1] <= ymax)
+
+
+def _decimate_points(points, extent, max_points, grid=LOD_GRID):
+    """Keeps the first point of every cell of a grid x grid grid over extent, and one of every few if there are still too many."""
+    points = points[np.isfinite(points).all(axis=1)]
+    if len(points) <= max_points:
+        return points
+    xmin, xmax, ymin, ymax = extent
+    cx = np.clip(((points[:, 0] - xmin) / ((xmax - xmin) or 1.0) * grid).astype(np.int64), 0, grid - 1)
+    cy = np.clip(((points[:, 1] - ymin) / ((ymax - ymin) or 1.0) * grid).astype(np.int64), 0, grid - 1)
+    _, first = np.unique(cx * grid + cy, return_index=True)
+    points = points[np.sort(first)]
+    if len(points) > max_points:
+        points = points[::-(-len(points) // max_points)]
+    return points
+
+
+def _trajectory_polyline(points, viewport, max_points):
+    """Returns the trajectory to plot: culled to the viewport, decimated, and with NaN rows where it is cut."""
+    indexes = np.arange(len(points))
+    if viewport is not None:
+        inside = _in_viewport(points, viewport)
+        # The neighbours of the points inside keep the lines that cross the border of the viewport
+        near = inside.copy()
+        near[1:] |= inside[:-1]
+        near[:-1] |= inside[1:]
+        indexes = indexes[near]
+    if not len(indexes):
+        return points[:0]
+    # Number of cuts of the culled trajectory up to each of its points
+    cut_counts = np.concatenate([[0], np.cumsum(np.diff(indexes) > 1)])
+    kept = np.arange(0, len(indexes), max(-(-len(indexes) // max_points), 1))
+    if kept[-1] != len(indexes) - 1:
+        kept = np.append(kept, len(indexes) - 1)
+    # The line is cut between kept points with a cut of the culled trajectory between them
+    cuts = np.flatnonzero(np.diff(cut_counts[kept])) + 1
+    indexes = indexes[kept]
+    return np.insert(points[indexes], cuts, np.nan, axis=0)
+
+
+def plot_trajectory_and_cones(mid_points, right_points, left_points, og_right_points, og_left_points,
+                              viewport=None, max_points=LOD_MAX_POINTS, output=None):
+    """Plots the trajectory, detected cones, and undetected cones.
+
+    Large maps are culled to the viewport and decimated (see the description above).
+
+    Args:
+        mid_points (list): List of midpoints of the trajectory.
+        right_points (list): List of detected right cones.
+        left_points (list): List of detected left cones.
+        og_right_points (list): List of original right cones.
+        og_left_points (list): List of original left cones.
+        viewport (tuple, optional): (xmin, xmax, ymin, ymax) of the area to plot. Defaults to None, the whole map.
+        max_points (int, optional): Points of a layer above which it is decimated. Defaults to LOD_MAX_POINTS.
+        output (str, optional): Image file the plot is saved to instead of being shown. Defaults to None.
+    """
+    trajectory = _as_array(mid_points)
+    detected = np.concatenate([_as_array(right_points), _as_array(left_points)])
+    undetected = _undetected_points(np.concatenate([_as_array(og_right_points), _as_array(og_left_points)]), detected)
+    if viewport is not None:
+        detected = detected[_in_viewport(detected, viewport)]
+        undetected = undetected[_in_viewport(undetected, viewport)]
+        extent = viewport
+    else:
+        finite = np.concatenate([trajectory, detected, undetected])
+        finite = finite[np.isfinite(finite).all(axis=1)]
+        extent = (finite[:, 0].min(), finite[:, 0].max(), finite[:, 1].min(), finite[:, 1].max()) if len(finite) else (0, 1, 0, 1)
+    line = _trajectory_polyline(trajectory, viewport, max_points)
+    large = max(len(line), len(detected), len(undetected)) > max_points
+    # Small markers for large maps, the default ones otherwise
+    marker = {'s': 2, 'rasterized': True} if large else {}
+
+    # Plot mid_points as a black line
+    plt.plot(line[:, 0], line[:, 1], 'k-', label='Trajectory')
+
+    # Plot midpoints as green scatter points
+    points = line[np.isfinite(line).all(axis=1)]
+    plt.scatter(points[:, 0], points[:, 1], c='g', label='Midpoints', **marker)
+
+    # Plot right_points and left_points in red
+    points = _decimate_points(detected, extent, max_points)
+    plt.scatter(points[:, 0], points[:, 1], c='r', label='Detected cones', **marker)
+
+    # Plot undetected cones in blue
+    if len(undetected):
+        points = _decimate_points(undetected, extent, max_points)
+        plt.scatter(points[:, 0], points[:, 1], c='b', label='Undetected cones', **marker)
+
+    plt.legend()
+    if viewport is not None:
+        plt.gca().set_aspect('equal', adjustable='box')
+        plt.xlim(viewport[0], viewport[1])
+        plt.ylim(viewport[2], viewport[3])
+    else:
+        plt.axis('equal')
+    if output is not None:
+        plt.savefig(output)
+        plt.close()
+    else:
+        plt.show()
+
+
+def plot_map(right_points, left_points, title='Map Points'):
+    """Plots the cones of a map, the right ones in yellow and the left ones in blue (see point_gen.py).
+
+    Args:
+        right_points (list): The right cones.
+        left_points (list): The left cones.
+        title (str, optional): Title of the plot. Defaults to 'Map Points'.
+    """
+    if len(right_points):
+        x, y = zip(*right_points)
+        plt.scatter(x, y, color='yellow', label='Right Points')
+    if len(left_points):
+        x, y = zip(*left_points)
+        plt.scatter(x, y, color='blue', label='Left Points')
+
+    plt.xlabel('X')
+    plt.ylabel('Y')
+    plt.title(title)
+    plt.grid(True)
+    plt.axis('equal')
+    plt.legend()
+    plt.show()
+
+
+# OFFLINE RENDERING OF RECORDED STEPS --------------------------------------------------------------
+#
+# Renders the frames of frame_recorder.FrameRecorder on an Agg canvas, independent of the pyplot backend, so it
+# works in a background process without a display. The cones only change when the planner receives new ones,
+# so they are drawn into a background once per cone snapshot, and every frame restores that background and
+# draws only its animated artists on top, instead of drawing the whole figure again.
+
+def _animation_writer(path, fps, size):
+    """Returns (write, close) functions that write RGBA frames of the given size to a GIF (Pillow) or MP4 (ffmpeg)."""
+    width, height = size
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension == 'gif':
+        from PIL import Image
+
+        images = []
+
+        def write(rgba):
+            # Palette frames without dithering keep the GIF small and the flat colours of the plot intact
+            images.append(Image.frombuffer('RGBA', size, rgba, 'raw', 'RGBA', 0, 1).convert('RGB')
+                          .quantize(colors=64, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE))
+
+        def close():
+            if images:
+                images[0].save(path, save_all=True, append_images=images[1:], duration=round(1000 / fps), loop=0)
+        return write, close
+
+    if extension == 'mp4':
+        import shutil
+        import subprocess
+
+        ffmpeg = shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg is needed to write MP4 files, install it or write a GIF file instead")
+        process = subprocess.Popen([ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                                    '-s', f"{width}x{height}", '-r', str(fps), '-i', '-',
+                                    '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', path], stdin=subprocess.PIPE)
+
+        def close():
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed writing {path}")
+        return process.stdin.write, close
+
+    raise ValueError(f"Unsupported animation format {path}, use a .gif or .mp4 file")
+
+
+def render_frames(frames, trajectories, cones, path, fps=10, size=(800, 600)):
+    """Renders recorded planning steps to a GIF or MP4 file (see frame_recorder.py).
+
+    Args:
+        frames (list): The frame_recorder.Frame of every step to render.
+        trajectories (iterable): The full trajectory of every frame (see frame_recorder.iter_trajectories).
+        cones (list): The cone snapshots (right cones, left cones) the frames refer to.
+        path (str): Output file, .gif or .mp4. MP4 files need ffmpeg.
+        fps (float, optional): Frames per second. Defaults to 10.
+        size (tuple, optional): Width and height in pixels. MP4 files need even sizes. Defaults to (800, 600).
+
+    Returns:
+        int: The number of rendered frames.
+
+    Raises:
+        ValueError: If the extension of path is not .gif nor .mp4.
+        RuntimeError: If ffmpeg is not installed or fails writing an MP4 file.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle
+
+    write, close = _animation_writer(path, fps, size)
+    dpi = 100
+    figure = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    # Fixed limits that fit every cone and trajectory point, so the background stays valid
+    xs = [p[0] for rpoints, lpoints in cones for p in rpoints + lpoints] + [p[0] for frame in frames for p in frame.tail]
+    ys = [p[1] for rpoints, lpoints in cones for p in rpoints + lpoints] + [p[1] for frame in frames for p in frame.tail]
+    xs = [x for x in xs if x == x] or [0.0]
+    ys = [y for y in ys if y == y] or [0.0]
+    margin = max(max(xs) - min(xs), max(ys) - min(ys), 1.0) * 0.05
+    ax.set_xlim(min(xs) - margin, max(xs) + margin)
+    ax.set_ylim(min(ys) - margin, max(ys) + margin)
+    ax.set_aspect('equal', adjustable='box')
+
+    trajectory_line, = ax.plot([], [], 'k-', animated=True)
+    mid_points_markers, = ax.plot([], [], 'go', markersize=3, animated=True, label='Mid points')
+    segment_line, = ax.plot([], [], 'k--', animated=True, label='Last segment')
+    perpendicular_line, = ax.plot([], [], 'r-', animated=True, label='Perpendicular line')
+    cone_circle = Circle((0, 0), 0, color='black', fill=False, animated=True)
+    point_circle = Circle((0, 0), 0, color='red', fill=False, animated=True)
+    ax.add_patch(cone_circle)
+    ax.add_patch(point_circle)
+    step_text = ax.text(0.01, 0.99, '', transform=ax.transAxes, va='top', animated=True)
+    animated = (trajectory_line, mid_points_markers, segment_line, perpendicular_line, cone_circle, point_circle, step_text)
+    cone_artists = []
+
+    background = None
+    background_cones = None
+    count = 0
+    try:
+        for count, (frame, trajectory) in enumerate(zip(frames, trajectories), 1):
+            if frame.cones != background_cones:
+                for artist in cone_artists:
+                    artist.remove()
+                rpoints, lpoints = cones[frame.cones]
+                cone_artists = [ax.scatter([p[0] for p in lpoints], [p[1] for p in lpoints], c='b', s=12, label='Left cones'),
+                                ax.scatter([p[0] for p in rpoints], [p[1] for p in rpoints], c='yellow', s=12, label='Right cones')]
+                ax.legend(handles=cone_artists + [mid_points_markers, segment_line, perpendicular_line], loc='lower right')
+                canvas.draw()
+                background = canvas.copy_from_bbox(figure.bbox)
+                background_cones = frame.cones
+            canvas.restore_region(background)
+
+            x = [p[0] for p in trajectory]
+            y = [p[1] for p in trajectory]
+            trajectory_line.set_data(x, y)
+            mid_points_markers.set_data(x, y)
+            segment_line.set_data([frame.anchor_slope[0], frame.last_cone[0]], [frame.anchor_slope[1], frame.last_cone[1]])
+            perpendicular_line.set_data([frame.last_cone[0], frame.new_point[0]], [frame.last_cone[1], frame.new_point[1]])
+            circles = frame.rotation_circles
+            cone_circle.set_visible(circles is not None)
+            point_circle.set_visible(circles is not None)
+            if circles is not None:
+                cone_circle.set_center(circles[0])
+                cone_circle.set_radius(circles[1])
+                point_circle.set_center(circles[0])
+                point_circle.set_radius(circles[2])
+            events = [name for name, happened in (('rotated', frame.rotated), ('merged', frame.merged)) if happened]
+            step_text.set_text(f"Frame {count}, {frame.length} points {' '.join(events)}")
+            for artist in animated:
+                ax.draw_artist(artist)
+            canvas.blit(figure.bbox)
+            write(bytes(canvas.buffer_rgba()))
+    finally:
+        close()
+    return count